@@ -0,0 +1,833 @@
+#!/usr/bin/env python
+#
+# Hook dispatcher for the solr-jetty charm. Every hook is a symlink to this
+# file so that each hook runs in a single interpreter, with the charm config
+# loaded once and shared by everything the hook does.
+#
+
+import base64
+import os
+import sys
+import time
+
+import lib._pythonpath
+_ = lib._pythonpath
+
+from charmhelpers.core import hookenv
+from charmhelpers.core import host
+from charmhelpers.payload import execd
+
+import lib.utils as utils
+import lib.advertise as advertise
+import lib.cache_tier as cache_tier
+import lib.capacity as capacity
+import lib.ceph_utils as ceph
+import lib.compression as compression
+import lib.data_layout as data_layout
+import lib.diskstats as diskstats
+import lib.jetty as jetty
+import lib.jmx as jmx
+import lib.mount_volume as mount
+import lib.overload as overload
+import lib.profiler as profiler
+import lib.ramdisk as ramdisk
+import lib.request_log as request_log
+import lib.rolling_restart as rolling_restart
+import lib.routing as routing
+import lib.seeding as seeding
+import lib.storage_profile as storage_profile
+
+PACKAGES = ['solr-jetty', 'default-jdk', 'curl', 'python-shelltoolbox']
+
+NRPE_CHECK_FILE = '/etc/nagios/nrpe.d/check_solr_jetty_{instance_type}.cfg'
+NRPE_EXPORT_DIR = '/var/lib/nagios/export'
+NRPE_EXPORT_FILE = ('service__{hostname}_check_solr_jetty_'
+                    '{instance_type}.cfg')
+NRPE_CHECK = """# Solr Jetty {instance_type}
+command[check_solr_jetty_{instance_type}]=/usr/lib/nagios/plugins/check_http \
+-I 127.0.0.1 -p {port} -e ' 200 OK' --url='{check_url}' \
+--regex='{check_regex}'
+"""
+NRPE_DISK_CHECK = """command[{disk_check}]={diskstats} \
+--check --window 300 --await-ms {disk_await_ms} --util {disk_util}
+"""
+NRPE_EXPORT = """define service {{
+    use                             active-service
+    host_name                       {hostname}
+    service_description             {hostname} {instance_type} Solr Jetty
+    check_command                   check_nrpe!check_solr_jetty_{instance_type}
+    servicegroups                   {service_group},
+}}
+"""
+NRPE_DISK_EXPORT = """define service {{
+    use                             active-service
+    host_name                       {hostname}
+    service_description             {hostname} {instance_type} Solr disk I/O
+    check_command                   check_nrpe!{disk_check}
+    servicegroups                   {service_group},
+}}
+"""
+
+hooks = hookenv.Hooks()
+
+
+@hookenv.cached
+def hook_context():
+    '''Settings shared by every hook, derived once from the charm config'''
+    config = hookenv.config()
+    unit_name = hookenv.local_unit()
+    service_name, unit_id = unit_name.split('/')
+    max_heap = config.get('java-max-heap-mb') or jetty.default_heap_mb()
+    # Set min heap equal to max heap. Takes longer to start but all memory
+    # is allocated up front
+    min_heap = config.get('java-min-heap-mb') or max_heap
+    return {
+        'service_name': service_name,
+        'unit_id': unit_id,
+        'volume_mountpoint': '/srv/juju/volumes/{}-{}'.format(service_name,
+                                                              unit_id),
+        'acceptors': config.get('acceptors') or jetty.DEFAULT_ACCEPTORS,
+        'min_heap': min_heap,
+        'max_heap': max_heap,
+        'ephemeral': config.get('volume-ephemeral') in (True, 'True', 'true'),
+    }
+
+
+@hooks.hook('install')
+def install():
+    execd.execd_run('charm-pre-install', die_on_error=True)
+    # default-jdk should be a prerequisite for jetty (Bug#1046732)
+    host.apt_install(PACKAGES, fatal=True)
+
+
+def check_config():
+    '''Exit with an error if the options cannot be applied together'''
+    config = hookenv.config()
+    intervals = ['rbd-snapshot-interval']
+    if not config['ramdisk-checkpoint-on-commit']:
+        intervals.append('ramdisk-checkpoint-interval')
+    for option in intervals:
+        if not config[option]:
+            continue
+        try:
+            utils.cron_schedule(config[option])
+        except ValueError as e:
+            hookenv.log('Invalid {}: {}'.format(option, e), hookenv.ERROR)
+            sys.exit(1)
+    if not jetty.valid_indexing_port(config['indexing-port']):
+        hookenv.log('Invalid indexing-port {}: it must be 0 or a port from '
+                    '1 to 65535 other than {}'.format(config['indexing-port'],
+                                                      jetty.JETTY_PORT),
+                    hookenv.ERROR)
+        sys.exit(1)
+    if config['min-threads'] > config['max-threads']:
+        hookenv.log('Invalid max-threads: it must be at least min-threads '
+                    '({})'.format(config['min-threads']), hookenv.ERROR)
+        sys.exit(1)
+    indexing_threads = jetty.indexing_connector(
+        config['indexing-port'],
+        config['indexing-max-threads'])['INDEXING-MAX-THREADS']
+    if indexing_threads < jetty.INDEXING_MIN_THREADS:
+        hookenv.log('Invalid indexing-max-threads: the indexing connector '
+                    'keeps {} threads ready, so it must be at least '
+                    'that'.format(jetty.INDEXING_MIN_THREADS), hookenv.ERROR)
+        sys.exit(1)
+    if not 0 <= config['diskstats-interval'] <= diskstats.RUN_SECONDS:
+        hookenv.log('Invalid diskstats-interval: samples are taken by a '
+                    'collector which runs for {} seconds every '
+                    'minute'.format(diskstats.RUN_SECONDS), hookenv.ERROR)
+        sys.exit(1)
+
+
+@hooks.hook('config-changed')
+def config_changed():
+    config = hookenv.config()
+    ctxt = hook_context()
+    check_config()
+
+    # Allow a custom solr schema to be installed
+    if config.get('schema'):
+        hookenv.log('Setting up new solr schema')
+        with open(jetty.SOLR_SCHEMA, 'w') as schema:
+            schema.write(base64.b64decode(config['schema']))
+
+    layout = configure_data_layout()
+    hookenv.log('Setting acceptors to {}'.format(ctxt['acceptors']))
+    jetty_xml = {'ACCEPTORS': ctxt['acceptors'],
+                 'ACCEPT-QUEUE-SIZE': config['accept-queue-size'],
+                 'MIN-THREADS': config['min-threads'],
+                 'MAX-THREADS': config['max-threads'],
+                 'MAX-IDLE-TIME': config['max-idle-time-ms'],
+                 'LOW-RESOURCES-CONNECTIONS':
+                 config['low-resources-connections'],
+                 'LOW-RESOURCES-MAX-IDLE': config['low-resources-max-idle-ms'],
+                 'GRACEFUL-SHUTDOWN': config['graceful-shutdown-ms']}
+    jetty_xml.update(configure_request_log(layout['logs']))
+    jetty_xml.update(configure_webdefault())
+    jetty_xml.update(jetty.indexing_connector(
+        config['indexing-port'], config['indexing-max-threads']))
+    jetty.render_template('jetty.xml.template', jetty.JETTY_XML, jetty_xml)
+
+    hookenv.log('Setting Java Min heap: {}'.format(ctxt['min_heap']))
+    hookenv.log('Setting Java Max heap: {}'.format(ctxt['max_heap']))
+    jetty.render_template('jetty-default.template', jetty.JETTY_DEFAULT,
+                          {'JAVA-MIN-HEAP': ctxt['min_heap'],
+                           'JAVA-MAX-HEAP': ctxt['max_heap'],
+                           'DATA-LAYOUT': ' '.join(data_layout.java_options(
+                               layout['logs'], layout['tlog'])),
+                           'LOGS-DIR': layout['logs'],
+                           'PLACEMENT-MOUNTS': ' '.join(layout['mounts'])})
+
+    configure_overload(layout['logs'])
+
+    # Restart jetty if it's already running, unless all that changed can
+    # be changed on the running JVM (keeping Solr's caches)
+    previous = jmx.load_config()
+    changes = jmx.changed(previous, config) if previous is not None else []
+    if jetty.running() and not (jmx.runtime_only(changes) and
+                                resize_jetty(changes)):
+        restart_jetty()
+
+    hookenv.open_port(jetty.JETTY_PORT)
+    configure_indexing_port(config['indexing-port'])
+
+    # If persistent storage is configured, mount and use it
+    if not ctxt['ephemeral']:
+        hookenv.log('Mounting persistent storage')
+        with profiler.timed('mount-volume'):
+            mount.mount()
+        storage_profile.apply(ctxt['volume_mountpoint'])
+
+    configure_ramdisk()
+    # Jetty is held back at boot until the volume is mounted, or the
+    # ramdisk restored
+    if not ctxt['ephemeral'] or config['ramdisk']:
+        if not jetty.running() and not jetty.start():
+            sys.exit(1)
+
+    diskstats.configure_collector(
+        os.path.join(hookenv.charm_dir(), 'scripts', 'diskstats.py'),
+        config.get('diskstats-interval'))
+
+    if hookenv.relation_ids('ceph'):
+        configure_capacity()
+        configure_seeding()
+
+    # If nrpe-external-master relation exists update it
+    if hookenv.relation_ids('nrpe-external-master'):
+        if os.path.isdir(NRPE_EXPORT_DIR):
+            update_nrpe_config()
+
+    advertise_unit()
+    jmx.save_config(config)
+
+
+@hooks.hook('start')
+def start():
+    if jetty.running():
+        hookenv.log('solr-jetty already started')
+    elif not jetty.start():
+        sys.exit(1)
+    advertise_unit()
+
+
+@hooks.hook('stop')
+def stop():
+    overload.configure_cron(None)
+    request_log.configure_cron(None)
+    cancel_restart()
+    reset_breaker()
+    withdraw_unit(advertise.STOPPED)
+    jetty.stop()
+    checkpoint_ramdisk()
+
+
+@hooks.hook('website-relation-joined', 'indexing-relation-joined')
+def frontend_relation_joined():
+    advertise_unit()
+
+
+@hooks.hook('cluster-relation-joined', 'cluster-relation-changed',
+            'cluster-relation-departed')
+def cluster_relation_changed():
+    publish_restart(rolling_restart.load_state())
+    rolling_restart_turn()
+
+
+@hooks.hook('nrpe-external-master-relation-changed')
+def update_nrpe_config():
+    config = hookenv.config()
+    templ_vars = {
+        'hostname': '{}-{}'.format(config.get('nagios_context'),
+                                   hookenv.local_unit().replace('/', '-')),
+        'instance_type': config.get('instance_type'),
+        'service_group': config.get('nagios_service_group'),
+        'check_url': config.get('check_url'),
+        'check_regex': config.get('check_regex'),
+        'port': jetty.JETTY_PORT,
+        'diskstats': os.path.join(hookenv.charm_dir(), 'scripts',
+                                  'diskstats.py'),
+        'disk_check': 'check_solr_jetty_disk_{}'.format(
+            config.get('instance_type')),
+        'disk_await_ms': config.get('nagios_disk_await_ms'),
+        'disk_util': config.get('nagios_disk_util'),
+    }
+    checks, exports = NRPE_CHECK, NRPE_EXPORT
+    # The disk check reads the samples the collector takes
+    if config.get('diskstats-interval'):
+        checks += NRPE_DISK_CHECK
+        exports += NRPE_DISK_EXPORT
+    with open(NRPE_CHECK_FILE.format(**templ_vars), 'w') as check:
+        check.write(checks.format(**templ_vars))
+    export_file = os.path.join(NRPE_EXPORT_DIR,
+                               NRPE_EXPORT_FILE.format(**templ_vars))
+    with open(export_file, 'w') as export:
+        export.write(exports.format(**templ_vars))
+    host.service_reload('nagios-nrpe-server')
+
+
+def rbd_layout():
+    '''RBD image layout options from the charm config'''
+    config = hookenv.config()
+    features = config.get('rbd-features') or ''
+    layout = {
+        'order': config.get('rbd-order'),
+        'stripe_unit': config.get('rbd-stripe-unit'),
+        'stripe_count': config.get('rbd-stripe-count'),
+        'features': [f.strip() for f in features.split(',') if f.strip()],
+    }
+    if not ceph.krbd_mappable(layout['order'], layout['stripe_unit'],
+                              layout['stripe_count']):
+        hookenv.log('The kernel RBD client cannot map an image striped over '
+                    'rbd-stripe-count={} objects with rbd-stripe-unit={}; '
+                    'leave both at 0'.format(layout['stripe_count'],
+                                             layout['stripe_unit']),
+                    hookenv.ERROR)
+        sys.exit(1)
+    return layout
+
+
+def configure_capacity():
+    '''Check the Ceph-backed volume for merge headroom from cron'''
+    config = hookenv.config()
+    command = os.path.join(hookenv.charm_dir(), 'scripts',
+                           'capacity-manager.py')
+    capacity.configure_cron(hookenv.local_unit(), command,
+                            enabled=config['capacity-auto-grow'] and
+                            not hook_context()['ephemeral'])
+
+
+def configure_seeding():
+    '''Take seed snapshots for replicas to clone from cron'''
+    config = hookenv.config()
+    command = os.path.join(hookenv.charm_dir(), 'scripts',
+                           'rbd-seed-snapshot.py')
+    minutes = config['rbd-snapshot-interval']
+    if config.get('rbd-clone-source') or hook_context()['ephemeral']:
+        minutes = 0
+    seeding.configure_cron(hookenv.local_unit(), command, minutes)
+
+
+def configure_data_layout():
+    '''Mount or create the directories holding the transaction log and the
+    logs, and point Solr's update log at its directory'''
+    config = hookenv.config()
+    unit = hookenv.local_unit()
+    layout = {'mounts': []}
+    for role in data_layout.ROLES:
+        target = (config.get('{}-device'.format(role)) or '').strip()
+        path = data_layout.directory(unit, role, target)
+        if target and data_layout.is_device(target):
+            with profiler.timed('mount-{}'.format(role)):
+                try:
+                    storage_profile.mount_device(target, path)
+                except Exception as e:
+                    hookenv.log('Could not mount {} for the {}: {}'.format(
+                        target, role, e), hookenv.ERROR)
+                    sys.exit(1)
+            layout['mounts'].append(path)
+        if path:
+            data_layout.prepare_dir(path)
+        layout[role] = path
+
+    if layout['tlog'] and os.path.exists(jetty.SOLR_CONFIG):
+        with open(jetty.SOLR_CONFIG) as solrconfig:
+            current = solrconfig.read()
+        wired, found = data_layout.wire_update_log(current)
+        if not found:
+            hookenv.log('This Solr has no <updateLog>, {} is not '
+                        'used'.format(layout['tlog']), hookenv.WARNING)
+        elif wired != current:
+            with open(jetty.SOLR_CONFIG, 'w') as solrconfig:
+                solrconfig.write(wired)
+    return layout
+
+
+def configure_request_log(logs_dir):
+    '''Process the request logs in logs_dir from cron; returns the
+    jetty.xml settings'''
+    config = hookenv.config()
+    enabled = config['request-log']
+    log_format = config['request-log-format']
+    if log_format not in request_log.FORMATS:
+        hookenv.log('Unknown request-log-format {}, using ncsa'.format(
+            log_format), hookenv.WARNING)
+        log_format = 'ncsa'
+    command = None
+    if enabled:
+        command = '{} --logs {} --format {} --sample-rate {} ' \
+            '--retention-days {}{}'.format(
+                os.path.join(hookenv.charm_dir(), 'scripts',
+                             'request-log.py'),
+                logs_dir, log_format, config['request-log-sample-rate'],
+                config['request-log-retention-days'],
+                '' if config['request-log-compress'] else ' --no-compress')
+    request_log.configure_cron(command)
+    return request_log.jetty_settings(enabled, log_format,
+                                      config['request-log-retention-days'])
+
+
+def configure_webdefault():
+    '''Admission control through Jetty's QoSFilter, and gzipped responses
+    through its GzipFilter, in the charm's copy of webdefault.xml; returns
+    the jetty.xml settings'''
+    config = hookenv.config()
+    qos = config['qos-max-search-requests'] or \
+        config['qos-max-update-requests']
+    enabled = qos or config['gzip']
+    if enabled and not os.path.exists(compression.WEBDEFAULT):
+        hookenv.log('{} is missing, not limiting or compressing '
+                    'requests'.format(compression.WEBDEFAULT), hookenv.ERROR)
+        enabled = False
+    if enabled:
+        with open(compression.WEBDEFAULT) as webdefault:
+            descriptor = webdefault.read()
+        # Filters run in the order they are added: rejecting comes first
+        descriptor = overload.with_qos(
+            descriptor, config['qos-max-search-requests'],
+            config['qos-max-update-requests'], config['qos-wait-ms'],
+            config['qos-suspend-ms'])
+        if config['gzip']:
+            descriptor = compression.with_filter(
+                descriptor, config['gzip-min-size'],
+                config['gzip-mime-types'])
+        with open(compression.CHARM_WEBDEFAULT, 'w') as webdefault:
+            webdefault.write(descriptor)
+    return {'WEBDEFAULT': compression.descriptor(enabled)}
+
+
+def configure_overload(logs_dir):
+    '''Default timeAllowed for searches, and the heap breaker (which counts
+    the QoS rejections in the request logs in logs_dir)'''
+    config = hookenv.config()
+    if os.path.exists(jetty.SOLR_CONFIG):
+        with open(jetty.SOLR_CONFIG) as solrconfig:
+            current = solrconfig.read()
+        limited = overload.with_time_allowed(current,
+                                             config['time-allowed-ms'])
+        if limited != current:
+            hookenv.log('Setting the timeAllowed of searches to {}'.format(
+                config['time-allowed-ms']))
+            with open(jetty.SOLR_CONFIG, 'w') as solrconfig:
+                solrconfig.write(limited)
+
+    # Runs without the breaker too, to count the QoS rejections
+    overload.configure_cron(
+        '{} --port {} --trip {} --reset {} --logs {}'.format(
+            os.path.join(hookenv.charm_dir(), 'scripts', 'overload.py'),
+            jetty.JETTY_PORT, config['heap-breaker-trip-percent'],
+            config['heap-breaker-reset-percent'], logs_dir))
+    if not config['heap-breaker-trip-percent']:
+        reset_breaker()
+
+
+def reset_breaker():
+    '''Accept connections again, wherever the breaker was left'''
+    state = overload.load_state()
+    if state.get('tripped'):
+        hookenv.log('Closing the heap breaker')
+        state['breaker_rejections'] += overload.close_breaker(
+            jetty.JETTY_PORT)
+        state['tripped'] = False
+        overload.save_state(state)
+
+
+def configure_indexing_port(port):
+    '''Open the port of the indexing connector (closing the one it
+    replaces) and advertise it to the feeders'''
+    if jetty.open_indexing_port(port):
+        publish_endpoints(advertise.load_state())
+
+
+def resize_jetty(options):
+    '''Apply the options to the running Jetty over JMX; returns whether
+    it worked'''
+    config = hookenv.config()
+    pid = overload.jvm_pid()
+    if pid is None:
+        return False
+    try:
+        changes = jmx.resize(pid, dict((option, config[option])
+                                       for option in options))
+    except jmx.JmxError as e:
+        hookenv.log('Could not resize Jetty over JMX, restarting it: '
+                    '{}'.format(e), hookenv.WARNING)
+        return False
+    for name, attribute, old, new in changes:
+        hookenv.log('Resized {} {} from {} to {}'.format(name, attribute,
+                                                         old, new))
+    return True
+
+
+def serving_ports():
+    '''Ports Jetty takes requests from the frontends on'''
+    ports = [jetty.JETTY_PORT]
+    if hookenv.config()['indexing-port']:
+        ports.append(hookenv.config()['indexing-port'])
+    return ports
+
+
+def publish_endpoints(state):
+    '''Tell the frontends on the website and indexing relations about the
+    unit in state'''
+    hostname = hookenv.unit_private_ip()
+    ports = {'website': jetty.JETTY_PORT,
+             'indexing': hookenv.config()['indexing-port'] or
+             jetty.JETTY_PORT}
+    services = {'website': query_routing(hostname)}
+    for relation, port in ports.items():
+        for relation_id in hookenv.relation_ids(relation):
+            hookenv.relation_set(relation_id, advertise.settings(
+                state, hostname, port, services.get(relation)))
+
+
+def query_routing(hostname):
+    '''The haproxy service definition routing queries for cache affinity,
+    or None for round-robin'''
+    config = hookenv.config()
+    mode = config['routing']
+    if mode not in routing.MODES:
+        hookenv.log('Unknown routing {}, using round-robin'.format(mode),
+                    hookenv.WARNING)
+        return None
+    if mode == 'round-robin':
+        return None
+    try:
+        return routing.services(
+            hookenv.local_unit().split('/')[0], hookenv.local_unit(),
+            hostname, jetty.JETTY_PORT,
+            hash_key=config['routing-hash-key'],
+            balance_factor=config['routing-balance-factor'],
+            check_path=jetty.READY_PATH)
+    except ValueError as e:
+        hookenv.log('{}, using round-robin'.format(e), hookenv.WARNING)
+        return None
+
+
+def advertise_unit():
+    '''Give the frontends the unit's address once Solr answers and has been
+    warmed up (unless it is draining)'''
+    state = advertise.load_state()
+    if state == advertise.DRAINING:
+        pass
+    elif not jetty.responding():
+        state = advertise.STARTING
+    elif state != advertise.READY:
+        with profiler.timed('warm-up'):
+            rolling_restart.warm_up(
+                hookenv.config()['restart-warmup-queries'], jetty.JETTY_PORT)
+        state = advertise.READY
+    hookenv.log('Advertising the unit as {}'.format(state))
+    advertise.save_state(state)
+    publish_endpoints(state)
+
+
+def withdraw_unit(state):
+    '''Take the unit out of the frontends, saying why'''
+    hookenv.log('Withdrawing the unit from the frontends ({})'.format(state))
+    advertise.save_state(state)
+    publish_endpoints(state)
+
+
+def peers():
+    return [unit for relation_id in hookenv.relation_ids('cluster')
+            for unit in hookenv.related_units(relation_id)]
+
+
+def restart_jetty():
+    '''Restart Jetty now if it has no peers or rolling restarts are off,
+    otherwise queue it to restart in turn with its peers'''
+    config = hookenv.config()
+    if not config['rolling-restart-max-down'] or not peers():
+        # Warmed up and advertised again once the hook is done
+        advertise.save_state(advertise.STARTING)
+        jetty.stop()
+        if not jetty.start():
+            sys.exit(1)
+        # A queued restart is overtaken: let the peers go on
+        cancel_restart()
+        return
+    state = rolling_restart.load_state()
+    if rolling_restart.pending(state):
+        hookenv.log('A rolling restart is already queued')
+        return
+    state['restart-request'] = rolling_restart.token()
+    rolling_restart.save_state(state)
+    hookenv.log('Queued a rolling restart ({})'.format(
+        state['restart-request']))
+    publish_restart(state)
+    rolling_restart.configure_cron(
+        hookenv.local_unit(),
+        os.path.join(hookenv.charm_dir(), 'scripts', 'rolling-restart.py'))
+
+
+def cancel_restart():
+    '''Mark a queued rolling restart done, so the peers do not wait for
+    it, and stop trying to take a turn'''
+    state = rolling_restart.load_state()
+    if rolling_restart.pending(state):
+        state['restart-done'] = state['restart-request']
+        rolling_restart.save_state(state)
+        publish_restart(state)
+    rolling_restart.configure_cron(hookenv.local_unit(), None)
+
+
+def publish_restart(state):
+    for relation_id in hookenv.relation_ids('cluster'):
+        hookenv.relation_set(relation_id, {
+            'restart-request': state.get('restart-request'),
+            'restart-done': state.get('restart-done')})
+
+
+# Not a Juju hook: run by scripts/rolling-restart.py from cron
+@hooks.hook('rolling-restart')
+def rolling_restart_turn():
+    '''Restart Jetty if a rolling restart is queued and it is this unit's
+    turn: drain, restart, warm up, then let the next unit go'''
+    config = hookenv.config()
+    state = rolling_restart.load_state()
+    local_unit = hookenv.local_unit()
+    if not rolling_restart.pending(state):
+        rolling_restart.configure_cron(local_unit, None)
+        return
+    units = {local_unit: state}
+    for relation_id in hookenv.relation_ids('cluster'):
+        for unit in hookenv.related_units(relation_id):
+            units[unit] = hookenv.relation_get(unit=unit,
+                                               rid=relation_id) or {}
+    if not rolling_restart.may_restart(local_unit, units,
+                                       config['rolling-restart-max-down']):
+        queue = rolling_restart.queue(units)
+        hookenv.log('Waiting to restart: {} of {} in the queue'.format(
+            queue.index(local_unit) + 1, len(queue)))
+        return
+
+    if state.get('withdrawn') != state['restart-request']:
+        # Relation settings only reach the frontends once this run ends:
+        # restart on the next one, when they have stopped sending traffic
+        withdraw_unit(advertise.DRAINING)
+        state['withdrawn'] = state['restart-request']
+        rolling_restart.save_state(state)
+        hookenv.log('Withdrawn from the frontends, restarting next')
+        return
+
+    ports = serving_ports()
+    with profiler.timed('drain'):
+        left = rolling_restart.drain(ports, config['restart-drain-timeout'])
+    if left:
+        hookenv.log('Restarting with {} connections still open'.format(left),
+                    hookenv.WARNING)
+    try:
+        jetty.stop()
+        if not jetty.start():
+            sys.exit(1)
+        advertise.save_state(advertise.STARTING)
+        advertise_unit()
+    finally:
+        rolling_restart.undrain(ports)
+    state['restart-done'] = state['restart-request']
+    rolling_restart.save_state(state)
+    hookenv.log('Rolling restart done ({})'.format(state['restart-done']))
+    publish_restart(state)
+    rolling_restart.configure_cron(local_unit, None)
+
+
+def configure_ramdisk():
+    '''Serve the Solr data from tmpfs, checkpointed to the volume (or a
+    local directory) from cron, or stop doing so'''
+    config = hookenv.config()
+    ctxt = hook_context()
+    unit = hookenv.local_unit()
+    path = ramdisk.mountpoint(unit)
+    store = ramdisk.store(ctxt['volume_mountpoint'], ctxt['ephemeral'])
+    try:
+        if config['ramdisk']:
+            if ramdisk.in_use(mount.SOLR_DIR) and ramdisk.restored(path):
+                ramdisk.mount_tmpfs(path, config['ramdisk-size-mb'])
+            else:
+                jetty.stop()
+                with profiler.timed('ramdisk-restore'):
+                    ramdisk.enable(mount.SOLR_DIR, path, store,
+                                   config['ramdisk-size-mb'])
+            ramdisk.configure_cron(
+                unit, os.path.join(hookenv.charm_dir(), 'scripts',
+                                   'ramdisk-checkpoint.py'),
+                config['ramdisk-checkpoint-interval'],
+                config['ramdisk-checkpoint-on-commit'])
+        elif ramdisk.in_use(mount.SOLR_DIR):
+            ramdisk.configure_cron(unit, None, 0, on_commit=False)
+            jetty.stop()
+            ramdisk.disable(mount.SOLR_DIR, path, store, ctxt['ephemeral'])
+            if not jetty.start():
+                sys.exit(1)
+    except ramdisk.RamdiskError as e:
+        hookenv.log(str(e), hookenv.ERROR)
+        sys.exit(1)
+
+
+def checkpoint_ramdisk():
+    '''Copy what is left on the ramdisk to its store; Jetty must be
+    stopped'''
+    if ramdisk.in_use(mount.SOLR_DIR):
+        ctxt = hook_context()
+        ramdisk.checkpoint(ramdisk.mountpoint(hookenv.local_unit()),
+                           ramdisk.store(ctxt['volume_mountpoint'],
+                                         ctxt['ephemeral']))
+
+
+def rbd_placement():
+    '''Ceph pool placement options from the charm config'''
+    config = hookenv.config()
+    return {
+        'crush_rule': config.get('ceph-crush-rule'),
+        'device_class': config.get('ceph-device-class'),
+        'cache_device_class': config.get('ceph-cache-tier-device-class'),
+        'cache_mode': config.get('ceph-cache-tier-mode'),
+        'cache_target_max_bytes': config['ceph-cache-tier-max-gb'] * 1024 ** 3,
+    }
+
+
+@hooks.hook('ceph-relation-joined')
+def ceph_joined():
+    hookenv.log('Start Ceph Relation Joined')
+    ceph.install()
+    hookenv.log('Finish Ceph Relation Joined')
+
+
+@hooks.hook('ceph-relation-changed')
+def ceph_changed():
+    hookenv.log('Start Ceph Relation Changed')
+    auth = hookenv.relation_get('auth')
+    key = hookenv.relation_get('key')
+    use_syslog = hookenv.relation_get('use_syslog')
+    if None in [auth, key]:
+        hookenv.log('Missing key or auth in relation')
+        return
+
+    config = hookenv.config()
+    ctxt = hook_context()
+    service_name = ctxt['service_name']
+    pool_name = service_name
+    ceph.configure(service=service_name, key=key, auth=auth,
+                   use_syslog=use_syslog,
+                   rbd_cache=config['rbd-cache'],
+                   rbd_cache_size_mb=config['rbd-cache-size-mb'],
+                   rbd_cache_max_dirty_mb=config['rbd-cache-max-dirty-mb'])
+
+    sizemb = int(config['block-size']) * 1024
+    clone_source = config.get('rbd-clone-source')
+    rbd_img = seeding.image_name(config['rbd-name'], ctxt['unit_id'],
+                                 clone_source)
+    blk_device = '/dev/rbd/%s/%s' % (pool_name, rbd_img)
+    clone_from = None
+    if clone_source:
+        source_pool, source_image = seeding.parse_source(clone_source)
+        snap = seeding.latest_seed(service_name, source_pool, source_image)
+        if snap:
+            clone_from = (source_pool, source_image, snap)
+        else:
+            hookenv.log('No seed snapshot of {} yet, a new image will start '
+                        'empty'.format(clone_source), hookenv.WARNING)
+    mount_point = ctxt['volume_mountpoint']
+    pool_share = config['ceph-pool-weight'] / 100.0
+    storage = storage_profile.profile()
+    storage_profile.ensure_tools(storage['filesystem'])
+    try:
+        ceph.ensure_ceph_storage(service=service_name, pool=pool_name,
+                                 rbd_img=rbd_img, sizemb=sizemb,
+                                 fstype=storage['filesystem'],
+                                 mkfs_options=storage_profile.MKFS_OPTIONS[
+                                     storage['filesystem']],
+                                 mount_point=mount_point,
+                                 blk_device=blk_device,
+                                 system_services=['jetty'],
+                                 rbd_pool_replicas=config[
+                                     'ceph-osd-replication-count'],
+                                 rbd_pool_share=pool_share,
+                                 rbd_layout=rbd_layout(),
+                                 clone_from=clone_from,
+                                 rbd_placement=rbd_placement())
+    except ceph.PlacementError as e:
+        hookenv.log('Invalid Ceph placement: {}'.format(e), hookenv.ERROR)
+        sys.exit(1)
+
+    with profiler.timed('mount-volume'):
+        mount.mount()
+    storage_profile.apply(mount_point)
+    host.service_start('jetty')
+    configure_capacity()
+    configure_seeding()
+    hookenv.log('Finish Ceph Relation Changed')
+
+
+@hooks.hook('ceph-relation-broken')
+def ceph_broken():
+    '''Stop using the RBD image before access to it goes away, writing back
+    anything still only held by the local cache'''
+    ctxt = hook_context()
+    mount_point = ctxt['volume_mountpoint']
+    capacity.configure_cron(hookenv.local_unit(), None, enabled=False)
+    seeding.configure_cron(hookenv.local_unit(), None, 0)
+    request_log.configure_cron(None)
+    cancel_restart()
+    withdraw_unit(advertise.STOPPED)
+    jetty.stop()
+    checkpoint_ramdisk()
+    if os.path.ismount(mount_point):
+        host.umount(mount_point, persist=True)
+    cache_name = '{}-{}-cache'.format(ctxt['service_name'], ctxt['unit_id'])
+    if cache_tier.attached(cache_name):
+        with profiler.timed('cache-detach'):
+            cache_tier.detach(cache_name)
+
+
+def main(args):
+    hook_name = os.path.basename(args[0])
+    profiler.install(hook_name)
+    started = time.time()
+    rc = 0
+    try:
+        hooks.execute(args)
+    except hookenv.UnregisteredHookError:
+        hookenv.log("This charm doesn't know how to handle "
+                    "'{}'.".format(hook_name))
+    except SystemExit as e:
+        rc = e.code
+        raise
+    except:
+        rc = 1
+        raise
+    finally:
+        elapsed = time.time() - started
+        profiler.record(profiler.HOOK, hook_name, started, elapsed, rc)
+        try:
+            profiler.flush()
+        except (IOError, OSError) as e:
+            hookenv.log('Could not write hook timeline: {}'.format(e),
+                        hookenv.WARNING)
+        hookenv.log('Hook {} finished in {:.3f}s'.format(hook_name,
+                                                         elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,41 @@
+#
+# What the unit tells its frontends (the website and indexing relations).
+#
+# A unit only gives out its address while it is ready: Solr answers and
+# its caches have been warmed. Starting, draining before a restart and
+# stopped units clear hostname and port, which takes them out of haproxy
+# (and any http interface frontend), and say why in a state setting.
+#
+
+import json
+import os
+
+STATE_FILE = '/var/lib/solr-jetty/advertised'
+READY = 'ready'
+STARTING = 'starting'
+DRAINING = 'draining'
+STOPPED = 'stopped'
+
+
+def settings(state, hostname, port, services=None):
+    '''Settings for an http interface relation in state, with a haproxy
+    service definition if given (see lib/routing.py)'''
+    if state == READY:
+        return {'hostname': hostname, 'port': port, 'services': services,
+                'state': state}
+    return {'hostname': None, 'port': None, 'services': None,
+            'state': state}
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return STARTING
+    with open(STATE_FILE) as state:
+        return json.load(state)['state']
+
+
+def save_state(state):
+    if not os.path.isdir(os.path.dirname(STATE_FILE)):
+        os.makedirs(os.path.dirname(STATE_FILE))
+    with open(STATE_FILE, 'w') as f:
+        json.dump({'state': state}, f)
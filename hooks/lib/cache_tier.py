@@ -0,0 +1,233 @@
+#
+# Local SSD cache in front of a slow (e.g. Ceph RBD) volume.
+#
+# The cache is a device-mapper cache target (dm-cache, what lvmcache uses
+# underneath) built directly with dmsetup, so it can be put in front of an
+# RBD image which already holds a filesystem without reformatting it. The
+# fast device is split into a small metadata area and the cache blocks:
+#
+#   <name>-cmeta  linear, start of the fast device
+#   <name>-cdata  linear, rest of the fast device
+#   <name>        cache over the origin device, mounted instead of it
+#
+# Device-mapper tables do not survive a reboot; the cache is set up again
+# when the volume is mounted by config-changed. In writethrough mode (the
+# default) the origin always holds every write, so the cache metadata is
+# reset every time it is attached and a cold cache is the only cost. In
+# writeback mode the metadata is kept so that dirty blocks are written
+# back, and the cache must be detached (flushed) before the origin is used
+# without it.
+#
+
+import json
+import os
+import subprocess
+import time
+
+import lib.utils as utils
+
+MODES = ['writethrough', 'writeback']
+DEFAULT_MODE = 'writethrough'
+DEFAULT_BLOCK_KB = 64
+STATE_FILE = '/var/lib/solr-jetty/cache-tier'
+SECTOR = 512
+# dm-cache needs 4MB plus 16 bytes per cache block of metadata
+METADATA_BASE = 4 * 1024 * 1024
+METADATA_PER_BLOCK = 16
+FLUSH_INTERVAL = 5
+FLUSH_TIMEOUT = 3600
+
+STATUS_FIELDS = ['read_hits', 'read_misses', 'write_hits', 'write_misses',
+                 'demotions', 'promotions', 'dirty']
+
+
+class CacheTierError(Exception):
+    '''The cache could not be attached or detached'''
+    pass
+
+
+def _dmsetup(*args):
+    return subprocess.check_output(['dmsetup'] + list(args))
+
+
+def attached(name):
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(['dmsetup', 'info', name], stdout=devnull,
+                                  stderr=devnull)
+    except (subprocess.CalledProcessError, OSError):
+        # no dmsetup: nothing can have been attached
+        return False
+    return True
+
+
+def configured(name):
+    '''Whether a cache called name was attached and not detached since'''
+    return name in _load_state()
+
+
+def _sectors(device):
+    return int(subprocess.check_output(['blockdev', '--getsz', device]))
+
+
+def _signature(device):
+    try:
+        output = subprocess.check_output(['blkid', '-p', '-o', 'value',
+                                          '-s', 'TYPE', device])
+    except subprocess.CalledProcessError:
+        return None
+    return output.strip() or None
+
+
+def _load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as state:
+        return json.load(state)
+
+
+def _save_state(state):
+    if not os.path.isdir(os.path.dirname(STATE_FILE)):
+        os.makedirs(os.path.dirname(STATE_FILE))
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f)
+
+
+def device_path(name):
+    return '/dev/mapper/{}'.format(name)
+
+
+def geometry(fast_sectors, block_kb):
+    '''(metadata sectors, cache data sectors, block sectors) for a fast
+    device of fast_sectors'''
+    block_sectors = block_kb * 1024 / SECTOR
+    blocks = fast_sectors / block_sectors
+    meta_bytes = METADATA_BASE + METADATA_PER_BLOCK * blocks
+    meta_sectors = -(-meta_bytes // SECTOR)
+    data_sectors = ((fast_sectors - meta_sectors) / block_sectors *
+                    block_sectors)
+    if data_sectors <= 0:
+        raise CacheTierError('Cache device is too small')
+    return meta_sectors, data_sectors, block_sectors
+
+
+def cache_table(name, origin, origin_sectors, block_sectors, mode,
+                policy='default'):
+    return '0 {} cache {} {} {} {} 1 {} {} 0'.format(
+        origin_sectors, device_path(name + '-cmeta'),
+        device_path(name + '-cdata'), origin, block_sectors, mode, policy)
+
+
+def attach(name, origin, fast_device, mode=DEFAULT_MODE,
+           block_kb=DEFAULT_BLOCK_KB):
+    '''
+    Put fast_device in front of origin as a cache called name and return
+    the device to use instead of origin. fast_device must be blank unless
+    it already served as this cache.
+    '''
+    if mode not in MODES:
+        raise CacheTierError('Unsupported cache mode {}'.format(mode))
+    if attached(name):
+        utils.juju_log('INFO', 'Cache {} is already attached'.format(name))
+        report(name)
+        return device_path(name)
+
+    state = _load_state()
+    previous = state.get(name)
+    if previous and previous['fast_device'] == fast_device:
+        if previous['origin'] != origin:
+            raise CacheTierError('{} caches {}, not {}'.format(
+                fast_device, previous['origin'], origin))
+        if previous['mode'] == 'writeback' and \
+                previous['block_kb'] != block_kb:
+            raise CacheTierError('Cannot change the block size of a '
+                                 'writeback cache which was not detached')
+    else:
+        signature = _signature(fast_device)
+        if signature:
+            raise CacheTierError('Not using {} as a cache, it holds {}'.format(
+                fast_device, signature))
+    # Keep the metadata of a writeback cache: it may hold dirty blocks
+    reset = not (previous and previous['fast_device'] == fast_device and
+                 previous['mode'] == 'writeback')
+    if not reset:
+        block_kb = previous['block_kb']
+        if mode != previous['mode']:
+            utils.juju_log('WARNING', 'Cache {} is reattached in writeback '
+                           'mode; detach it to change the mode'.format(name))
+            mode = previous['mode']
+
+    meta, data, block = geometry(_sectors(fast_device), block_kb)
+    _dmsetup('create', name + '-cmeta', '--table',
+             '0 {} linear {} 0'.format(meta, fast_device))
+    _dmsetup('create', name + '-cdata', '--table',
+             '0 {} linear {} {}'.format(data, fast_device, meta))
+    if reset:
+        subprocess.check_call(['dd', 'if=/dev/zero',
+                               'of=' + device_path(name + '-cmeta'),
+                               'bs=4096', 'count=1', 'oflag=direct'])
+    _dmsetup('create', name, '--table',
+             cache_table(name, origin, _sectors(origin), block, mode))
+
+    state[name] = {'origin': origin, 'fast_device': fast_device,
+                   'mode': mode, 'block_kb': block_kb}
+    _save_state(state)
+    utils.juju_log('INFO', 'Attached {} cache {} on {} in front of {}'.format(
+        mode, name, fast_device, origin))
+    return device_path(name)
+
+
+def stats(name):
+    '''Cache counters of name from dmsetup status, with the read hit rate'''
+    fields = _dmsetup('status', name).split()
+    # <start> <len> cache <meta block> <used>/<total> <cache block>
+    # <used>/<total> <read hits> <read misses> ...
+    used, total = fields[6].split('/')
+    counters = dict(zip(STATUS_FIELDS, [int(f) for f in fields[7:14]]))
+    counters['used_blocks'] = int(used)
+    counters['total_blocks'] = int(total)
+    reads = counters['read_hits'] + counters['read_misses']
+    counters['read_hit_rate'] = (float(counters['read_hits']) / reads
+                                 if reads else 0.0)
+    return counters
+
+
+def report(name):
+    counters = stats(name)
+    utils.juju_log('INFO', 'Cache {}: {:.1%} read hit rate, {}/{} blocks '
+                   'used, {} dirty'.format(name, counters['read_hit_rate'],
+                                           counters['used_blocks'],
+                                           counters['total_blocks'],
+                                           counters['dirty']))
+    return counters
+
+
+def detach(name, timeout=FLUSH_TIMEOUT):
+    '''
+    Write back every dirty block and remove the cache, leaving the origin
+    complete. The device must no longer be mounted.
+    '''
+    state = _load_state()
+    if not attached(name):
+        if state.pop(name, None):
+            _save_state(state)
+        return
+    report(name)
+    if stats(name)['dirty']:
+        # The cleaner policy writes back all dirty blocks and promotes
+        # nothing new
+        table = _dmsetup('table', name).split()
+        table[-2] = 'cleaner'
+        _dmsetup('reload', name, '--table', ' '.join(table))
+        _dmsetup('resume', name)
+        deadline = time.time() + timeout
+        while stats(name)['dirty']:
+            if time.time() > deadline:
+                raise CacheTierError('Timed out flushing cache {}'.format(
+                    name))
+            time.sleep(FLUSH_INTERVAL)
+    for device in (name, name + '-cdata', name + '-cmeta'):
+        _dmsetup('remove', device)
+    state.pop(name, None)
+    _save_state(state)
+    utils.juju_log('INFO', 'Detached cache {}'.format(name))
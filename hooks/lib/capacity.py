@@ -0,0 +1,179 @@
+#
+# Online growth of the Ceph-backed Solr volume.
+#
+# A merge writes the merged segment before the segments it replaces are
+# deleted, so a full merge needs as much free space again as the index
+# takes. The capacity check samples the space used on the volume, projects
+# it over a horizon from the recent growth rate and, when the free space
+# falls short of the projected merge headroom, grows the RBD image and then
+# the mounted filesystem (resize2fs and xfs_growfs both work online), all
+# without stopping Jetty.
+#
+# The check runs from cron through juju-run, which gives it the unit's hook
+# environment and serialises it with the charm's hooks.
+#
+
+import json
+import os
+import subprocess
+import time
+
+import lib.ceph_utils as ceph
+import lib.utils as utils
+
+STATE_FILE = '/var/lib/solr-jetty/capacity'
+# One day of samples at the default interval
+SAMPLES_KEPT = 288
+# Grow a little beyond what is needed so resizes stay infrequent
+GROWTH_MARGIN = 1.2
+GB = 1024 * 1024 * 1024
+MB = 1024 * 1024
+DEVICE_WAIT = 30
+
+CRON_FILE = '/etc/cron.d/solr-jetty-capacity'
+DEFAULT_INTERVAL = 5
+
+
+def usage(mountpoint):
+    '''(total, used, free) bytes of the filesystem mounted at mountpoint;
+    free is what is available to unprivileged users such as jetty'''
+    st = os.statvfs(mountpoint)
+    total = st.f_blocks * st.f_frsize
+    return total, total - st.f_bfree * st.f_frsize, st.f_bavail * st.f_frsize
+
+
+def load_samples(path=None):
+    path = path or STATE_FILE
+    if not os.path.exists(path):
+        return []
+    with open(path) as state:
+        return json.load(state)
+
+
+def record_sample(used, now=None, path=None):
+    '''Add a (time, bytes used) sample and return the samples kept'''
+    path = path or STATE_FILE
+    samples = load_samples(path)
+    samples.append([now or time.time(), used])
+    samples = samples[-SAMPLES_KEPT:]
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as state:
+        json.dump(samples, state)
+    return samples
+
+
+def growth_rate(samples):
+    '''Least squares growth of the used space in bytes per second; 0 when
+    usage is flat or shrinking'''
+    if len(samples) < 2:
+        return 0.0
+    n = float(len(samples))
+    mean_t = sum(t for t, _ in samples) / n
+    mean_u = sum(u for _, u in samples) / n
+    var = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not var:
+        return 0.0
+    cov = sum((t - mean_t) * (u - mean_u) for t, u in samples)
+    return max(cov / var, 0.0)
+
+
+def plan(total, used, free, samples, headroom=1.0, horizon_hours=24):
+    '''
+    Filesystem size in bytes to grow to, or None if the free space covers
+    the usage projected over horizon_hours plus headroom times that usage
+    for merges.
+    '''
+    projected = used + growth_rate(samples) * horizon_hours * 3600
+    required_free = headroom * projected + (projected - used)
+    if free >= required_free:
+        return None
+    target = (used + required_free) * GROWTH_MARGIN
+    # whole GB
+    return int(-(-target // GB) * GB)
+
+
+def mount_info(mountpoint):
+    '''(device, fstype) mounted at mountpoint, or None'''
+    with open('/proc/mounts') as mounts:
+        for line in mounts:
+            fields = line.split()
+            if len(fields) > 2 and fields[1] == mountpoint:
+                return fields[0], fields[2]
+    return None
+
+
+def wait_for_size(device, size, timeout=None):
+    '''Wait for the kernel to pick up the new size of a mapped image'''
+    deadline = time.time() + (DEVICE_WAIT if timeout is None else timeout)
+    while True:
+        current = int(subprocess.check_output(['blockdev', '--getsize64',
+                                               device]))
+        if current >= size or time.time() > deadline:
+            return current >= size
+        time.sleep(1)
+
+
+def grow_filesystem(device, mountpoint, fstype):
+    if fstype == 'xfs':
+        subprocess.check_call(['xfs_growfs', mountpoint])
+    elif fstype.startswith('ext'):
+        subprocess.check_call(['resize2fs', device])
+    else:
+        raise ValueError('Cannot grow a {} filesystem'.format(fstype))
+
+
+def check(service, pool, image, mountpoint, headroom=1.0, horizon_hours=24,
+          max_gb=0):
+    '''Grow the RBD image mounted at mountpoint if it is running out of
+    room; returns the new image size in MB, or None'''
+    info = mount_info(mountpoint)
+    if info is None:
+        return None
+    device, fstype = info
+    image_device = '/dev/rbd/{}/{}'.format(pool, image)
+    if os.path.realpath(device) != os.path.realpath(image_device):
+        utils.juju_log('WARNING', 'capacity: {} is on {}, not {}; not '
+                       'growing it'.format(mountpoint, device, image_device))
+        return None
+
+    total, used, free = usage(mountpoint)
+    samples = record_sample(used)
+    target = plan(total, used, free, samples, headroom=headroom,
+                  horizon_hours=horizon_hours)
+    if target is None:
+        return None
+    if max_gb and target > max_gb * GB:
+        utils.juju_log('WARNING', 'capacity: {} needs {}GB for its merge '
+                       'headroom but is limited to {}GB'.format(
+                           mountpoint, target / GB, max_gb))
+        target = max_gb * GB
+        if target <= total:
+            return None
+
+    image_mb = ceph.rbd_image_size(service, pool, image)
+    if image_mb is None:
+        utils.juju_log('WARNING', 'capacity: could not read the size of '
+                       'RBD image {}'.format(image))
+        return None
+    # the filesystem is a little smaller than the image it is on
+    new_mb = image_mb + (target - total) / MB
+    utils.juju_log('INFO', 'capacity: {}MB used, {}MB free on {}; growing '
+                   'from {}MB to {}MB'.format(used / MB, free / MB,
+                                              mountpoint, image_mb, new_mb))
+    ceph.resize_rbd_image(service, pool, image, new_mb)
+    if not wait_for_size(device, new_mb * MB):
+        utils.juju_log('WARNING', 'capacity: {} did not grow to {}MB in '
+                       'time, not growing the filesystem'.format(device,
+                                                                 new_mb))
+        return None
+    grow_filesystem(device, mountpoint, fstype)
+    utils.juju_log('INFO', 'capacity: {} is now {}MB'.format(
+        mountpoint, usage(mountpoint)[0] / MB))
+    return new_mb
+
+
+def configure_cron(unit, command, enabled, interval=DEFAULT_INTERVAL):
+    '''Run command as unit every interval minutes, or stop running it'''
+    utils.configure_cron(CRON_FILE, unit, command,
+                         interval if enabled else 0)
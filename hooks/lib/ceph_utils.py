@@ -13,13 +13,17 @@ import commands
 import json
 import subprocess
 import os
+import re
 import shutil
+import threading
 import time
 import lib.utils as utils
 
 
 KEYRING = '/etc/ceph/ceph.client.%s.keyring'
 KEYFILE = '/etc/ceph/ceph.client.%s.key'
+# Images listed here are mapped at boot by the rbdmap service
+RBDMAP = '/etc/ceph/rbdmap'
 
 CEPH_CONF = """[global]
  auth supported = %(auth)s
@@ -28,8 +32,31 @@ CEPH_CONF = """[global]
  log to syslog = %(use_syslog)s
  err to syslog = %(use_syslog)s
  clog to syslog = %(use_syslog)s
+
+[client]
+ rbd cache = %(rbd_cache)s
+ rbd cache size = %(rbd_cache_size)d
+ rbd cache max dirty = %(rbd_cache_max_dirty)d
+ rbd cache writethrough until flush = true
 """
 
+# Placement groups per OSD to aim for across all pools
+TARGET_PGS_PER_OSD = 100
+# Ceph warns when an OSD holds more PGs than this
+MAX_PGS_PER_OSD = 300
+MIN_PG_NUM = 8
+# Used when the number of OSDs is unknown
+DEFAULT_PG_NUM = 256
+# Share of the cluster's data a cache tier pool is sized for
+CACHE_POOL_SHARE = 0.1
+# Device classes need luminous
+DEVICE_CLASS_VERSION = (12, 2)
+
+
+class PlacementError(Exception):
+    '''The cluster cannot place the pool as configured'''
+    pass
+
 
 def execute(cmd):
     subprocess.check_call(cmd)
@@ -49,10 +76,17 @@ def install():
 def rbd_exists(service, pool, rbd_img):
     (rc, out) = commands.getstatusoutput('rbd list --id %s --pool %s' %
                                          (service, pool))
-    return rbd_img in out
+    return rbd_img in out.split()
 
 
-def create_rbd_image(service, pool, image, sizemb):
+def create_rbd_image(service, pool, image, sizemb, order=None,
+                     stripe_unit=None, stripe_count=None, features=None):
+    '''
+    Create an RBD image. order sets the object size (2^order bytes),
+    stripe_unit (bytes) and stripe_count enable fancy striping and
+    features is a list of image features; any of these makes the
+    image a format 2 image.
+    '''
     cmd = [
         'rbd',
         'create',
@@ -63,62 +97,217 @@ def create_rbd_image(service, pool, image, sizemb):
         service,
         '--pool',
         pool]
+    if order:
+        cmd.extend(['--order', str(order)])
+    features = list(features or [])
+    if stripe_unit or stripe_count:
+        cmd.extend(['--stripe-unit', str(stripe_unit or 2 ** (order or 22)),
+                    '--stripe-count', str(stripe_count or 1)])
+        if 'striping' not in features:
+            features.append('striping')
+    if features:
+        cmd.extend(['--image-format', '2'])
+        for feature in features:
+            cmd.extend(['--image-feature', feature])
     execute(cmd)
 
 
+def krbd_mappable(order=None, stripe_unit=None, stripe_count=None):
+    '''
+    Whether the kernel RBD client can map an image with this layout. Up
+    to Linux 4.17 it refuses images with fancy striping (STRIPINGV2) unless
+    the stripe unit is the object size and the stripe count 1.
+    '''
+    if not (stripe_unit or stripe_count):
+        return True
+    return stripe_unit in (None, 0, 2 ** (order or 22)) and \
+        stripe_count in (None, 0, 1)
+
+
+def rbd_image_size(service, pool, image):
+    ''' Size of an RBD image in MB, or None if it cannot be read '''
+    info = _load_json(_check_output(['rbd', 'info', '--id', service,
+                                     '--pool', pool, '--format', 'json',
+                                     image]))
+    if not info or 'size' not in info:
+        return None
+    return int(info['size']) / (1024 * 1024)
+
+
+def resize_rbd_image(service, pool, image, sizemb):
+    ''' Grow an RBD image to sizemb; shrinking is refused by rbd '''
+    utils.juju_log('INFO', 'ceph: Resizing RBD image %s to %dMB.' %
+                   (image, sizemb))
+    execute(['rbd', 'resize', '--id', service, '--pool', pool,
+             '--size', str(sizemb), image])
+
+
+def list_snapshots(service, pool, image):
+    ''' Names of the snapshots of an RBD image, oldest first '''
+    snaps = _load_json(_check_output(['rbd', 'snap', 'ls', '--id', service,
+                                      '--pool', pool, '--format', 'json',
+                                      image]))
+    if not snaps:
+        return []
+    return [snap['name'] for snap in sorted(snaps, key=lambda s: s['id'])]
+
+
+def create_snapshot(service, pool, image, snap, protect=True):
+    ''' Snapshot an RBD image, protecting the snapshot so it can be cloned '''
+    execute(['rbd', 'snap', 'create', '--id', service,
+             '%s/%s@%s' % (pool, image, snap)])
+    if protect:
+        protect_snapshot(service, pool, image, snap)
+
+
+def protect_snapshot(service, pool, image, snap):
+    ''' Protect a snapshot from removal; clones need a protected parent '''
+    execute(['rbd', 'snap', 'protect', '--id', service,
+             '%s/%s@%s' % (pool, image, snap)])
+
+
+def snapshot_children(service, pool, image, snap):
+    ''' Images cloned from a snapshot, as pool/image '''
+    output = _check_output(['rbd', 'children', '--id', service,
+                            '%s/%s@%s' % (pool, image, snap)])
+    return (output or '').split()
+
+
+def remove_snapshot(service, pool, image, snap):
+    ''' Unprotect and remove a snapshot which has no clones '''
+    spec = '%s/%s@%s' % (pool, image, snap)
+    subprocess.call(['rbd', 'snap', 'unprotect', '--id', service, spec],
+                    stderr=open(os.devnull, 'w'))
+    execute(['rbd', 'snap', 'rm', '--id', service, spec])
+
+
+def clone_image(service, parent_pool, parent_image, snap, pool, image):
+    ''' Create image as a copy-on-write clone of a protected snapshot '''
+    utils.juju_log('INFO', 'ceph: Cloning %s/%s@%s as %s/%s.' %
+                   (parent_pool, parent_image, snap, pool, image))
+    execute(['rbd', 'clone', '--id', service,
+             '%s/%s@%s' % (parent_pool, parent_image, snap),
+             '%s/%s' % (pool, image)])
+
+
 def pool_exists(service, name):
     (rc, out) = commands.getstatusoutput("rados --id %s lspools" % service)
-    return name in out
+    return name in out.split()
 
 
 def ceph_version():
     ''' Retrieve the local version of ceph '''
-    if os.path.exists('/usr/bin/ceph'):
-        cmd = ['ceph', '-v']
-        output = subprocess.check_output(cmd)
-        output = output.split()
-        if len(output) > 3:
-            return output[2]
-        else:
-            return None
+    try:
+        output = subprocess.check_output(['ceph', '-v'])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    output = output.split()
+    if len(output) > 3:
+        return output[2]
     else:
         return None
 
 
+def version_tuple(version):
+    return tuple(int(part) for part in re.findall(r'\d+', version))
+
+
 def get_osds(service):
     '''
     Return a list of all Ceph Object Storage Daemons
     currently in the cluster
     '''
     version = ceph_version()
-    if version and version >= '0.56':
+    if version and version_tuple(version) >= (0, 56):
         cmd = ['ceph', '--id', service, 'osd', 'ls', '--format=json']
         return json.loads(subprocess.check_output(cmd))
     else:
         return None
 
 
-def create_pool(service, name, replicas=2):
-    ''' Create a new RADOS pool '''
+def osd_count(service):
+    '''
+    Number of OSDs in the cluster, or None if it cannot be determined.
+    Older ceph versions which can't list OSDs still report a count in
+    "ceph osd stat" (e.g. "e12: 3 osds: 3 up, 3 in").
+    '''
+    osds = get_osds(service)
+    if osds:
+        return len(osds)
+    try:
+        output = subprocess.check_output(['ceph', '--id', service,
+                                          'osd', 'stat'])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    match = re.search(r'(\d+) osds', output)
+    if match and int(match.group(1)):
+        return int(match.group(1))
+    return None
+
+
+def pg_count(osds, replicas, data_share=1.0,
+             target_pgs_per_osd=TARGET_PGS_PER_OSD):
+    '''
+    Placement group count for a pool expected to hold data_share (0-1) of
+    the data stored on osds OSDs, following the Ceph PG calculator: aim
+    for target_pgs_per_osd PGs per OSD across all pools and round down to
+    a power of two, rounding up instead when the lower power of two is
+    more than 25% below the raw count (so 400 gives 512, 300 gives 256).
+    '''
+    raw = float(osds * target_pgs_per_osd * data_share) / max(replicas, 1)
+    pgnum = 1
+    while pgnum * 2 <= raw:
+        pgnum *= 2
+    if pgnum < raw * 0.75:
+        pgnum *= 2
+    return max(pgnum, MIN_PG_NUM)
+
+
+def check_pg_count(pgnum, osds, replicas):
+    '''
+    Return a warning if pgnum PGs with the given replica count would be
+    over or under provisioned for osds OSDs, None otherwise.
+    '''
+    pgs_per_osd = float(pgnum * replicas) / osds
+    if pgs_per_osd > MAX_PGS_PER_OSD:
+        return ('{} PGs with {} replicas puts {:.0f} PGs on each of {} OSDs '
+                '(more than {}): the pool is over-provisioned'.format(
+                    pgnum, replicas, pgs_per_osd, osds, MAX_PGS_PER_OSD))
+    if pgnum * replicas < osds:
+        return ('{} PGs with {} replicas cannot cover all {} OSDs: the pool '
+                'is under-provisioned and will load some OSDs '
+                'unevenly'.format(pgnum, replicas, osds))
+    return None
+
+
+def create_pool(service, name, replicas=2, data_share=1.0, crush_rule=None):
+    ''' Create a new RADOS pool, placed by crush_rule if given '''
     if pool_exists(service, name):
         utils.juju_log('WARNING',
                        "Ceph pool {} already exists, "
                        "skipping creation".format(name))
         return
 
-    osds = get_osds(service)
+    osds = osd_count(service)
     if osds:
-        pgnum = (len(osds) * 100 / replicas)
+        pgnum = pg_count(osds, replicas, data_share)
+        warning = check_pg_count(pgnum, osds, replicas)
+        if warning:
+            utils.juju_log('WARNING', 'ceph: pool {}: {}'.format(name,
+                                                                 warning))
     else:
-        # NOTE(james-page): Default to 200 for older ceph versions
-        # which don't support OSD query from cli
-        pgnum = 200
+        utils.juju_log('WARNING',
+                       'ceph: could not count OSDs, creating pool {} with '
+                       '{} PGs'.format(name, DEFAULT_PG_NUM))
+        pgnum = DEFAULT_PG_NUM
 
     cmd = [
         'ceph', '--id', service,
         'osd', 'pool', 'create',
-        name, str(pgnum)
+        name, str(pgnum), str(pgnum)
     ]
+    if crush_rule:
+        cmd.extend(['replicated', crush_rule])
     subprocess.check_call(cmd)
     cmd = [
         'ceph', '--id', service,
@@ -128,6 +317,119 @@ def create_pool(service, name, replicas=2):
     subprocess.check_call(cmd)
 
 
+def _parse_rules(output):
+    rules = _load_json(output)
+    return dict((rule['rule_id'], rule['rule_name']) for rule in rules or [])
+
+
+def crush_rules(service):
+    ''' Map of CRUSH rule id to name '''
+    return _parse_rules(_check_output(['ceph', '--id', service, 'osd',
+                                       'crush', 'rule', 'dump',
+                                       '--format=json']))
+
+
+def device_class_rule(device_class):
+    ''' Name of the replicated rule placing data on device_class OSDs '''
+    return 'replicated_%s' % device_class
+
+
+def ensure_device_class_rule(service, device_class):
+    '''
+    Create a replicated CRUSH rule, with a host failure domain, which only
+    uses OSDs of device_class (e.g. ssd or nvme), and return its name.
+    '''
+    rule = device_class_rule(device_class)
+    if rule in crush_rules(service).values():
+        return rule
+    version = ceph_version()
+    if not version or version_tuple(version) < DEVICE_CLASS_VERSION:
+        raise PlacementError('Ceph %s does not support device classes; use '
+                             'a CRUSH rule instead' % version)
+    utils.juju_log('INFO', 'ceph: Creating CRUSH rule %s.' % rule)
+    subprocess.check_call(['ceph', '--id', service, 'osd', 'crush', 'rule',
+                           'create-replicated', rule, 'default', 'host',
+                           device_class])
+    return rule
+
+
+def add_cache_tier(service, pool, cache_pool, mode='writeback',
+                   target_max_bytes=None):
+    ''' Put cache_pool in front of pool as a cache tier '''
+    utils.juju_log('INFO', 'ceph: Adding %s cache tier %s to pool %s.' %
+                   (mode, cache_pool, pool))
+    ceph = ['ceph', '--id', service, 'osd']
+    subprocess.check_call(ceph + ['tier', 'add', pool, cache_pool])
+    subprocess.check_call(ceph + ['tier', 'cache-mode', cache_pool, mode])
+    subprocess.check_call(ceph + ['tier', 'set-overlay', pool, cache_pool])
+    settings = [('hit_set_type', 'bloom'), ('hit_set_count', 1),
+                ('hit_set_period', 3600),
+                ('cache_target_dirty_ratio', 0.4),
+                ('cache_target_full_ratio', 0.8)]
+    if target_max_bytes:
+        # the tiering agent only flushes and evicts with a target set
+        settings.append(('target_max_bytes', target_max_bytes))
+    for key, value in settings:
+        subprocess.check_call(ceph + ['pool', 'set', cache_pool, key,
+                                      str(value)])
+
+
+def pool_placement(service, name):
+    '''
+    Placement of pool name: the name of its CRUSH rule, and the name and
+    mode of the cache tier in front of it (or None), or None if the pool
+    cannot be found.
+    '''
+    dump = _load_json(_check_output(['ceph', '--id', service, 'osd', 'dump',
+                                     '--format=json']))
+    if not dump:
+        return None
+    return _placement(dump, crush_rules(service), name)
+
+
+def _placement(dump, rules, name):
+    '''pool_placement from an OSD map dump and the CRUSH rules'''
+    if not dump:
+        return None
+    pools = dict((p['pool'], p) for p in dump.get('pools', []))
+    for pool in pools.values():
+        if pool['pool_name'] == name:
+            break
+    else:
+        return None
+    # crush_ruleset before luminous
+    rule_id = pool.get('crush_rule', pool.get('crush_ruleset'))
+    cache = pools.get(pool.get('read_tier', -1))
+    return {
+        'crush_rule': rules.get(rule_id, rule_id),
+        'cache_pool': cache['pool_name'] if cache else None,
+        'cache_mode': cache.get('cache_mode') if cache else None,
+    }
+
+
+def check_placement(placement, name, crush_rule=None, cache_pool=None,
+                    cache_mode='writeback'):
+    '''
+    Differences between the placement of the existing pool name (see
+    pool_placement) and the one requested, as a list of messages. A
+    crush_rule of None stands for no particular rule; cache_pool None for
+    no cache tier.
+    '''
+    if placement is None:
+        return ['could not read the placement of pool %s' % name]
+    problems = []
+    if crush_rule and placement['crush_rule'] != crush_rule:
+        problems.append('pool %s uses CRUSH rule %s, not %s' %
+                        (name, placement['crush_rule'], crush_rule))
+    if cache_pool != placement['cache_pool']:
+        problems.append('pool %s has cache tier %s, not %s' %
+                        (name, placement['cache_pool'], cache_pool))
+    elif cache_pool and placement['cache_mode'] != cache_mode:
+        problems.append('cache tier %s is in %s mode, not %s' %
+                        (cache_pool, placement['cache_mode'], cache_mode))
+    return problems
+
+
 def keyfile_path(service):
     return KEYFILE % service
 
@@ -174,12 +476,17 @@ def get_ceph_nodes():
     return hosts
 
 
-def configure(service, key, auth, use_syslog):
+def configure(service, key, auth, use_syslog, rbd_cache=True,
+              rbd_cache_size_mb=32, rbd_cache_max_dirty_mb=0):
     create_keyring(service, key)
     create_key_file(service, key)
     hosts = get_ceph_nodes()
     mon_hosts = ",".join(map(str, hosts))
     keyring = keyring_path(service)
+    rbd_cache = str(bool(rbd_cache)).lower()
+    rbd_cache_size = rbd_cache_size_mb * 1024 * 1024
+    # a max dirty of 0 makes the cache write-through
+    rbd_cache_max_dirty = rbd_cache_max_dirty_mb * 1024 * 1024
     with open('/etc/ceph/ceph.conf', 'w') as ceph_conf:
         ceph_conf.write(CEPH_CONF % locals())
     modprobe_kernel_module('rbd')
@@ -187,7 +494,9 @@ def configure(service, key, auth, use_syslog):
 
 def image_mapped(image_name):
     (rc, out) = commands.getstatusoutput('rbd showmapped')
-    return image_name in out
+    # columns are: id pool image snap device
+    return image_name in [line.split()[2] for line in out.splitlines()[1:]
+                          if len(line.split()) > 2]
 
 
 def map_block_storage(service, pool, image):
@@ -200,6 +509,35 @@ def map_block_storage(service, pool, image):
         '--secret',
         keyfile_path(service)]
     execute(cmd)
+    # wait for udev to create the /dev/rbd/<pool>/<image> link
+    execute(['udevadm', 'settle'])
+
+
+def persist_rbd_mapping(service, pool, image):
+    '''
+    Add pool/image to the rbdmap file and enable the rbdmap service, so
+    that the image is mapped again (and its _netdev fstab entries
+    mounted) when the unit reboots.
+    '''
+    spec = '%s/%s' % (pool, image)
+    entry = '%s\tid=%s,keyring=%s\n' % (spec, service, keyring_path(service))
+    lines = []
+    if os.path.exists(RBDMAP):
+        with open(RBDMAP) as rbdmap:
+            lines = rbdmap.readlines()
+    if entry in lines:
+        return
+    lines = [line for line in lines
+             if not line.split() or line.split()[0] != spec]
+    lines.append(entry)
+    with open(RBDMAP, 'w') as rbdmap:
+        rbdmap.writelines(lines)
+    utils.juju_log('INFO', 'ceph: Persisted mapping of %s in %s.' %
+                   (spec, RBDMAP))
+    if os.path.isdir('/run/systemd/system'):
+        subprocess.call(['systemctl', 'enable', 'rbdmap'])
+    else:
+        subprocess.call(['update-rc.d', 'rbdmap', 'defaults'])
 
 
 # TODO: re-use
@@ -207,39 +545,247 @@ def modprobe_kernel_module(module):
     utils.juju_log('INFO', 'Loading kernel module')
     cmd = ['modprobe', module]
     execute(cmd)
-    cmd = 'echo %s >> /etc/modules' % module
-    execute_shell(cmd)
+    with open('/etc/modules') as modules:
+        if module in modules.read().split():
+            return
+    with open('/etc/modules', 'a') as modules:
+        modules.write('%s\n' % module)
+
+
+def mounted_filesystems():
+    ''' Set of all current mount points '''
+    with open('/proc/mounts') as mounts:
+        return set(line.split()[1] for line in mounts if line.strip())
 
 
 def filesystem_mounted(fs):
-    return subprocess.call(['grep', '-wqs', fs, '/proc/mounts']) == 0
+    return fs in mounted_filesystems()
+
+
+def _check_output(cmd):
+    try:
+        return subprocess.check_output(cmd, stderr=open(os.devnull, 'w'))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_parallel(commands):
+    '''
+    Run a dict of commands concurrently, returning a dict of their output
+    (None for commands which failed) under the same keys.
+    '''
+    results = {}
+
+    def run(key, cmd):
+        results[key] = _check_output(cmd)
+
+    threads = [threading.Thread(target=run, args=(key, cmd))
+               for key, cmd in commands.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
 
+def _load_json(output):
+    try:
+        return json.loads(output)
+    except (TypeError, ValueError):
+        return None
+
+
+class CephState(object):
+    '''
+    Snapshot of the pools, RBD images, kernel mappings and mounts visible
+    to this unit, and with placement the OSD map and CRUSH rules too.
+    Everything is collected concurrently, once, when the snapshot is
+    taken; the ensure_* steps then work from the snapshot and record their
+    own changes in it rather than probing Ceph again.
+    '''
+
+    def __init__(self, service, pool, placement=False):
+        self.service = service
+        self.pool = pool
+        commands = {
+            'pools': ['ceph', '--id', service, 'osd', 'lspools',
+                      '--format=json'],
+            'images': ['rbd', 'ls', '--id', service, '--pool', pool,
+                       '--format=json'],
+            'mapped': ['rbd', 'showmapped', '--format=json'],
+        }
+        if placement:
+            commands['osd_dump'] = ['ceph', '--id', service, 'osd', 'dump',
+                                    '--format=json']
+            commands['crush_rules'] = ['ceph', '--id', service, 'osd',
+                                       'crush', 'rule', 'dump',
+                                       '--format=json']
+        results = _run_parallel(commands)
+        self.osd_dump = _load_json(results.get('osd_dump'))
+        self.crush_rules = _parse_rules(results.get('crush_rules'))
+        self.pools = self._parse_pools(results['pools'])
+        images = self._parse_images(results['images'])
+        if images is None:
+            # releases without JSON output, or the pool does not exist
+            images = (_check_output(['rbd', 'ls', '--id', service,
+                                     '--pool', pool]) or '').split()
+        self.images = set((pool, image) for image in images)
+        self.mapped = self._parse_mapped(results['mapped'])
+        if self.mapped is None:
+            self.mapped = self._parse_mapped_text(
+                _check_output(['rbd', 'showmapped']))
+        self.mounts = mounted_filesystems()
+
+    @staticmethod
+    def _parse_pools(output):
+        pools = _load_json(output)
+        if pools is None:
+            return set()
+        # [{"poolnum": 0, "poolname": "rbd"}, ...]
+        return set(str(pool['poolname']) for pool in pools)
+
+    @staticmethod
+    def _parse_images(output):
+        images = _load_json(output)
+        if images is None:
+            return None
+        return [str(image) for image in images]
 
-def make_filesystem(blk_device, fstype='ext4'):
+    @staticmethod
+    def _parse_mapped(output):
+        mapped = _load_json(output)
+        if mapped is None:
+            return None
+        # older releases key mappings by id, newer ones return a list
+        if isinstance(mapped, dict):
+            mapped = mapped.values()
+        return dict(((str(m['pool']), str(m['name'])), str(m['device']))
+                    for m in mapped)
+
+    @staticmethod
+    def _parse_mapped_text(output):
+        mapped = {}
+        # columns are: id pool image snap device
+        for line in (output or '').splitlines()[1:]:
+            fields = line.split()
+            if len(fields) == 5:
+                mapped[(fields[1], fields[2])] = fields[4]
+        return mapped
+
+    def pool_exists(self, pool):
+        return pool in self.pools
+
+    def image_exists(self, pool, image):
+        return (pool, image) in self.images
+
+    def image_mapped(self, pool, image):
+        return (pool, image) in self.mapped
+
+    def mapped_device(self, pool, image):
+        return self.mapped.get((pool, image))
+
+    def mounted(self, mount_point):
+        return os.path.normpath(mount_point) in self.mounts
+
+    def placement(self, pool):
+        '''pool_placement of pool, or None if the snapshot was taken
+        without placement'''
+        return _placement(self.osd_dump, self.crush_rules, pool)
+
+
+def has_filesystem(blk_device):
+    ''' Whether blk_device already holds a filesystem '''
+    try:
+        # probe the device itself rather than trusting the blkid cache
+        output = subprocess.check_output(['blkid', '-p', '-o', 'value',
+                                          '-s', 'TYPE', blk_device])
+    except subprocess.CalledProcessError:
+        return False
+    return bool(output.strip())
+
+
+def make_filesystem(blk_device, fstype='ext4', mkfs_options=None):
     utils.juju_log('INFO',
                    'ceph: Formatting block device %s as filesystem %s.' %\
                    (blk_device, fstype))
-    cmd = ['mkfs', '-t', fstype, blk_device]
+    cmd = ['mkfs', '-t', fstype] + list(mkfs_options or []) + [blk_device]
     execute(cmd)
 
 def ensure_ceph_storage(service, pool, rbd_img, sizemb, mount_point,
                         blk_device, fstype, system_services=[],
-                        rbd_pool_replicas=2):
+                        rbd_pool_replicas=2, rbd_pool_share=1.0,
+                        rbd_layout={}, state=None, mkfs_options=None,
+                        clone_from=None, rbd_placement={}):
     """
     Ensures given pool and RBD image exists, is mapped to a block device,
-    and the device is formatted.
+    and the device is formatted. rbd_pool_share is the fraction of the
+    cluster's data the pool is expected to hold. rbd_layout holds the
+    create_rbd_image layout options (order, stripe_unit, stripe_count,
+    features) used if the image has to be created. state is a CephState
+    snapshot to work from; one is taken if not given. mkfs_options are
+    extra mkfs arguments for a new filesystem. clone_from is a (pool,
+    image, snapshot) to clone a missing image from instead of creating an
+    empty one. rbd_placement places a new pool: crush_rule or device_class
+    for the pool itself, and cache_device_class, cache_mode and
+    cache_target_max_bytes for a cache tier in front of it. An existing
+    pool is only checked against an explicit crush_rule, device_class or
+    cache_device_class.
     """
+    explicit = rbd_placement.get('crush_rule') or \
+        rbd_placement.get('device_class') or \
+        rbd_placement.get('cache_device_class')
+    if state is None:
+        state = CephState(service, pool, placement=bool(explicit))
+
+    crush_rule = rbd_placement.get('crush_rule')
+    if not crush_rule and rbd_placement.get('device_class'):
+        crush_rule = device_class_rule(rbd_placement['device_class'])
+    cache_class = rbd_placement.get('cache_device_class')
+    cache_pool = '%s-cache' % pool if cache_class else None
+    cache_mode = rbd_placement.get('cache_mode') or 'writeback'
+
     # Ensure pool, RBD image, RBD mappings are in place.
-    if not pool_exists(service, pool):
+    if not state.pool_exists(pool):
         utils.juju_log('INFO', 'ceph: Creating new pool %s.' % pool)
-        create_pool(service, pool, replicas=rbd_pool_replicas)
-
-    if not rbd_exists(service, pool, rbd_img):
-        utils.juju_log('INFO', 'ceph: Creating RBD image (%s).' % rbd_img)
-        create_rbd_image(service, pool, rbd_img, sizemb)
+        if rbd_placement.get('device_class') and \
+                not rbd_placement.get('crush_rule'):
+            ensure_device_class_rule(service, rbd_placement['device_class'])
+        create_pool(service, pool, replicas=rbd_pool_replicas,
+                    data_share=rbd_pool_share, crush_rule=crush_rule)
+        if cache_pool:
+            create_pool(service, cache_pool, replicas=rbd_pool_replicas,
+                        data_share=CACHE_POOL_SHARE,
+                        crush_rule=ensure_device_class_rule(service,
+                                                            cache_class))
+            add_cache_tier(service, pool, cache_pool, cache_mode,
+                           rbd_placement.get('cache_target_max_bytes'))
+        state.pools.add(pool)
+    elif explicit:
+        # Moving an existing pool rebalances all of its data; leave that to
+        # the operator
+        for problem in check_placement(state.placement(pool), pool,
+                                       crush_rule, cache_pool, cache_mode):
+            utils.juju_log('WARNING', 'ceph: %s' % problem)
+
+    if not state.image_exists(pool, rbd_img):
+        if clone_from:
+            clone_image(service, *(tuple(clone_from) + (pool, rbd_img)))
+        else:
+            utils.juju_log('INFO', 'ceph: Creating RBD image (%s).' % rbd_img)
+            create_rbd_image(service, pool, rbd_img, sizemb, **rbd_layout)
+        state.images.add((pool, rbd_img))
 
-    if not image_mapped(rbd_img):
+    if not state.image_mapped(pool, rbd_img):
         utils.juju_log('INFO', 'ceph: Mapping RBD Image as a Block Device.')
         map_block_storage(service, pool, rbd_img)
-    if not filesystem_mounted(mount_point):
-        make_filesystem(blk_device, fstype)
+        state.mapped[(pool, rbd_img)] = blk_device
+    persist_rbd_mapping(service, pool, rbd_img)
+
+    # Never format a device which already holds data, e.g. after a reboot
+    # where the mount did not come back.
+    if not state.mounted(mount_point):
+        if has_filesystem(blk_device):
+            utils.juju_log('INFO', 'ceph: %s already has a filesystem, '
+                           'not formatting.' % blk_device)
+        else:
+            make_filesystem(blk_device, fstype, mkfs_options)
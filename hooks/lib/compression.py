@@ -0,0 +1,72 @@
+#
+# Gzip compression of Solr responses.
+#
+# Jetty 6 has no GzipHandler for the jetty.xml handler chain; compression
+# is done by its GzipFilter (org.mortbay.servlet.GzipFilter), which has to
+# be declared in a web descriptor. The charm renders a copy of Jetty's
+# webdefault.xml with the filter mapped to every path, and points the
+# WebAppDeployer in jetty.xml at it, so the Solr webapp itself is left
+# untouched. GzipFilter compresses at the JDK's default level (6); the level
+# cannot be changed.
+#
+
+import re
+
+WEBDEFAULT = '/etc/jetty/webdefault.xml'
+CHARM_WEBDEFAULT = '/etc/jetty/webdefault-solr-jetty.xml'
+# What Solr's response writers send: xml, json (text/plain in Solr 1.4 and
+# 3.x), python, ruby, php and csv
+DEFAULT_MIME_TYPES = ('text/xml,application/xml,application/json,'
+                      'text/plain,text/x-python,text/x-ruby,'
+                      'text/x-php,text/csv')
+DEFAULT_MIN_SIZE = 2048
+
+BEGIN = '<!-- solr-jetty: gzip -->'
+END = '<!-- solr-jetty: end gzip -->'
+FILTER = BEGIN + '''
+  <filter>
+    <filter-name>GzipFilter</filter-name>
+    <filter-class>org.mortbay.servlet.GzipFilter</filter-class>
+    <init-param>
+      <param-name>minGzipSize</param-name>
+      <param-value>{min_size}</param-value>
+    </init-param>
+    <init-param>
+      <param-name>mimeTypes</param-name>
+      <param-value>{mime_types}</param-value>
+    </init-param>
+  </filter>
+  <filter-mapping>
+    <filter-name>GzipFilter</filter-name>
+    <url-pattern>/*</url-pattern>
+  </filter-mapping>
+  ''' + END
+BLOCK = re.compile(re.escape(BEGIN) + '.*?' + re.escape(END) + r'\s*',
+                   re.DOTALL)
+
+
+def mime_types(value):
+    '''Comma separated MIME types, without blanks or duplicates'''
+    types = []
+    for mime_type in (value or DEFAULT_MIME_TYPES).split(','):
+        mime_type = mime_type.strip().lower()
+        if mime_type and mime_type not in types:
+            types.append(mime_type)
+    return ','.join(types)
+
+
+def with_filter(webdefault, min_size=DEFAULT_MIN_SIZE, types=None):
+    '''webdefault.xml with the GzipFilter added (or its settings replaced)
+    at the end of the web-app'''
+    webdefault = BLOCK.sub('', webdefault)
+    end = webdefault.rfind('</web-app>')
+    if end < 0:
+        raise ValueError('No </web-app> in the web descriptor')
+    block = FILTER.format(min_size=int(min_size),
+                          mime_types=mime_types(types))
+    return webdefault[:end] + block + '\n' + webdefault[end:]
+
+
+def descriptor(enabled):
+    '''Name of the defaults descriptor for jetty.xml, in jetty.home/etc'''
+    return (CHARM_WEBDEFAULT if enabled else WEBDEFAULT).rsplit('/', 1)[1]
@@ -0,0 +1,84 @@
+#
+# Placement of Solr's transaction log and of the Jetty and GC logs.
+#
+# By default everything lands on the filesystem holding the index: Jetty's
+# NCSA request logs, GC output and, with Solr 4 and later, the update log
+# (tlog). Their appends and fsyncs then contend with index reads. Each of
+# them can be given its own block device, mounted under the volume mount
+# base next to the index volume, or an existing directory (e.g. a mount
+# managed outside the charm):
+#
+#   logs  jetty.logs system property (request logs), -Xloggc, LOGDIR
+#   tlog  solr.ulog.dir system property, used by <updateLog> in
+#         solrconfig.xml
+#
+
+import os
+import re
+from pwd import getpwnam
+
+ROLES = ['tlog', 'logs']
+DEFAULT_LOGS_DIR = '/var/log/jetty'
+MOUNT_BASE = '/srv/juju/volumes'
+ULOG_PROPERTY = 'solr.ulog.dir'
+ULOG_DIR = '<str name="dir">${%s:}</str>' % ULOG_PROPERTY
+
+UPDATE_LOG = re.compile(r'<updateLog\s*/>|<updateLog(\s[^>]*)?>(.*?)'
+                        r'</updateLog>', re.DOTALL)
+DIR_SETTING = re.compile(r'<str\s+name="dir"\s*>.*?</str>', re.DOTALL)
+
+
+def is_device(target):
+    return target.startswith('/dev/')
+
+
+def mountpoint(unit_name, role):
+    return os.path.join(MOUNT_BASE, '{}-{}'.format(
+        unit_name.replace('/', '-'), role))
+
+
+def directory(unit_name, role, target):
+    '''Directory holding role for a target device or directory, or the
+    default (None for the tlog, which then stays under the data directory)'''
+    if not target:
+        return DEFAULT_LOGS_DIR if role == 'logs' else None
+    if is_device(target):
+        return mountpoint(unit_name, role)
+    return target
+
+
+def prepare_dir(path, owner='jetty'):
+    '''Create path if needed and hand it to the Jetty user'''
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    pw = getpwnam(owner)
+    os.chown(path, pw.pw_uid, pw.pw_gid)
+
+
+def wire_update_log(solrconfig):
+    '''
+    solrconfig.xml with the <updateLog> directory taken from the
+    solr.ulog.dir system property, as in the stock Solr 4 config; returns
+    (text, found). Solr versions without an update log have nothing to
+    wire.
+    '''
+    match = UPDATE_LOG.search(solrconfig)
+    if match is None:
+        return solrconfig, False
+    body = match.group(2) or ''
+    if DIR_SETTING.search(body):
+        body = DIR_SETTING.sub(lambda _: ULOG_DIR, body, count=1)
+    else:
+        body = '\n      {}{}'.format(ULOG_DIR, body or '\n    ')
+    element = '<updateLog{}>{}</updateLog>'.format(match.group(1) or '', body)
+    return (solrconfig[:match.start()] + element + solrconfig[match.end():],
+            True)
+
+
+def java_options(logs_dir, tlog_dir=None):
+    '''System properties and GC logging for the placements'''
+    options = ['-Djetty.logs={}'.format(logs_dir),
+               '-Xloggc:{}'.format(os.path.join(logs_dir, 'gc.log'))]
+    if tlog_dir:
+        options.append('-D{}={}'.format(ULOG_PROPERTY, tlog_dir))
+    return options
@@ -0,0 +1,262 @@
+#
+# I/O metrics for the block devices under the Solr data directory.
+#
+# The data directory is followed to the filesystem it lives on and from
+# there through device-mapper (striping, caches) and md layers down to the
+# disks or RBD devices doing the I/O. /proc/diskstats is sampled for all of
+# them at a fixed interval and the derived rates are appended to a ring
+# buffer file of fixed size records, which the CLI and the NRPE check read.
+#
+# Each collector runs for part of a minute. It leaves its last counters
+# beside the ring, and the next one measures from them, so the seconds
+# between two runs are part of its first sample rather than lost.
+#
+
+import json
+import os
+import struct
+import time
+
+DATA_DIR = '/var/lib/solr'
+RING_FILE = '/var/lib/solr-jetty/diskstats'
+DEFAULT_INTERVAL = 10
+# One hour at the default interval for up to four devices
+DEFAULT_SLOTS = 360 * 4
+
+HEADER = struct.Struct('<4sHHII')
+MAGIC = 'DSRB'
+VERSION = 1
+# time, device, then the METRICS
+RECORD = struct.Struct('<d16s7f')
+METRICS = ['r_iops', 'w_iops', 'r_kbps', 'w_kbps', 'queue', 'await_ms',
+           'util']
+
+# /proc/diskstats fields, after major, minor and name
+READS, READS_MERGED, SECTORS_READ, MS_READING = range(4)
+WRITES, WRITES_MERGED, SECTORS_WRITTEN, MS_WRITING = range(4, 8)
+IN_FLIGHT, MS_IO, MS_WEIGHTED = range(8, 11)
+SECTOR_KB = 0.5
+
+CRON_FILE = '/etc/cron.d/solr-jetty-diskstats'
+# Every minute, never two collectors at once
+CRON_JOB = ('* * * * * root /usr/bin/flock -n /run/lock/solr-jetty-diskstats '
+            '{command} --collect --interval {interval} --duration {duration} '
+            '>/dev/null 2>&1\n')
+# How long each collector runs, which bounds the interval
+RUN_SECONDS = 55
+# Older counters (a collector stopped, or the host rebooted since) are not
+# measured from
+BASELINE_MAX_AGE = 120
+
+
+def mount_source(path, mounts='/proc/mounts'):
+    '''Device of the filesystem path lives on, following symlinks'''
+    path = os.path.realpath(path)
+    best = ('', None)
+    with open(mounts) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            mountpoint = fields[1]
+            if (path == mountpoint or
+                    path.startswith(mountpoint.rstrip('/') + '/')) and \
+                    len(mountpoint) > len(best[0]):
+                best = (mountpoint, fields[0])
+    return best[1]
+
+
+def block_devices(device, sys_block='/sys/class/block'):
+    '''
+    Kernel names of device and of every block device under it, e.g.
+    ['dm-2', 'dm-0', 'rbd0', 'dm-1', 'nvme0n1'] for a dm-cache over an RBD
+    image; the device itself comes first.
+    '''
+    if not device or not device.startswith('/dev/'):
+        return []
+    names = []
+    pending = [os.path.basename(os.path.realpath(device))]
+    while pending:
+        name = pending.pop(0)
+        if name in names:
+            continue
+        names.append(name)
+        slaves = os.path.join(sys_block, name, 'slaves')
+        if os.path.isdir(slaves):
+            pending.extend(sorted(os.listdir(slaves)))
+    return names
+
+
+def data_devices(path=DATA_DIR):
+    return block_devices(mount_source(path))
+
+
+def read_diskstats(names=None, path='/proc/diskstats'):
+    '''Map of device name to its counters, for names or all devices'''
+    stats = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 14 or (names and fields[2] not in names):
+                continue
+            stats[fields[2]] = [int(v) for v in fields[3:14]]
+    return stats
+
+
+def derive(before, after, interval):
+    '''Rates over interval seconds between two sets of counters'''
+    delta = [b - a for a, b in zip(before, after)]
+    ios = delta[READS] + delta[WRITES]
+    interval_ms = interval * 1000.0
+    return {
+        'r_iops': delta[READS] / interval,
+        'w_iops': delta[WRITES] / interval,
+        'r_kbps': delta[SECTORS_READ] * SECTOR_KB / interval,
+        'w_kbps': delta[SECTORS_WRITTEN] * SECTOR_KB / interval,
+        # average number of requests queued or in flight
+        'queue': delta[MS_WEIGHTED] / interval_ms,
+        'await_ms': (float(delta[MS_READING] + delta[MS_WRITING]) / ios
+                     if ios else 0.0),
+        'util': min(100.0, delta[MS_IO] * 100.0 / interval_ms),
+    }
+
+
+class RingBuffer(object):
+    '''
+    A file holding the last slots records: a header with the index of the
+    next slot to write, then the slots. Records are written in place, so
+    the file never grows.
+    '''
+
+    def __init__(self, path=RING_FILE, slots=DEFAULT_SLOTS):
+        self.path = path
+        self.slots = slots
+
+    def _create(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.slots, 0))
+            f.write('\0' * RECORD.size * self.slots)
+        os.chmod(self.path, 0644)
+
+    def _header(self, f):
+        magic, version, size, slots, next_slot = HEADER.unpack(
+            f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or size != RECORD.size:
+            raise ValueError('{} is not a diskstats ring buffer'.format(
+                self.path))
+        return slots, next_slot
+
+    def append(self, records):
+        '''Append (time, device, metrics) records'''
+        if not os.path.exists(self.path):
+            self._create()
+        with open(self.path, 'r+b') as f:
+            slots, next_slot = self._header(f)
+            if slots != self.slots:
+                f.close()
+                self._create()
+                return self.append(records)
+            for timestamp, device, metrics in records:
+                f.seek(HEADER.size + next_slot * RECORD.size)
+                f.write(RECORD.pack(timestamp, device[:16],
+                                    *[metrics[m] for m in METRICS]))
+                next_slot = (next_slot + 1) % slots
+            # the header last, so readers never see a slot being written
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, slots,
+                                next_slot))
+
+    def records(self, since=0):
+        '''(time, device, metrics) records newer than since, oldest first'''
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            slots, next_slot = self._header(f)
+            data = f.read(RECORD.size * slots)
+        records = []
+        for n in range(slots):
+            slot = (next_slot + n) % slots
+            fields = RECORD.unpack_from(data, slot * RECORD.size)
+            if fields[0] <= since:
+                continue
+            records.append((fields[0], fields[1].rstrip('\0'),
+                            dict(zip(METRICS, fields[2:]))))
+        return records
+
+
+def load_baseline(path, now, max_age=BASELINE_MAX_AGE):
+    '''(time, counters) the previous collector left at path, or None'''
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except ValueError:
+        return None
+    if not 0 < now - baseline['time'] <= max_age:
+        return None
+    return baseline['time'], baseline['counters']
+
+
+def save_baseline(path, last, counters):
+    with open(path, 'w') as f:
+        json.dump({'time': last, 'counters': counters}, f)
+
+
+def collect(ring, path=DATA_DIR, interval=DEFAULT_INTERVAL, duration=60):
+    '''Sample the devices under path every interval seconds for duration
+    seconds, appending the rates to ring; the first sample starts where
+    the previous collector's last one ended'''
+    devices = data_devices(path)
+    if not devices:
+        return
+    baseline_file = ring.path + '.baseline'
+    start = time.time()
+    deadline = start + duration
+    baseline = load_baseline(baseline_file, start)
+    if baseline is None:
+        before, last = read_diskstats(devices), start
+    else:
+        last, before = baseline
+    while last + interval <= deadline + 0.5:
+        time.sleep(max(0, last + interval - time.time()))
+        after = read_diskstats(devices)
+        now = time.time()
+        ring.append([(now, name, derive(before[name], after[name], now - last))
+                     for name in devices if name in before and name in after])
+        before, last = after, now
+        save_baseline(baseline_file, last, before)
+
+
+def summary(records, device=None):
+    '''Average and maximum of each metric per device'''
+    by_device = {}
+    for _, name, metrics in records:
+        if device and name != device:
+            continue
+        by_device.setdefault(name, []).append(metrics)
+    result = {}
+    for name, samples in by_device.items():
+        result[name] = dict(
+            (metric, (sum(s[metric] for s in samples) / len(samples),
+                      max(s[metric] for s in samples)))
+            for metric in METRICS)
+    return result
+
+
+def configure_collector(command, interval=DEFAULT_INTERVAL):
+    '''Collect samples every interval seconds (up to RUN_SECONDS) with
+    command (the CLI), or stop collecting if interval is 0'''
+    if not interval:
+        if os.path.exists(CRON_FILE):
+            os.remove(CRON_FILE)
+        return
+    if not 0 < interval <= RUN_SECONDS:
+        raise ValueError('Cannot sample every {} seconds in a {} second '
+                         'run'.format(interval, RUN_SECONDS))
+    with open(CRON_FILE, 'w') as cron:
+        cron.write(CRON_JOB.format(command=command, interval=interval,
+                                   duration=RUN_SECONDS))
@@ -0,0 +1,134 @@
+#
+# Helpers for managing the Jetty servlet container that hosts Solr.
+#
+
+import os
+import time
+import urllib2
+
+from charmhelpers.core import hookenv
+from charmhelpers.core import host
+
+import lib.profiler as profiler
+
+JETTY_XML = '/etc/jetty/jetty.xml'
+JETTY_DEFAULT = '/etc/default/jetty'
+SOLR_SCHEMA = '/etc/solr/conf/schema.xml'
+SOLR_CONFIG = '/etc/solr/conf/solrconfig.xml'
+INDEXING_PORT_FILE = '/var/lib/solr-jetty/indexing-port'
+
+JETTY_PORT = 8080
+DEFAULT_INDEXING_MAX_THREADS = 20
+# the minThreads jetty.xml.template gives the indexing connector's pool
+INDEXING_MIN_THREADS = 2
+READY_PATH = '/solr/select?q=test'
+READY_URL = 'http://localhost:%d%s' % (JETTY_PORT, READY_PATH)
+
+DEFAULT_ACCEPTORS = 100
+# Garbage collection gets expensive if the heap is too large
+MAX_DEFAULT_HEAP_MB = 4096
+
+
+def templates_dir():
+    return os.path.join(os.environ.get('CHARM_DIR', ''), 'templates')
+
+
+def render_template(template_name, target, context):
+    '''Render templates/<template_name> to target, replacing each !KEY!
+    marker with the matching value from context'''
+    with open(os.path.join(templates_dir(), template_name)) as template:
+        content = template.read()
+    for key, value in context.items():
+        content = content.replace('!{}!'.format(key), str(value))
+    with open(target, 'w') as rendered:
+        rendered.write(content)
+
+
+def indexing_connector(port, max_threads=DEFAULT_INDEXING_MAX_THREADS):
+    '''Values for the indexing connector placeholders of
+    jetty.xml.template; a port of 0 leaves the connector out'''
+    return {
+        # commented out when disabled
+        'INDEXING-BEGIN': '' if port else '<!--',
+        'INDEXING-END': '' if port else '-->',
+        'INDEXING-PORT': port or JETTY_PORT,
+        'INDEXING-MAX-THREADS': max_threads or DEFAULT_INDEXING_MAX_THREADS,
+    }
+
+
+def valid_indexing_port(port):
+    '''Whether port can serve the indexing connector (0 for none)'''
+    return port == 0 or (0 < port < 65536 and port != JETTY_PORT)
+
+
+def open_indexing_port(port, state_file=INDEXING_PORT_FILE):
+    '''Open the port of the indexing connector, closing the one it
+    replaces; returns whether the port changed'''
+    previous = None
+    if os.path.exists(state_file):
+        with open(state_file) as state:
+            previous = int(state.read())
+    if previous and previous != port:
+        hookenv.close_port(previous)
+    if port:
+        hookenv.open_port(port)
+    if not os.path.isdir(os.path.dirname(state_file)):
+        os.makedirs(os.path.dirname(state_file))
+    with open(state_file, 'w') as state:
+        state.write(str(port))
+    return previous != port
+
+
+def system_memory_mb():
+    with open('/proc/meminfo') as meminfo:
+        for line in meminfo:
+            if line.startswith('MemTotal:'):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+def default_heap_mb():
+    return min(system_memory_mb() / 2, MAX_DEFAULT_HEAP_MB)
+
+
+def running():
+    '''Whether the jsvc process wrapping Jetty is alive'''
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{}/comm'.format(pid)) as comm:
+                if comm.read().strip() == 'jsvc':
+                    return True
+        except IOError:
+            # process exited while we were looking
+            continue
+    return False
+
+
+def responding(url=READY_URL, timeout=5):
+    try:
+        urllib2.urlopen(url, timeout=timeout).read()
+    except Exception:
+        return False
+    return True
+
+
+def start(retries=6, interval=2):
+    '''Start Jetty and wait for Solr to answer queries'''
+    hookenv.log('Starting solr-jetty')
+    started = time.time()
+    host.service_start('jetty')
+    for counter in range(retries + 1):
+        hookenv.log('Waiting for solr-jetty to respond ({})'.format(counter))
+        if responding():
+            profiler.record(profiler.READY, READY_URL, started,
+                            time.time() - started)
+            return True
+        time.sleep(interval)
+    hookenv.log('solr-jetty not responding', hookenv.ERROR)
+    return False
+
+
+def stop():
+    host.service_stop('jetty')
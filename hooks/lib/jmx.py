@@ -0,0 +1,147 @@
+#
+# Resizing Jetty's thread pool and connectors on the running JVM.
+#
+# Jetty registers its components as MBeans (the MBeanContainer in
+# jetty.xml); scripts/JettyJmx.java sets their attributes through the
+# JVM's local JMX connector, so the JVM, and with it Solr's caches, keeps
+# running. Only settings Jetty applies live are resized this way: the
+# number of acceptors, for one, is fixed when the connector starts.
+#
+# MBean ids follow the order of jetty.xml: the server's thread pool is
+# queuedthreadpool id=0 (the indexing connector's own pool is not
+# registered), the query connector is selectchannelconnector id=0 and the
+# indexing connector id=1.
+#
+
+import json
+import os
+import pipes
+import subprocess
+
+HELPER_SOURCE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))), 'scripts',
+    'JettyJmx.java')
+HELPER_DIR = '/var/lib/solr-jetty/jmx'
+JAVA_HOME = '/usr/lib/jvm/default-java'
+CONFIG_FILE = '/var/lib/solr-jetty/config'
+
+THREAD_POOL = 'org.mortbay.thread:type=queuedthreadpool,id=0'
+CONNECTORS = 'org.mortbay.jetty.nio:type=selectchannelconnector,*'
+# config option: (MBeans, attribute) for the settings Jetty takes live
+RUNTIME = {
+    'min-threads': (THREAD_POOL, 'minThreads'),
+    'max-threads': (THREAD_POOL, 'maxThreads'),
+    'max-idle-time-ms': (CONNECTORS, 'maxIdleTime'),
+    'low-resources-connections': (CONNECTORS, 'lowResourcesConnections'),
+    'low-resources-max-idle-ms': (CONNECTORS, 'lowResourcesMaxIdleTime'),
+}
+
+
+class JmxError(Exception):
+    pass
+
+
+def changed(previous, current):
+    '''Config options whose value changed'''
+    keys = set(previous) | set(current)
+    return sorted(key for key in keys
+                  if previous.get(key) != current.get(key))
+
+
+def runtime_only(changes):
+    '''Whether every change can be applied to the running Jetty'''
+    return bool(changes) and all(key in RUNTIME for key in changes)
+
+
+def load_config(path=CONFIG_FILE):
+    '''The config Jetty was last configured with, or None'''
+    if not os.path.exists(path):
+        return None
+    with open(path) as config:
+        return json.load(config)
+
+
+def save_config(config, path=CONFIG_FILE):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        json.dump(dict(config), f)
+
+
+def classpath(java_home=JAVA_HOME):
+    return '{}:{}'.format(HELPER_DIR, os.path.join(java_home, 'lib',
+                                                  'tools.jar'))
+
+
+def build(java_home=JAVA_HOME):
+    '''Compile the helper, unless it is up to date'''
+    target = os.path.join(HELPER_DIR, 'JettyJmx.class')
+    if os.path.exists(target) and \
+            os.path.getmtime(target) >= os.path.getmtime(HELPER_SOURCE):
+        return
+    if not os.path.isdir(HELPER_DIR):
+        os.makedirs(HELPER_DIR)
+    try:
+        subprocess.check_call([os.path.join(java_home, 'bin', 'javac'),
+                               '-cp', classpath(java_home), '-d', HELPER_DIR,
+                               HELPER_SOURCE])
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise JmxError('Could not build the JMX helper: {}'.format(e))
+
+
+def parse(output):
+    '''[(object name, attribute, old value, new value or None)]'''
+    values = []
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) in (3, 4):
+            values.append(tuple(fields) + (None,) * (4 - len(fields)))
+    return values
+
+
+def call(pid, args, user='jetty', java_home=JAVA_HOME):
+    '''Run the helper against the JVM pid, as the user it runs as'''
+    build(java_home)
+    command = ' '.join(pipes.quote(arg) for arg in
+                       [os.path.join(java_home, 'bin', 'java'), '-cp',
+                        classpath(java_home), 'JettyJmx', str(pid)] + args)
+    try:
+        output = subprocess.check_output(['su', '-s', '/bin/sh', '-c',
+                                          command, user])
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise JmxError('JMX call {} failed: {}'.format(' '.join(args), e))
+    return parse(output)
+
+
+def get(pid, option, **kwargs):
+    pattern, attribute = RUNTIME[option]
+    return call(pid, ['get', pattern, attribute], **kwargs)
+
+
+def resize(pid, settings, **kwargs):
+    '''Apply the RUNTIME options in settings to the JVM pid; returns
+    [(object name, attribute, old value, new value)]'''
+    options = sorted(settings, key=lambda option: option != 'min-threads')
+    if 'min-threads' in settings and 'max-threads' in settings and \
+            int(settings['min-threads']) > int(settings['max-threads']):
+        raise JmxError('min-threads is above max-threads')
+    # Jetty refuses a minimum above the maximum and a maximum below the
+    # minimum: lower the minimum first, unless it goes past the current
+    # maximum
+    if 'min-threads' in settings:
+        current_max = max(int(old) for _, _, old, _ in
+                          get(pid, 'max-threads', **kwargs))
+        if int(settings['min-threads']) > current_max:
+            options.sort(key=lambda option: option != 'max-threads')
+    elif 'max-threads' in settings:
+        current_min = max(int(old) for _, _, old, _ in
+                          get(pid, 'min-threads', **kwargs))
+        if int(settings['max-threads']) < current_min:
+            raise JmxError('max-threads is below the current min-threads '
+                           '{}'.format(current_min))
+    changes = []
+    for option in options:
+        pattern, attribute = RUNTIME[option]
+        changes.extend(call(pid, ['set', pattern, attribute,
+                                  str(settings[option])], **kwargs))
+    return changes
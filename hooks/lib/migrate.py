@@ -0,0 +1,208 @@
+#
+# Live migration of the Solr data directory onto new storage.
+#
+# Lucene never modifies a segment file once it is written, so the bulk of an
+# index can be copied while Jetty keeps serving from it. The migration runs
+# in three steps:
+#
+#   1. pre-copy: copy everything with parallel workers while Jetty is up,
+#      then repeat for whatever changed during the first pass;
+#   2. cutover: stop Jetty and copy only the files which changed since,
+#      removing files which were deleted (e.g. merged away segments);
+#   3. swap the new storage in and start Jetty again.
+#
+# Downtime is then the duration of the delta copy rather than of the whole
+# copy.
+#
+
+import errno
+import os
+import shutil
+import stat
+import threading
+import time
+import Queue
+
+from charmhelpers.core import hookenv
+
+import lib.profiler as profiler
+
+DEFAULT_WORKERS = 4
+PRECOPY_PASSES = 2
+# Never removed from the target, even though the source does not have them
+PRESERVED = ['lost+found']
+
+
+def has_data(root):
+    '''Whether root holds anything besides filesystem housekeeping'''
+    return any(name not in PRESERVED for name in os.listdir(root))
+
+
+def manifest(root):
+    '''Map of path (relative to root) to (mode, size, mtime) for everything
+    under root'''
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(path)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    # deleted while we were walking
+                    continue
+                raise
+            entries[os.path.relpath(path, root)] = (st.st_mode, st.st_size,
+                                                    int(st.st_mtime))
+    return entries
+
+
+class Migration(object):
+
+    def __init__(self, source, target, workers=DEFAULT_WORKERS):
+        self.source = source
+        self.target = target
+        self.workers = workers
+
+    def _copy_one(self, rel):
+        src = os.path.join(self.source, rel)
+        dst = os.path.join(self.target, rel)
+        try:
+            st = os.lstat(src)
+            if stat.S_ISLNK(st.st_mode):
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                os.symlink(os.readlink(src), dst)
+            else:
+                shutil.copy2(src, dst)
+            os.lchown(dst, st.st_uid, st.st_gid)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # removed from the source while copying; the next pass or the
+            # cutover deals with it
+        return os.lstat(dst).st_size if os.path.lexists(dst) else 0
+
+    def _copy_parallel(self, paths):
+        '''Copy files with a pool of workers, largest first; returns the
+        number of bytes copied'''
+        queue = Queue.Queue()
+        for rel in paths:
+            queue.put(rel)
+        copied = []
+        errors = []
+
+        def worker():
+            while True:
+                try:
+                    rel = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    copied.append(self._copy_one(rel))
+                except Exception as e:
+                    errors.append((rel, e))
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(min(self.workers, len(paths)) or 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            rel, e = errors[0]
+            raise IOError('Could not copy {}: {}'.format(rel, e))
+        return sum(copied)
+
+    def _make_dirs(self, source_entries):
+        for rel in sorted(source_entries):
+            mode = source_entries[rel][0]
+            if not stat.S_ISDIR(mode):
+                continue
+            dst = os.path.join(self.target, rel)
+            if not os.path.isdir(dst):
+                os.makedirs(dst)
+            src_stat = os.stat(os.path.join(self.source, rel))
+            os.chmod(dst, stat.S_IMODE(mode))
+            os.chown(dst, src_stat.st_uid, src_stat.st_gid)
+
+    def sync(self, delete=False, since=None):
+        '''Copy every file which differs between source and target, or was
+        modified at or after since (mtimes only have a one second
+        resolution here), and return (files, bytes) copied. With delete,
+        files which are no longer in the source are removed from the
+        target as well.'''
+        source_entries = manifest(self.source)
+        target_entries = manifest(self.target)
+        self._make_dirs(source_entries)
+        changed = [rel for rel, entry in source_entries.items()
+                   if not stat.S_ISDIR(entry[0]) and
+                   (target_entries.get(rel) != entry or
+                    (since is not None and entry[2] >= since))]
+        changed.sort(key=lambda rel: source_entries[rel][1], reverse=True)
+        copied = self._copy_parallel(changed)
+        if delete:
+            self._delete_extra(source_entries, target_entries)
+        return len(changed), copied
+
+    def _delete_extra(self, source_entries, target_entries):
+        # deepest first so directories are empty by the time we get there
+        for rel in sorted(target_entries, reverse=True):
+            if rel in source_entries or rel.split(os.sep)[0] in PRESERVED:
+                continue
+            path = os.path.join(self.target, rel)
+            if stat.S_ISDIR(target_entries[rel][0]):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.lexists(path):
+                os.remove(path)
+
+    def precopy(self, passes=PRECOPY_PASSES):
+        '''Copy source to target without stopping anything; returns the
+        time the last pass started'''
+        for n in range(passes):
+            started = int(time.time())
+            files, size = self.sync()
+            hookenv.log('Migration pre-copy pass {}: {} files, {} bytes from '
+                        '{} to {}'.format(n + 1, files, size, self.source,
+                                          self.target))
+            if not files:
+                break
+        return started
+
+
+def swap_in(source, saved, target):
+    '''
+    Make source a symlink to target, keeping the directory it was in saved;
+    returns whether anything changed. Nothing does if source already points
+    at target; a missing source, or a symlink elsewhere, is replaced.
+    '''
+    if os.path.islink(source):
+        if os.path.realpath(source) == os.path.realpath(target):
+            return False
+        os.remove(source)
+    elif os.path.exists(source):
+        if os.path.exists(saved):
+            raise OSError(errno.EEXIST, '{} already exists'.format(saved))
+        os.rename(source, saved)
+    os.symlink(target, source)
+    return True
+
+
+def migrate(source, target, stop, swap, start, workers=DEFAULT_WORKERS):
+    '''
+    Move the data under source to target while the service keeps running
+    from source. stop and start control the service, swap is called while
+    the service is stopped, once target holds an exact copy of source.
+    '''
+    migration = Migration(source, target, workers=workers)
+    with profiler.timed('migrate-precopy'):
+        last_pass = migration.precopy()
+    stopped = time.time()
+    stop()
+    with profiler.timed('migrate-cutover'):
+        files, size = migration.sync(delete=True, since=last_pass)
+        swap()
+    start()
+    hookenv.log('Migrated {} to {}: cutover copied {} files ({} bytes), '
+                'service down for {:.1f}s'.format(source, target, files, size,
+                                                  time.time() - stopped))
@@ -0,0 +1,275 @@
+#
+# Admission control and overload protection.
+#
+# Without it, a traffic spike fills Jetty's thread pool and every request
+# waits in an unbounded queue. Instead:
+#
+#   - Jetty's QoSFilter bounds the requests Solr works on at once, with a
+#     separate limit for /update so indexing can never take the threads
+#     searches need (Jetty 6 cannot prioritise by path without a QoSFilter
+#     subclass; two filter instances do the same job). Requests over a
+#     limit wait without holding a thread, and fail with a 503 after a
+#     while rather than queueing forever;
+#   - the connector's accept queue is bounded;
+#   - search handlers get a default timeAllowed, returning partial results
+#     instead of running on;
+#   - a heap breaker watches the old generation after each full GC and,
+#     when it stays full, rejects new connections from other hosts (so the
+#     load balancer moves traffic elsewhere) until the heap has recovered.
+#
+# Breaker rejections are counted from the firewall rule, QoS rejections
+# from the 503s in the request log.
+#
+
+import json
+import os
+import re
+import subprocess
+import time
+
+STATE_FILE = '/var/lib/solr-jetty/overload'
+CRON_FILE = '/etc/cron.d/solr-jetty-overload'
+CRON_JOB = ('* * * * * root /usr/bin/flock -n /run/lock/solr-jetty-overload '
+            '{command} --watch >/dev/null 2>&1\n')
+RULE_COMMENT = 'solr-jetty-heap-breaker'
+DEFAULT_INTERVAL = 5
+
+BEGIN = '<!-- solr-jetty: qos -->'
+END = '<!-- solr-jetty: end qos -->'
+QOS_FILTER = '''
+  <filter>
+    <filter-name>{name}</filter-name>
+    <filter-class>org.mortbay.servlet.QoSFilter</filter-class>
+    <init-param>
+      <param-name>maxRequests</param-name>
+      <param-value>{max_requests}</param-value>
+    </init-param>
+    <init-param>
+      <param-name>waitMs</param-name>
+      <param-value>{wait_ms}</param-value>
+    </init-param>
+    <init-param>
+      <param-name>suspendMs</param-name>
+      <param-value>{suspend_ms}</param-value>
+    </init-param>
+  </filter>
+  <filter-mapping>
+    <filter-name>{name}</filter-name>
+    <url-pattern>{pattern}</url-pattern>
+  </filter-mapping>'''
+BLOCK = re.compile(re.escape(BEGIN) + '.*?' + re.escape(END) + r'\s*',
+                   re.DOTALL)
+# Paths within the Solr webapp; /x/* also matches /x
+QOS_PATHS = [('SearchQoS', '/select/*'), ('UpdateQoS', '/update/*')]
+
+SEARCH_HANDLERS = ('solr.SearchHandler', 'solr.StandardRequestHandler',
+                   'solr.DisMaxRequestHandler')
+REQUEST_HANDLER = re.compile(r'<requestHandler\b([^>]*?)(/>|>(.*?)'
+                             r'</requestHandler>)', re.DOTALL)
+DEFAULTS = re.compile(r'<lst\s+name="defaults"\s*>(.*?)</lst>', re.DOTALL)
+TIME_ALLOWED = re.compile(r'\s*<int\s+name="timeAllowed"\s*>[^<]*</int>')
+
+
+def with_qos(webdefault, max_search, max_update, wait_ms, suspend_ms):
+    '''webdefault.xml with a QoSFilter for searches and one for updates
+    (limits of 0 leave that path alone)'''
+    webdefault = BLOCK.sub('', webdefault)
+    limits = {'SearchQoS': max_search, 'UpdateQoS': max_update}
+    filters = ''.join(QOS_FILTER.format(name=name, pattern=pattern,
+                                        max_requests=int(limits[name]),
+                                        wait_ms=int(wait_ms),
+                                        suspend_ms=int(suspend_ms))
+                      for name, pattern in QOS_PATHS if limits[name])
+    if not filters:
+        return webdefault
+    end = webdefault.rfind('</web-app>')
+    if end < 0:
+        raise ValueError('No </web-app> in the web descriptor')
+    return webdefault[:end] + BEGIN + filters + '\n  ' + END + '\n' + \
+        webdefault[end:]
+
+
+def _is_search_handler(attributes):
+    match = re.search(r'class="([^"]+)"', attributes)
+    return match is not None and match.group(1) in SEARCH_HANDLERS
+
+
+def with_time_allowed(solrconfig, time_allowed_ms):
+    '''solrconfig.xml with timeAllowed in the defaults of every search
+    handler, or without it if time_allowed_ms is 0'''
+    setting = '<int name="timeAllowed">{}</int>'.format(int(time_allowed_ms))
+
+    def handler(match):
+        attributes, body = match.group(1), match.group(3)
+        if not _is_search_handler(attributes):
+            return match.group(0)
+        body = body or ''
+        defaults = DEFAULTS.search(body)
+        if defaults:
+            inner = TIME_ALLOWED.sub('', defaults.group(1))
+            if time_allowed_ms:
+                inner = '\n       ' + setting + inner
+            body = body[:defaults.start(1)] + inner + body[defaults.end(1):]
+        elif time_allowed_ms:
+            body = '\n    <lst name="defaults">\n       {}\n    </lst>{}' \
+                .format(setting, body or '\n  ')
+        else:
+            return match.group(0)
+        return '<requestHandler{}>{}</requestHandler>'.format(attributes,
+                                                               body)
+    return REQUEST_HANDLER.sub(handler, solrconfig)
+
+
+def jvm_pid():
+    '''Pid of the JVM running Jetty: the jsvc process which dropped root'''
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{}/comm'.format(pid)) as comm:
+                if comm.read().strip() != 'jsvc':
+                    continue
+            if os.stat('/proc/{}'.format(pid)).st_uid != 0:
+                return int(pid)
+        except (IOError, OSError):
+            continue
+    return None
+
+
+def parse_gcutil(output):
+    '''(old generation % used, full GC count) from jstat -gcutil'''
+    lines = output.strip().splitlines()
+    fields = dict(zip(lines[0].split(), lines[-1].split()))
+    return float(fields['O']), int(fields['FGC'])
+
+
+def old_generation(pid, user='jetty'):
+    '''(old generation % used, full GC count) of the JVM pid, as the user
+    it runs as'''
+    output = subprocess.check_output(
+        ['su', '-s', '/bin/sh', '-c', 'jstat -gcutil {}'.format(pid), user])
+    return parse_gcutil(output)
+
+
+def decide(state, old_pct, full_gcs, trip_pct, reset_pct):
+    '''
+    Whether the breaker should be open: it trips when the old generation
+    is still over trip_pct right after a full GC, and resets once it is
+    below reset_pct (it only ever gets there through a GC).
+    '''
+    after_full_gc = state.get('full_gcs') is not None and \
+        full_gcs > state['full_gcs']
+    if state.get('tripped'):
+        return old_pct >= reset_pct
+    return after_full_gc and old_pct >= trip_pct
+
+
+def _iptables(action, port, comment=RULE_COMMENT):
+    return ['iptables', action, 'INPUT', '!', '-i', 'lo', '-p', 'tcp',
+            '--dport', str(port), '--syn', '-m', 'comment', '--comment',
+            comment, '-j', 'REJECT', '--reject-with', 'tcp-reset']
+
+
+def rule_present(port, comment=RULE_COMMENT):
+    return subprocess.call(_iptables('-C', port, comment),
+                           stderr=open(os.devnull, 'w')) == 0
+
+
+def rule_rejections(comment=RULE_COMMENT):
+    '''Connections the breaker rule rejected since it was added'''
+    output = subprocess.check_output(['iptables', '-L', 'INPUT', '-v', '-n',
+                                      '-x'])
+    for line in output.splitlines():
+        if comment in line:
+            return int(line.split()[0])
+    return 0
+
+
+def open_breaker(port, comment=RULE_COMMENT):
+    '''Reject new connections to port from other hosts (the rule is
+    named by comment)'''
+    if not rule_present(port, comment):
+        subprocess.check_call(_iptables('-I', port, comment))
+
+
+def close_breaker(port, comment=RULE_COMMENT):
+    '''Remove the rule; returns the connections it rejected'''
+    if not rule_present(port, comment):
+        return 0
+    rejected = rule_rejections(comment)
+    subprocess.check_call(_iptables('-D', port, comment))
+    return rejected
+
+
+def count_rejections(request_log, offset):
+    '''503s in request_log after offset, and the offset to read from
+    next; starts over on a new file'''
+    if not request_log or not os.path.exists(request_log):
+        return 0, 0
+    if offset > os.path.getsize(request_log):
+        offset = 0
+    with open(request_log) as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind('\n') + 1
+    rejected = len(re.findall(r'" 503 ', data[:end]))
+    return rejected, offset + end
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {'tripped': False, 'trips': 0, 'breaker_rejections': 0,
+                'qos_rejections': 0}
+    with open(STATE_FILE) as state:
+        return json.load(state)
+
+
+def save_state(state):
+    if not os.path.isdir(os.path.dirname(STATE_FILE)):
+        os.makedirs(os.path.dirname(STATE_FILE))
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.rename(tmp, STATE_FILE)
+
+
+def check(state, port, trip_pct, reset_pct, request_log=None, now=None):
+    '''Sample the heap, open or close the breaker and update the metrics
+    in state'''
+    now = now or time.time()
+    log_name = os.path.basename(request_log or '')
+    if state.get('request_log') != log_name:
+        state['request_log'], state['request_log_offset'] = log_name, 0
+    rejected, state['request_log_offset'] = count_rejections(
+        request_log, state.get('request_log_offset', 0))
+    state['qos_rejections'] = state.get('qos_rejections', 0) + rejected
+    state['updated'] = now
+
+    pid = jvm_pid()
+    if pid is None or not trip_pct:
+        if state.get('tripped'):
+            state['breaker_rejections'] += close_breaker(port)
+            state['tripped'] = False
+        state['full_gcs'] = None
+        return state
+    old_pct, full_gcs = old_generation(pid)
+    tripped = decide(state, old_pct, full_gcs, trip_pct, reset_pct)
+    if tripped and not state.get('tripped'):
+        open_breaker(port)
+        state['trips'] = state.get('trips', 0) + 1
+        state['tripped_at'] = now
+    elif state.get('tripped') and not tripped:
+        state['breaker_rejections'] += close_breaker(port)
+    state.update({'tripped': tripped, 'old_pct': old_pct,
+                  'full_gcs': full_gcs})
+    return state
+
+
+def configure_cron(command):
+    '''Watch for overload every minute with command, or stop'''
+    if command is None:
+        if os.path.exists(CRON_FILE):
+            os.remove(CRON_FILE)
+        return
+    with open(CRON_FILE, 'w') as cron:
+        cron.write(CRON_JOB.format(command=command))
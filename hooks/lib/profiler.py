@@ -0,0 +1,147 @@
+#
+# Hook execution profiler.
+#
+# Every command run through subprocess (and commands.getstatusoutput) while a
+# hook executes is timed and recorded along with its exit code. Records are
+# appended to a local timeline file, one compact JSON object per line:
+#
+#   {"t": <start epoch>, "h": <hook>, "k": <kind>, "n": <name>,
+#    "s": <wall seconds>, "rc": <exit code>}
+#
+# where kind is one of 'cmd' (a subprocess), 'op' (a timed block of Python
+# code), 'hook' (a whole hook run) or 'ready' (Solr answered its first query).
+#
+# This module only depends on the standard library so that the timeline CLI
+# can load it without charmhelpers.
+#
+
+import commands
+import json
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+TIMELINE_FILE = '/var/lib/solr-jetty/timeline'
+
+# Commands which are too chatty to be worth recording
+IGNORED_COMMANDS = ['juju-log']
+
+CMD = 'cmd'
+OP = 'op'
+HOOK = 'hook'
+READY = 'ready'
+
+_hook_name = None
+_events = []
+_originals = {}
+_local = threading.local()
+
+
+def _command_name(cmd):
+    if isinstance(cmd, basestring):
+        return cmd
+    return ' '.join(str(arg) for arg in cmd)
+
+
+def record(kind, name, started, elapsed, rc=None):
+    _events.append({'t': round(started, 3), 'h': _hook_name, 'k': kind,
+                    'n': name, 's': round(elapsed, 3), 'rc': rc})
+
+
+def _record_command(cmd, started, rc):
+    name = _command_name(cmd)
+    if name.split(' ', 1)[0] in IGNORED_COMMANDS:
+        return
+    record(CMD, name, started, time.time() - started, rc)
+
+
+def _profiled(func, exit_code):
+    '''Wrap func so that each call is recorded; exit_code maps the value
+    returned by func to the exit code of the command'''
+    def wrapper(*args, **kwargs):
+        # subprocess.check_call is implemented with subprocess.call, so only
+        # the outermost wrapped call in each thread is recorded
+        if getattr(_local, 'active', False):
+            return func(*args, **kwargs)
+        cmd = args[0] if args else kwargs.get('args')
+        started = time.time()
+        rc = 127
+        _local.active = True
+        try:
+            result = func(*args, **kwargs)
+            rc = exit_code(result)
+            return result
+        except subprocess.CalledProcessError as e:
+            rc = e.returncode
+            raise
+        finally:
+            _local.active = False
+            _record_command(cmd, started, rc)
+    return wrapper
+
+
+def install(hook_name):
+    '''Start recording every command run by the current hook'''
+    global _hook_name
+    _hook_name = hook_name
+    if _originals:
+        return
+    _originals['call'] = subprocess.call
+    _originals['check_call'] = subprocess.check_call
+    _originals['check_output'] = subprocess.check_output
+    _originals['getstatusoutput'] = commands.getstatusoutput
+    subprocess.call = _profiled(subprocess.call, lambda rc: rc)
+    subprocess.check_call = _profiled(subprocess.check_call, lambda rc: 0)
+    subprocess.check_output = _profiled(subprocess.check_output,
+                                        lambda output: 0)
+    commands.getstatusoutput = _profiled(
+        commands.getstatusoutput,
+        lambda result: os.WEXITSTATUS(result[0]))
+
+
+def uninstall():
+    if not _originals:
+        return
+    subprocess.call = _originals.pop('call')
+    subprocess.check_call = _originals.pop('check_call')
+    subprocess.check_output = _originals.pop('check_output')
+    commands.getstatusoutput = _originals.pop('getstatusoutput')
+
+
+@contextmanager
+def timed(name):
+    '''Record the wall time of a block of Python code'''
+    started = time.time()
+    try:
+        yield
+    finally:
+        record(OP, name, started, time.time() - started)
+
+
+def flush(path=TIMELINE_FILE):
+    '''Append recorded events to the timeline file'''
+    if not _events:
+        return
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    with open(path, 'a') as timeline:
+        for event in _events:
+            timeline.write(json.dumps(event, separators=(',', ':')) + '\n')
+    del _events[:]
+
+
+def load(path=TIMELINE_FILE):
+    events = []
+    if not os.path.exists(path):
+        return events
+    with open(path) as timeline:
+        for line in timeline:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # a partially written line from an interrupted hook
+                continue
+    return events
@@ -0,0 +1,355 @@
+#
+# Serving the Solr data directory from tmpfs.
+#
+# Small, latency critical indexes (e.g. auto-complete) lose their page cache
+# to merges and log writes under memory pressure. In ramdisk mode
+# /var/lib/solr points at a tmpfs instead, restored from a persistent store
+# (the unit's volume, or a local directory on ephemeral units) before Jetty
+# starts, and checkpointed back to it from cron after every commit and at a
+# fixed interval. The checkpoint runs through juju-run, which serialises it
+# with the hooks restoring or removing the ramdisk.
+#
+# Lucene never rewrites a segment file, so a checkpoint only copies the
+# files which are new since the last one. It copies them before the commit
+# points (segments_N, then segments.gen) that refer to them and removes
+# merged away files last, so the store always holds a complete commit: if
+# the index changes under a checkpoint, the checkpoint is abandoned before
+# its commit point is written and the previous one stays intact. A restart
+# of the unit therefore loses at most what was committed since the last
+# checkpoint.
+#
+
+import errno
+import filecmp
+import json
+import os
+import shutil
+import stat
+import subprocess
+import time
+
+import lib.utils as utils
+
+RAMDISK_BASE = '/srv/juju/ramdisk'
+# Where the data is kept on units without a persistent volume
+LOCAL_STORE = '/var/lib/solr-jetty/ramdisk-store'
+STATE_FILE = '/var/lib/solr-jetty/ramdisk'
+# Under /run, so a reboot (which empties the tmpfs) forgets the restore
+RESTORED_FILE = '/run/solr-jetty/ramdisk-restored'
+DEFAULT_INTERVAL = 5
+
+COMMIT_PREFIX = 'segments'
+COMMIT_GEN = 'segments.gen'
+# Never copied; left to Solr on whichever side it runs
+SKIPPED = ['write.lock']
+TMP_SUFFIX = '.checkpoint-tmp'
+
+CRON_FILE = '/etc/cron.d/solr-jetty-ramdisk'
+
+
+class RamdiskError(Exception):
+    pass
+
+
+class CheckpointAborted(RamdiskError):
+    '''The source changed under a sync before its commit was copied'''
+    pass
+
+
+def mountpoint(unit_name):
+    return os.path.join(RAMDISK_BASE, unit_name.replace('/', '-'))
+
+
+def store(volume_mountpoint, ephemeral):
+    '''Where the ramdisk is checkpointed to'''
+    return LOCAL_STORE if ephemeral else volume_mountpoint
+
+
+def in_use(solr_dir):
+    '''Whether solr_dir points at a ramdisk'''
+    return os.path.islink(solr_dir) and \
+        os.readlink(solr_dir).startswith(RAMDISK_BASE + '/')
+
+
+def restored(path):
+    '''Whether path holds the data restored from the store since boot'''
+    if not os.path.ismount(path) or not os.path.exists(RESTORED_FILE):
+        return False
+    with open(RESTORED_FILE) as marker:
+        return marker.read().strip() == path
+
+
+def is_commit(rel):
+    return os.path.basename(rel).startswith(COMMIT_PREFIX)
+
+
+def manifest(root):
+    '''Map of path (relative to root) to its lstat for everything under
+    root, except for SKIPPED files and unfinished copies'''
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            if name in SKIPPED or name.endswith(TMP_SUFFIX):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                entries[os.path.relpath(path, root)] = os.lstat(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+    return entries
+
+
+def commit_points(root):
+    '''segments_N files under root, which change with every commit'''
+    return sorted(rel for rel, st in manifest(root).items()
+                  if stat.S_ISREG(st.st_mode) and
+                  os.path.basename(rel).startswith(COMMIT_PREFIX + '_'))
+
+
+def data_size(root):
+    return sum(st.st_size for st in manifest(root).values()
+               if stat.S_ISREG(st.st_mode))
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _copy(src, dst, st):
+    '''Copy src to dst through a temporary file, so dst is either the old or
+    the complete new file'''
+    tmp = dst + TMP_SUFFIX
+    try:
+        with open(src, 'rb') as source:
+            with open(tmp, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+                target.flush()
+                os.fsync(target.fileno())
+    except IOError as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if e.errno == errno.ENOENT:
+            raise CheckpointAborted('{} was removed while it was being '
+                                    'copied'.format(src))
+        raise
+    os.chmod(tmp, stat.S_IMODE(st.st_mode))
+    os.chown(tmp, st.st_uid, st.st_gid)
+    os.utime(tmp, (st.st_atime, st.st_mtime))
+    os.rename(tmp, dst)
+    return st.st_size
+
+
+def _changed(rel, src, dst, src_entries, dst_entries):
+    st = src_entries[rel]
+    if rel not in dst_entries:
+        return True
+    if is_commit(rel):
+        # segments.gen is rewritten in place with the same size
+        return not filecmp.cmp(src, dst, shallow=False)
+    return (st.st_size, int(st.st_mtime)) != \
+        (dst_entries[rel].st_size, int(dst_entries[rel].st_mtime))
+
+
+def sync(source, target, delete=True):
+    '''
+    Make target a copy of the index under source, copying only the files
+    which changed; returns (files, bytes) copied. Raises CheckpointAborted,
+    leaving the last commit in target intact, if a file disappears from
+    source before the new commit is copied.
+    '''
+    src_entries = manifest(source)
+    dst_entries = manifest(target)
+    root = os.stat(source)
+    os.chown(target, root.st_uid, root.st_gid)
+    os.chmod(target, stat.S_IMODE(root.st_mode))
+    files = []
+    for rel in sorted(src_entries):
+        st = src_entries[rel]
+        dst = os.path.join(target, rel)
+        if stat.S_ISDIR(st.st_mode):
+            if not os.path.isdir(dst):
+                os.makedirs(dst)
+            os.chown(dst, st.st_uid, st.st_gid)
+            os.chmod(dst, stat.S_IMODE(st.st_mode))
+        elif stat.S_ISREG(st.st_mode):
+            files.append(rel)
+
+    # data first, then segments_N, then segments.gen
+    files.sort(key=lambda rel: (is_commit(rel),
+                                os.path.basename(rel) == COMMIT_GEN, rel))
+    copied = []
+    touched = set()
+    for rel in files:
+        src = os.path.join(source, rel)
+        dst = os.path.join(target, rel)
+        try:
+            if not _changed(rel, src, dst, src_entries, dst_entries):
+                continue
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            raise CheckpointAborted('{} was removed before it was '
+                                    'copied'.format(src))
+        copied.append(_copy(src, dst, src_entries[rel]))
+        touched.add(os.path.dirname(dst))
+    for path in touched:
+        _fsync_dir(path)
+
+    if delete:
+        # deepest first, so directories are empty by the time we get there
+        for rel in sorted(dst_entries, reverse=True):
+            if rel in src_entries:
+                continue
+            path = os.path.join(target, rel)
+            if stat.S_ISDIR(dst_entries[rel].st_mode):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.lexists(path):
+                os.remove(path)
+    return len(copied), sum(copied)
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as state:
+        return json.load(state)
+
+
+def save_state(state):
+    if not os.path.isdir(os.path.dirname(STATE_FILE)):
+        os.makedirs(os.path.dirname(STATE_FILE))
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f)
+
+
+def due(path, interval=DEFAULT_INTERVAL, on_commit=True, now=None):
+    '''Whether a checkpoint of path is due: Solr committed since the last
+    one, or interval minutes have passed'''
+    state = load_state()
+    if 'time' not in state:
+        return True
+    if on_commit and commit_points(path) != state.get('commit'):
+        return True
+    return bool(interval) and \
+        (now or time.time()) - state['time'] >= interval * 60
+
+
+def checkpoint(path, store):
+    '''Copy what changed on the ramdisk at path to store; returns (files,
+    bytes) copied, or None if nothing was checkpointed'''
+    if not restored(path):
+        # e.g. after a reboot: an empty ramdisk must never replace the store
+        utils.juju_log('WARNING', 'ramdisk: {} was not restored from {}, '
+                       'not checkpointing it'.format(path, store))
+        return None
+    if store != LOCAL_STORE and not os.path.ismount(store):
+        utils.juju_log('WARNING', 'ramdisk: volume {} is not mounted, not '
+                       'checkpointing {}'.format(store, path))
+        return None
+    started = time.time()
+    commit = commit_points(path)
+    try:
+        files, size = sync(path, store)
+    except CheckpointAborted as e:
+        # merges are quick on a ramdisk; the next run will catch up
+        utils.juju_log('INFO', 'ramdisk: checkpoint abandoned, {}'.format(e))
+        return None
+    save_state({'time': started, 'commit': commit, 'files': files,
+                'bytes': size})
+    utils.juju_log('INFO', 'ramdisk: checkpointed {} files ({} bytes) from '
+                   '{} to {} in {:.1f}s'.format(files, size, path, store,
+                                                time.time() - started))
+    return files, size
+
+
+def mount_tmpfs(path, size_mb=0):
+    '''Mount a tmpfs of size_mb (0 for half the RAM) at path, or resize the
+    one mounted there. Deliberately not in fstab: it must only be used
+    once it has been restored.'''
+    options = 'noatime,mode=0755'
+    if size_mb:
+        options += ',size={}m'.format(size_mb)
+    if os.path.ismount(path):
+        subprocess.check_call(['mount', '-o', 'remount,' + options, path])
+        return
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    subprocess.check_call(['mount', '-t', 'tmpfs', '-o', options, 'tmpfs',
+                           path])
+
+
+def restore(path, store):
+    '''Copy store to the ramdisk at path, unless it already holds it'''
+    if restored(path):
+        return
+    size = data_size(store)
+    free = os.statvfs(path)
+    if size > free.f_bavail * free.f_frsize + data_size(path):
+        raise RamdiskError('{} holds {}MB, more than the ramdisk at {} '
+                           'can'.format(store, size / 1024 / 1024, path))
+    started = time.time()
+    files, copied = sync(store, path)
+    marker_dir = os.path.dirname(RESTORED_FILE)
+    if not os.path.isdir(marker_dir):
+        os.makedirs(marker_dir)
+    with open(RESTORED_FILE, 'w') as marker:
+        marker.write(path)
+    utils.juju_log('INFO', 'ramdisk: restored {} files ({} bytes) from {} '
+                   'to {} in {:.1f}s'.format(files, copied, store, path,
+                                             time.time() - started))
+
+
+def _point(solr_dir, target):
+    '''Atomically make solr_dir a symlink to target'''
+    tmp = solr_dir + '.ramdisk-tmp'
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(target, tmp)
+    os.rename(tmp, solr_dir)
+
+
+def enable(solr_dir, path, store, size_mb=0):
+    '''Serve solr_dir from a ramdisk at path, kept in store. An ephemeral
+    solr_dir is moved to store first. Jetty must not be running.'''
+    if not os.path.islink(solr_dir):
+        if os.path.exists(store):
+            raise RamdiskError('Both {} and {} exist, not replacing '
+                               'either'.format(solr_dir, store))
+        if not os.path.isdir(os.path.dirname(store)):
+            os.makedirs(os.path.dirname(store))
+        shutil.move(solr_dir, store)
+    mount_tmpfs(path, size_mb)
+    restore(path, store)
+    _point(solr_dir, path)
+
+
+def disable(solr_dir, path, store, ephemeral):
+    '''Checkpoint the ramdisk at path a last time and serve solr_dir from
+    store again. Jetty must not be running.'''
+    if restored(path) and checkpoint(path, store) is None:
+        raise RamdiskError('Could not checkpoint {} to {}, not removing '
+                           'it'.format(path, store))
+    if ephemeral:
+        os.remove(solr_dir)
+        shutil.move(store, solr_dir)
+    else:
+        _point(solr_dir, store)
+    if os.path.ismount(path):
+        subprocess.check_call(['umount', path])
+    if os.path.exists(RESTORED_FILE):
+        os.remove(RESTORED_FILE)
+
+
+def configure_cron(unit, command, interval=DEFAULT_INTERVAL,
+                   on_commit=True):
+    '''Run the checkpoint command as unit every minute when checkpointing
+    on commit (it only copies anything once Solr has committed or interval
+    minutes have passed), every interval minutes otherwise, or never if
+    both are off'''
+    utils.configure_cron(CRON_FILE, unit, command,
+                         1 if on_commit else interval)
@@ -0,0 +1,278 @@
+#
+# Request logging.
+#
+# Jetty 6's NCSARequestLog writes one line per request from the request
+# thread, and has no asynchronous or sampling mode. The charm keeps that
+# write as cheap as it gets (a buffered append, never fsynced, to the logs
+# directory) and does everything else off the request path, from cron:
+#
+#   - in the "json" format, or when sampling, the new lines of Jetty's daily
+#     yyyy_mm_dd.request.log are sampled and written to
+#     yyyy_mm_dd.request.json as JSON lines, joined with the QTime and hits
+#     Solr logs for the same request (or to yyyy_mm_dd.request.sampled.log
+#     in the NCSA format); the raw file is removed once its day is over and
+#     it has been read to the end;
+#   - files of past days are gzipped, and removed after the retention
+#     period.
+#
+
+import calendar
+import gzip
+import json
+import os
+import random
+import re
+import shutil
+import time
+import urllib
+
+STATE_FILE = '/var/lib/solr-jetty/request-log'
+FORMATS = ['ncsa', 'json']
+DEFAULT_RETENTION_DAYS = 90
+# Solr entries waiting for their request line, which is only written once
+# the response is complete
+MAX_PENDING = 10000
+
+CRON_FILE = '/etc/cron.d/solr-jetty-request-log'
+CRON_JOB = ('* * * * * root /usr/bin/flock -n '
+            '/run/lock/solr-jetty-request-log {command} >/dev/null 2>&1\n')
+
+DAILY_FILE = re.compile(r'^(\d{4})_(\d{2})_(\d{2})\.request\.'
+                        r'(log|sampled\.log|json)(\.gz)?$')
+OUTPUT_SUFFIX = {'json': 'json', 'ncsa': 'sampled.log'}
+# Jetty 6 NCSA format, with the extended fields and latency (ms) optional
+NCSA_LINE = re.compile(
+    r'^(?P<client>\S+) +\S+ +(?P<user>\S+) +\[(?P<time>[^\]]+)\] '
+    r'"(?P<method>\S+) (?P<uri>\S+)(?: (?P<protocol>[^"]*))?" '
+    r'(?P<status>\d{3}) +(?P<bytes>\S+)'
+    r'(?: +"(?P<referer>[^"]*)" +"(?P<agent>[^"]*)")?'
+    r'(?: +(?P<latency>\d+))?\s*$')
+SOLR_LINE = re.compile(
+    r'webapp=(?P<webapp>\S+) path=(?P<path>\S+) params=\{(?P<params>.*?)\}'
+    r'(?: hits=(?P<hits>\d+))? status=(?P<status>\d+) QTime=(?P<qtime>\d+)')
+
+
+def jetty_settings(enabled=True, format='ncsa',
+                   retention_days=DEFAULT_RETENTION_DAYS):
+    '''Values for the request log placeholders of jetty.xml.template'''
+    return {
+        # commented out when disabled
+        'REQUEST-LOG-BEGIN': '' if enabled else '<!--',
+        'REQUEST-LOG-END': '' if enabled else '-->',
+        'REQUEST-LOG-RETAIN-DAYS': retention_days,
+        'REQUEST-LOG-EXTENDED': str(format == 'json').lower(),
+        'REQUEST-LOG-LATENCY': str(format == 'json').lower(),
+    }
+
+
+def converting(format, sample_rate):
+    '''Whether Jetty's request logs are rewritten rather than kept'''
+    return format == 'json' or sample_rate < 1
+
+
+def parse_request(line):
+    '''Fields of an NCSA request log line, or None'''
+    match = NCSA_LINE.match(line)
+    if match is None:
+        return None
+    fields = match.groupdict()
+    path, _, query = fields['uri'].partition('?')
+    record = {
+        'time': fields['time'],
+        'client': fields['client'],
+        'method': fields['method'],
+        'path': path,
+        'query': query,
+        'status': int(fields['status']),
+        'bytes': int(fields['bytes']) if fields['bytes'].isdigit() else 0,
+        'latency_ms': int(fields['latency']) if fields['latency'] else None,
+        'qtime_ms': None,
+        'hits': None,
+    }
+    if fields['agent'] is not None:
+        record['referer'] = fields['referer']
+        record['agent'] = fields['agent']
+    return record
+
+
+def parse_solr(line):
+    '''(key, qtime, hits) of a Solr request log line, or None'''
+    match = SOLR_LINE.search(line)
+    if match is None:
+        return None
+    fields = match.groupdict()
+    key = request_key(fields['webapp'] + fields['path'], fields['params'])
+    return (key, int(fields['qtime']),
+            int(fields['hits']) if fields['hits'] else None)
+
+
+def request_key(path, query):
+    '''Path and parameters of a request, whatever their order and
+    encoding'''
+    params = sorted(tuple(urllib.unquote_plus(part).split('=', 1))
+                    for part in query.split('&') if part)
+    return path.rstrip('/'), tuple(params)
+
+
+def join(records, solr_entries):
+    '''Add Solr's QTime and hits to the request records, matching requests
+    in order; returns the Solr entries left unmatched'''
+    queues = {}
+    for entry in solr_entries:
+        queues.setdefault(entry[0], []).append(entry)
+    for record in records:
+        queue = queues.get(request_key(record['path'], record['query']))
+        if queue:
+            _, record['qtime_ms'], record['hits'] = queue.pop(0)
+    return [entry for queue in queues.values() for entry in queue]
+
+
+def sampled(record, sample_rate, rand=random.random):
+    '''Keep sample_rate of the requests, and every server error'''
+    return sample_rate >= 1 or record['status'] >= 500 or \
+        rand() < sample_rate
+
+
+def format_record(record, format):
+    if format == 'json':
+        return json.dumps(record, sort_keys=True, separators=(',', ':'))
+    uri = record['path'] + ('?' + record['query'] if record['query'] else '')
+    return '{} - - [{}] "{} {}" {} {}'.format(
+        record['client'], record['time'], record['method'], uri,
+        record['status'], record['bytes'])
+
+
+def load_state(path=None):
+    path = path or STATE_FILE
+    if not os.path.exists(path):
+        return {'offsets': {}, 'solr': None, 'pending': []}
+    with open(path) as state:
+        return json.load(state)
+
+
+def save_state(state, path=None):
+    path = path or STATE_FILE
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.rename(tmp, path)
+
+
+def _thaw(entry):
+    '''A Solr entry as saved in the (JSON) state'''
+    (path, params), qtime, hits = entry
+    return (path, tuple(tuple(param) for param in params)), qtime, hits
+
+
+def read_new_lines(path, offset):
+    '''Complete lines of path after offset, and the offset after them'''
+    with open(path) as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind('\n') + 1
+    return data[:end].splitlines(), offset + end
+
+
+def read_solr_log(path, position):
+    '''New Solr entries in path since position ([inode, offset]), and the
+    new position; starts over when the log was rotated or truncated'''
+    if not path or not os.path.exists(path):
+        return [], None
+    st = os.stat(path)
+    inode, offset = position or (st.st_ino, st.st_size)
+    if inode != st.st_ino or offset > st.st_size:
+        offset = 0
+    lines, offset = read_new_lines(path, offset)
+    entries = [entry for entry in map(parse_solr, lines) if entry]
+    return entries, [st.st_ino, offset]
+
+
+def day_of(name):
+    '''Epoch of the (GMT) day a daily log file is for, or None'''
+    match = DAILY_FILE.match(name)
+    if match is None:
+        return None
+    return calendar.timegm(time.strptime('-'.join(match.groups()[:3]),
+                                         '%Y-%m-%d'))
+
+
+def today(now=None):
+    return time.strftime('%Y_%m_%d', time.gmtime(now or time.time()))
+
+
+def convert(logs_dir, format='json', sample_rate=1.0, solr_log=None,
+            state=None, now=None, rand=random.random):
+    '''
+    Sample and convert what Jetty logged since the last run, updating
+    state; returns the number of records written. Raw logs of past days
+    found on the first run are left alone.
+    '''
+    state = state if state is not None else load_state()
+    solr_entries, state['solr'] = read_solr_log(solr_log, state['solr'])
+    solr_entries = [_thaw(entry) for entry in state['pending']] + \
+        solr_entries
+    current = today(now)
+    written = 0
+    for name in sorted(os.listdir(logs_dir)):
+        match = DAILY_FILE.match(name)
+        if match is None or match.group(4) != 'log' or match.group(5) or \
+                (name not in state['offsets'] and name < current):
+            continue
+        raw = os.path.join(logs_dir, name)
+        lines, offset = read_new_lines(raw, state['offsets'].get(name, 0))
+        records = [record for record in map(parse_request, lines) if record]
+        solr_entries = join(records, solr_entries)
+        records = [record for record in records
+                   if sampled(record, sample_rate, rand)]
+        if records:
+            out = os.path.join(logs_dir, name.replace(
+                '.log', '.' + OUTPUT_SUFFIX[format]))
+            with open(out, 'a') as f:
+                for record in records:
+                    f.write(format_record(record, format) + '\n')
+            written += len(records)
+        state['offsets'][name] = offset
+        if not name.startswith(current) and offset >= os.path.getsize(raw):
+            # Jetty has moved on to a newer file
+            os.remove(raw)
+            del state['offsets'][name]
+    state['pending'] = solr_entries[-MAX_PENDING:]
+    return written
+
+
+def compress(path):
+    with open(path, 'rb') as source:
+        with gzip.open(path + '.gz', 'wb') as target:
+            shutil.copyfileobj(source, target)
+    shutil.copystat(path, path + '.gz')
+    os.remove(path)
+
+
+def rotate(logs_dir, retention_days=DEFAULT_RETENTION_DAYS,
+           compressed=True, converting=(), now=None):
+    '''Compress the logs of past days, except for the raw logs still being
+    converted, and remove those older than retention_days'''
+    now = now or time.time()
+    current = today(now)
+    for name in os.listdir(logs_dir):
+        day = day_of(name)
+        if day is None or name.startswith(current):
+            continue
+        path = os.path.join(logs_dir, name)
+        if retention_days and now - day > (retention_days + 1) * 86400:
+            os.remove(path)
+        elif compressed and not name.endswith('.gz') and \
+                name not in converting:
+            compress(path)
+
+
+def configure_cron(command):
+    '''Process the request logs every minute with command, or stop'''
+    if command is None:
+        if os.path.exists(CRON_FILE):
+            os.remove(CRON_FILE)
+        return
+    with open(CRON_FILE, 'w') as cron:
+        cron.write(CRON_JOB.format(command=command))
@@ -0,0 +1,149 @@
+#
+# Rolling restarts of Jetty across the units of the service.
+#
+# A unit which needs a restart publishes a restart-request token (its
+# request time) on the cluster peer relation, and the same token as
+# restart-done once it is serving again. Units with a request not yet done
+# are queued by request time, then unit number; each one restarts when it
+# is among the first max_down of the queue. As relation data is only
+# published when a hook ends, a unit's request stays outstanding to its
+# peers until it is done. Requests are left to settle for a minute first,
+# so that the ones all units make together (after a juju set) have been
+# seen everywhere before anyone acts on them.
+#
+# A unit takes its turn in two runs. The first withdraws it from its
+# frontends (lib/advertise.py), which only hear of it once the run ends.
+# The next one drains: new connections from other hosts are rejected and
+# established ones are given time to finish. After restarting, the unit
+# warms Solr's caches with a few queries before it is advertised again.
+#
+
+import json
+import os
+import time
+import urllib2
+
+import lib.overload as overload
+import lib.utils as utils
+
+STATE_FILE = '/var/lib/solr-jetty/restart'
+CRON_FILE = '/etc/cron.d/solr-jetty-rolling-restart'
+DRAIN_COMMENT = 'solr-jetty-drain'
+SETTLE_SECONDS = 60
+WARMUP_URL = 'http://localhost:{port}/solr/select?{query}'
+TCP_TABLES = ['/proc/net/tcp', '/proc/net/tcp6']
+ESTABLISHED = '01'
+IPV6_LOOPBACK = '00000000000000000000000001000000'
+IPV4_MAPPED = '0000000000000000FFFF0000'
+
+
+def token(now=None):
+    return '{:.3f}'.format(now or time.time())
+
+
+def pending(settings):
+    '''Whether relation settings (or the local state) have a restart
+    request which is not done'''
+    request = settings.get('restart-request')
+    return bool(request) and request != settings.get('restart-done')
+
+
+def queue(units):
+    '''Units with a pending restart, in the order they restart in; units
+    maps unit names to their relation settings'''
+    def order(unit):
+        return (float(units[unit]['restart-request']),
+                int(unit.split('/')[1]))
+    return sorted((unit for unit in units if pending(units[unit])),
+                  key=order)
+
+
+def may_restart(unit, units, max_down, now=None, settle=SETTLE_SECONDS):
+    '''Whether unit can restart now'''
+    own = units[unit]
+    if not pending(own):
+        return False
+    if (now or time.time()) - float(own['restart-request']) < settle:
+        return False
+    return queue(units).index(unit) < max_down
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as state:
+        return json.load(state)
+
+
+def save_state(state):
+    if not os.path.isdir(os.path.dirname(STATE_FILE)):
+        os.makedirs(os.path.dirname(STATE_FILE))
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f)
+
+
+def _is_loopback(address):
+    if len(address) == 8:
+        # little-endian: the first octet comes last
+        return address[-2:] == '7F'
+    return address == IPV6_LOOPBACK or \
+        (address.startswith(IPV4_MAPPED) and address[-2:] == '7F')
+
+
+def established(ports, tables=TCP_TABLES):
+    '''Connections from other hosts established to any of ports'''
+    count = 0
+    for table in tables:
+        if not os.path.exists(table):
+            continue
+        with open(table) as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                local_port = int(fields[1].split(':')[1], 16)
+                remote = fields[2].split(':')[0]
+                if fields[3] == ESTABLISHED and local_port in ports and \
+                        not _is_loopback(remote):
+                    count += 1
+    return count
+
+
+def drain(ports, timeout, interval=1, count=established, sleep=time.sleep,
+          clock=time.time):
+    '''Reject new connections to ports from other hosts and wait up to
+    timeout seconds for the established ones to close; returns how many
+    are left'''
+    for port in ports:
+        overload.open_breaker(port, DRAIN_COMMENT)
+    deadline = clock() + timeout
+    left = count(ports)
+    while left and clock() < deadline:
+        sleep(interval)
+        left = count(ports)
+    return left
+
+
+def undrain(ports):
+    for port in ports:
+        overload.close_breaker(port, DRAIN_COMMENT)
+
+
+def warm_up(queries, port, timeout=60):
+    '''Run the warm-up queries against the local Solr; returns how many
+    failed'''
+    failed = 0
+    for query in queries.split():
+        url = WARMUP_URL.format(port=port, query=query)
+        try:
+            urllib2.urlopen(url, timeout=timeout).read()
+        except Exception as e:
+            utils.juju_log('WARNING', 'Warm-up query {} failed: {}'.format(
+                query, e))
+            failed += 1
+    return failed
+
+
+def configure_cron(unit, command):
+    '''Check every minute whether unit can take its turn, or stop (command
+    None)'''
+    utils.configure_cron(CRON_FILE, unit, command, 1 if command else 0)
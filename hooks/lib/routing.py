@@ -0,0 +1,62 @@
+#
+# How the haproxy frontend on the website relation spreads queries.
+#
+# By default the unit only gives haproxy its hostname and port, and
+# haproxy balances round-robin: with N replicas each unit's Solr caches
+# see a random 1/N of the repeated queries. In cache-affinity mode the unit
+# sends haproxy a service definition instead (the services setting of the
+# haproxy charm), in which queries are hashed on the q parameter (or the
+# whole URI, haproxy 1.6 and later) onto a consistent hash ring, so the
+# same query keeps landing on the same unit. The parameter hash does not
+# depend on the order of the other parameters. hash-balance-factor bounds
+# the load: a unit with more than factor% of the average load in flight is
+# skipped for the next one on the ring. It needs haproxy 1.7, so it is off
+# by default and the default options work with haproxy 1.4. Health checks
+# take failed units out of the ring, which moves their share of the
+# queries to the remaining units, and requests that cannot connect are
+# redispatched.
+#
+# Every unit sends the same options and its own server; haproxy merges
+# the servers of a service.
+#
+
+import json
+
+MODES = ['round-robin', 'cache-affinity']
+HASH_KEYS = {
+    # parameter hashing works on haproxy 1.4 and later
+    'q': 'balance url_param q check_post',
+    # the whole path and query string needs haproxy 1.6
+    'uri': 'balance uri whole',
+}
+# unbounded, which haproxy 1.4 and later understand
+DEFAULT_BALANCE_FACTOR = 0
+FRONTEND_PORT = 80
+SERVER_OPTIONS = 'check inter 2000 rise 2 fall 3'
+
+
+def service_options(hash_key='q', balance_factor=DEFAULT_BALANCE_FACTOR,
+                    check_path='/solr/select?q=test'):
+    '''haproxy options of a cache-affinity service'''
+    if hash_key not in HASH_KEYS:
+        raise ValueError('Unknown routing hash key {}'.format(hash_key))
+    options = [HASH_KEYS[hash_key], 'hash-type consistent']
+    if balance_factor:
+        # haproxy 1.7 and later
+        options.append('hash-balance-factor {}'.format(int(balance_factor)))
+    options.extend(['option httpchk GET {}'.format(check_path),
+                    'option redispatch', 'retries 3'])
+    return options
+
+
+def services(service_name, unit_name, address, port, **kwargs):
+    '''The services setting for the haproxy charm, as YAML (in JSON's flow
+    style, which YAML parsers read)'''
+    return json.dumps([{
+        'service_name': service_name,
+        'service_host': '0.0.0.0',
+        'service_port': FRONTEND_PORT,
+        'service_options': service_options(**kwargs),
+        'servers': [[unit_name.replace('/', '-'), address, port,
+                     SERVER_OPTIONS]],
+    }])
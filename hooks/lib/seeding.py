@@ -0,0 +1,112 @@
+#
+# Seeding new units from copy-on-write clones of the indexing unit's image.
+#
+# The indexing unit periodically commits Solr, freezes the filesystem on its
+# RBD image just long enough to take a snapshot of it, and protects the
+# snapshot. Replica units clone the most recent snapshot instead of starting
+# from an empty image: the clone shares every object with its parent until
+# it is written to, so a new unit serves the full index as soon as the clone
+# is mapped and mounted, without copying or re-indexing anything.
+#
+# Cloning needs the indexing image to be a format 2 image with the
+# layering feature (rbd-features=layering).
+#
+
+import contextlib
+import subprocess
+import time
+import urllib2
+
+import lib.ceph_utils as ceph
+import lib.utils as utils
+
+SNAPSHOT_PREFIX = 'seed-'
+DEFAULT_KEEP = 3
+CRON_FILE = '/etc/cron.d/solr-jetty-seed-snapshot'
+COMMIT_URL = 'http://localhost:8080/solr/update'
+COMMIT_TIMEOUT = 300
+
+
+def parse_source(source):
+    '''(pool, image) from a pool/image clone source'''
+    try:
+        pool, image = source.strip().split('/')
+    except ValueError:
+        raise ValueError('Clone source {} is not pool/image'.format(source))
+    return pool, image
+
+
+def image_name(rbd_name, unit_id, clone_source=None):
+    '''Name of the unit's RBD image. Clones are per unit: several units can
+    map one image, but never mount it read-write at the same time.'''
+    if clone_source:
+        return '{}-{}'.format(rbd_name, unit_id)
+    return rbd_name
+
+
+def seed_snapshots(service, pool, image):
+    return [snap for snap in ceph.list_snapshots(service, pool, image)
+            if snap.startswith(SNAPSHOT_PREFIX)]
+
+
+def latest_seed(service, pool, image):
+    '''The most recent seed snapshot of pool/image, or None'''
+    snaps = seed_snapshots(service, pool, image)
+    return snaps[-1] if snaps else None
+
+
+def solr_commit(url=COMMIT_URL, timeout=COMMIT_TIMEOUT):
+    '''Ask Solr to commit, so that the index on disk is complete'''
+    request = urllib2.Request(url, '<commit/>',
+                              {'Content-Type': 'text/xml; charset=utf-8'})
+    urllib2.urlopen(request, timeout=timeout).read()
+
+
+@contextlib.contextmanager
+def frozen(mountpoint):
+    '''Block writes to mountpoint, with everything written so far on disk'''
+    subprocess.check_call(['fsfreeze', '--freeze', mountpoint])
+    try:
+        yield
+    finally:
+        subprocess.check_call(['fsfreeze', '--unfreeze', mountpoint])
+
+
+def take_snapshot(service, pool, image, mountpoint, keep=DEFAULT_KEEP,
+                  now=None):
+    '''Take and protect a consistent seed snapshot of pool/image, mounted
+    at mountpoint, then prune old ones; returns the snapshot name'''
+    snap = SNAPSHOT_PREFIX + time.strftime('%Y%m%d%H%M%S',
+                                           time.gmtime(now or time.time()))
+    try:
+        solr_commit()
+    except Exception as e:
+        utils.juju_log('WARNING', 'seed: Solr commit failed ({}), '
+                       'snapshotting what is on disk'.format(e))
+    started = time.time()
+    with frozen(mountpoint):
+        ceph.create_snapshot(service, pool, image, snap, protect=False)
+    frozen_for = time.time() - started
+    # protecting the snapshot does not need writes blocked
+    ceph.protect_snapshot(service, pool, image, snap)
+    utils.juju_log('INFO', 'seed: Took snapshot {}/{}@{}, writes blocked '
+                   'for {:.2f}s'.format(pool, image, snap, frozen_for))
+    prune(service, pool, image, keep)
+    return snap
+
+
+def prune(service, pool, image, keep=DEFAULT_KEEP):
+    '''Remove all but the keep most recent seed snapshots, except for those
+    which clones still depend on'''
+    snaps = seed_snapshots(service, pool, image)
+    for snap in snaps[:-keep] if keep else snaps:
+        children = ceph.snapshot_children(service, pool, image, snap)
+        if children:
+            utils.juju_log('INFO', 'seed: Keeping {}, {} is cloned from '
+                           'it'.format(snap, ', '.join(children)))
+            continue
+        ceph.remove_snapshot(service, pool, image, snap)
+
+
+def configure_cron(unit, command, minutes):
+    utils.configure_cron(CRON_FILE, unit, command, minutes)
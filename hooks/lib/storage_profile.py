@@ -0,0 +1,156 @@
+#
+# Block device and filesystem tuning for Solr volumes.
+#
+# A Solr index is a handful of large, write-once segment files that are
+# read randomly at query time and sequentially during merges. The profile
+# below formats volumes accordingly (few inodes, no reserved blocks, lazy
+# initialisation so mkfs returns quickly on thin-provisioned RBD images),
+# mounts them without atime updates and tunes the readahead and I/O
+# scheduler of the underlying block device.
+#
+
+import os
+import subprocess
+
+from charmhelpers.contrib.charmsupport import volumes
+from charmhelpers.core import hookenv
+from charmhelpers.core import host
+
+from lib import striping
+
+FILESYSTEMS = ['ext4', 'xfs']
+
+MKFS_OPTIONS = {
+    # one inode per MB: segment files are large and few, no root-reserved
+    # blocks, lazy inode table/journal init and no up-front discard
+    'ext4': ['-m', '0', '-i', '1048576',
+             '-E', 'lazy_itable_init=1,lazy_journal_init=1,nodiscard'],
+    # skip the up-front discard of the whole device
+    'xfs': ['-K'],
+}
+
+FSTRIM_CRON = '/etc/cron.d/solr-jetty-fstrim'
+SYS_CLASS_BLOCK = '/sys/class/block'
+SYS_BLOCK = '/sys/block'
+FSTRIM_CRON_ENTRY = '{minute} 3 * * * root /sbin/fstrim {mountpoint}\n'
+
+
+def profile():
+    '''The storage profile requested by the charm config'''
+    config = hookenv.config()
+    fstype = config.get('volume-filesystem') or 'ext4'
+    if fstype not in FILESYSTEMS:
+        hookenv.log('Unsupported volume-filesystem {}, using ext4'.format(
+            fstype), hookenv.WARNING)
+        fstype = 'ext4'
+    return {
+        'filesystem': fstype,
+        'mount_options': config.get('volume-mount-options') or 'noatime',
+        'fstrim': config.get('volume-fstrim'),
+        'readahead_kb': config.get('volume-readahead-kb'),
+        'io_scheduler': config.get('volume-io-scheduler'),
+    }
+
+
+def ensure_tools(fstype):
+    if fstype == 'xfs' and not os.path.exists('/sbin/mkfs.xfs'):
+        host.apt_install(['xfsprogs'], fatal=True)
+
+
+def mkfs_command(device, fstype):
+    return ['mkfs', '-t', fstype] + MKFS_OPTIONS.get(fstype, []) + [device]
+
+
+def device_for_mount(mountpoint):
+    '''The device mounted at mountpoint, or None'''
+    return dict(host.mounts()).get(mountpoint)
+
+
+def block_device_name(device):
+    '''
+    Kernel name of the whole block device backing device, following udev
+    symlinks (/dev/rbd/<pool>/<image>) and mapping partitions to their
+    parent disk (vdb1 to vdb).
+    '''
+    name = os.path.basename(os.path.realpath(device))
+    sys_path = os.path.realpath(os.path.join(SYS_CLASS_BLOCK, name))
+    if os.path.exists(os.path.join(sys_path, 'partition')):
+        name = os.path.basename(os.path.dirname(sys_path))
+    return name
+
+
+def _write_queue_setting(name, setting, value):
+    path = os.path.join(SYS_BLOCK, name, 'queue', setting)
+    if not os.path.exists(path):
+        hookenv.log('{} does not support {}'.format(name, setting),
+                    hookenv.WARNING)
+        return False
+    try:
+        with open(path, 'w') as queue:
+            queue.write(str(value))
+    except IOError as e:
+        hookenv.log('Could not set {} of {} to {}: {}'.format(
+            setting, name, value, e), hookenv.WARNING)
+        return False
+    return True
+
+
+def tune_device(device, readahead_kb=None, io_scheduler=None):
+    '''Apply readahead and I/O scheduler settings to device. These do not
+    survive a reboot; config-changed re-applies them when the unit agent
+    restarts.'''
+    name = block_device_name(device)
+    if readahead_kb:
+        if _write_queue_setting(name, 'read_ahead_kb', readahead_kb):
+            hookenv.log('Set readahead of {} to {}KB'.format(name,
+                                                             readahead_kb))
+    if io_scheduler:
+        if _write_queue_setting(name, 'scheduler', io_scheduler):
+            hookenv.log('Set I/O scheduler of {} to {}'.format(name,
+                                                               io_scheduler))
+
+
+def configure_fstrim(mountpoint, enabled):
+    '''Schedule a nightly fstrim of mountpoint, or remove the schedule'''
+    if not enabled:
+        if os.path.exists(FSTRIM_CRON):
+            os.remove(FSTRIM_CRON)
+        return
+    # spread units sharing a Ceph cluster over the hour
+    minute = sum(ord(c) for c in hookenv.local_unit()) % 60
+    with open(FSTRIM_CRON, 'w') as cron:
+        cron.write(FSTRIM_CRON_ENTRY.format(minute=minute,
+                                            mountpoint=mountpoint))
+
+
+def apply(mountpoint):
+    '''Tune the device mounted at mountpoint according to the profile'''
+    settings = profile()
+    device = device_for_mount(mountpoint)
+    if device is None:
+        hookenv.log('Nothing mounted at {}, not tuning storage'.format(
+            mountpoint))
+        return
+    tune_device(device, readahead_kb=settings['readahead_kb'],
+                io_scheduler=settings['io_scheduler'])
+    configure_fstrim(mountpoint, settings['fstrim'])
+
+
+def mount_device(device, mountpoint):
+    '''Mount device at mountpoint (and in fstab) with the profile's mount
+    options, formatting it first if it is blank'''
+    settings = profile()
+    if not striping.signature(device):
+        ensure_tools(settings['filesystem'])
+        hookenv.log('Formatting {} as {}'.format(device,
+                                                 settings['filesystem']))
+        subprocess.check_call(mkfs_command(device, settings['filesystem']))
+    if os.path.ismount(mountpoint) and \
+            os.path.realpath(device_for_mount(mountpoint) or '') == \
+            os.path.realpath(device):
+        return
+    volumes.mount_volume({'device': device, 'mountpoint': mountpoint,
+                          'options': volumes.mount_options(
+                              device, settings['mount_options'])})
+    tune_device(device, readahead_kb=settings['readahead_kb'],
+                io_scheduler=settings['io_scheduler'])
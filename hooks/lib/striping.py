@@ -0,0 +1,142 @@
+#
+# Striped volumes over several local or attached block devices.
+#
+# A single disk caps the IOPS available to merges and queries. When the
+# volume-map lists several devices for a unit they are combined into one
+# RAID0-style volume, either a striped LVM logical volume or an md array,
+# which is then formatted and mounted like any single device. mkfs picks
+# up the stripe geometry from the device topology of both.
+#
+
+import re
+import subprocess
+
+import lib.utils as utils
+
+METHODS = ['lvm', 'md']
+DEFAULT_METHOD = 'lvm'
+DEFAULT_STRIPE_KB = 256
+LV_NAME = 'data'
+MDADM_CONF = '/etc/mdadm/mdadm.conf'
+PACKAGES = {
+    'lvm': ('lvcreate', 'lvm2'),
+    'md': ('mdadm', 'mdadm'),
+}
+
+
+class StripingError(Exception):
+    '''The devices could not be assembled into a striped volume'''
+    pass
+
+
+def _output(cmd):
+    '''Output of cmd, or None if it fails'''
+    try:
+        return subprocess.check_output(cmd, stderr=open('/dev/null', 'w'))
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def signature(device):
+    '''Type of whatever device holds (a filesystem, an LVM physical volume,
+    an md member...), or None if it is blank'''
+    output = _output(['blkid', '-p', '-o', 'value', '-s', 'TYPE', device])
+    if not output or not output.strip():
+        return None
+    return output.strip()
+
+
+def device_path(name, method):
+    if method == 'lvm':
+        return '/dev/{}/{}'.format(name, LV_NAME)
+    return '/dev/md/{}'.format(name)
+
+
+def layout(name, method):
+    '''
+    (members, stripe_kb) of the striped volume called name, read back from
+    LVM or md, or None if there is no such volume.
+    '''
+    if method == 'lvm':
+        output = _output(['lvs', '--noheadings', '--units', 'k', '--nosuffix',
+                          '-o', 'stripe_size,devices',
+                          '{}/{}'.format(name, LV_NAME)])
+        if not output or not output.strip():
+            return None
+        stripe_kb, devices = output.split()
+        members = [d.split('(')[0] for d in devices.split(',')]
+        return members, int(float(stripe_kb))
+    output = _output(['mdadm', '--detail', device_path(name, method)])
+    if output is None:
+        return None
+    chunk = re.search(r'Chunk Size : (\d+)K', output)
+    members = re.findall(r'\s(/dev/\S+)$', output, re.MULTILINE)
+    return members, int(chunk.group(1)) if chunk else 0
+
+
+def ensure_tools(method):
+    command, package = PACKAGES[method]
+    if _output(['which', command]) is None:
+        utils.install(package)
+
+
+def create_lvm(name, devices, stripe_kb):
+    for device in devices:
+        subprocess.check_call(['pvcreate', '--yes', device])
+    subprocess.check_call(['vgcreate', '--yes', name] + devices)
+    subprocess.check_call(['lvcreate', '--yes', '--name', LV_NAME,
+                           '--stripes', str(len(devices)),
+                           '--stripesize', '{}k'.format(stripe_kb),
+                           '--extents', '100%FREE', name])
+
+
+def create_md(name, devices, stripe_kb):
+    device = device_path(name, 'md')
+    subprocess.check_call(['mdadm', '--create', device, '--run',
+                           '--level=0', '--raid-devices={}'.format(
+                               len(devices)),
+                           '--chunk={}'.format(stripe_kb)] + devices)
+    # Assemble the array under the same name at boot
+    array = subprocess.check_output(['mdadm', '--detail', '--brief', device])
+    with open(MDADM_CONF, 'a') as conf:
+        conf.write(array)
+    subprocess.check_call(['update-initramfs', '-u'])
+
+
+def assemble(name, devices, method=DEFAULT_METHOD,
+             stripe_kb=DEFAULT_STRIPE_KB):
+    '''
+    Stripe devices into a volume called name and return its device path.
+    An existing volume is reused as it is; blank devices are required to
+    create a new one, so nothing holding data is ever overwritten.
+    '''
+    if method not in METHODS:
+        raise StripingError('Unsupported striping method {}'.format(method))
+    path = device_path(name, method)
+    current = layout(name, method)
+    if current is None:
+        in_use = [(device, signature(device)) for device in devices]
+        in_use = ['{} ({})'.format(device, sig)
+                  for device, sig in in_use if sig]
+        if in_use:
+            raise StripingError('Not striping over devices which are in '
+                                'use: {}'.format(', '.join(in_use)))
+        utils.juju_log('INFO', 'Creating {} striped volume {} over {}'.format(
+            method, path, ', '.join(devices)))
+        ensure_tools(method)
+        if method == 'lvm':
+            create_lvm(name, devices, stripe_kb)
+        else:
+            create_md(name, devices, stripe_kb)
+        current = layout(name, method)
+        if current is None:
+            raise StripingError('{} was not created'.format(path))
+    members, actual_stripe_kb = current
+    if sorted(members) != sorted(devices):
+        utils.juju_log('WARNING', '{} is striped over {}, not {}; devices '
+                       'are not added to or removed from an existing '
+                       'volume'.format(path, ', '.join(members),
+                                       ', '.join(devices)))
+    utils.juju_log('INFO', 'Volume {}: {} devices, {}KB stripe'.format(
+        path, len(members), actual_stripe_kb))
+    return path
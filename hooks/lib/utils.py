@@ -37,11 +37,16 @@ def install(*pkgs):
         cmd.append(pkg)
     subprocess.check_call(cmd)
 
-try:
-    import dns.resolver
-except ImportError:
-    install('python-dnspython')
-    import dns.resolver
+
+def _dns_resolver():
+    # Imported on first use: importing this module must never install
+    # packages or run any other command.
+    try:
+        import dns.resolver
+    except ImportError:
+        install('python-dnspython')
+        import dns.resolver
+    return dns.resolver
 
 # Protocols
 TCP = 'TCP'
@@ -127,16 +132,23 @@ def unit_get(attribute):
         return value
 
 
+_config = None
+
+
 def config_get(attribute):
-    cmd = [
-        'config-get',
-        '--format',
-        'json']
-    out = subprocess.check_output(cmd).strip()  # IGNORE:E1103
-    cfg = json.loads(out)
+    # config-get is only run once per hook; the result is shared by all
+    # subsequent lookups.
+    global _config
+    if _config is None:
+        cmd = [
+            'config-get',
+            '--format',
+            'json']
+        out = subprocess.check_output(cmd).strip()  # IGNORE:E1103
+        _config = json.loads(out)
 
     try:
-        return cfg[attribute]
+        return _config[attribute]
     except KeyError:
         return None
 
@@ -145,13 +157,14 @@ def get_unit_hostname():
     return socket.gethostname()
 
 
-def get_host_ip(hostname=unit_get('private-address')):
+def get_host_ip(hostname=None):
+    hostname = hostname or unit_get('private-address')
     try:
         # Test to see if already an IPv4 address
         socket.inet_aton(hostname)
         return hostname
     except socket.error:
-        answers = dns.resolver.query(hostname, 'A')
+        answers = _dns_resolver().query(hostname, 'A')
         if answers:
             return answers[0].address
     return None
@@ -204,3 +217,40 @@ def is_relation_made(relation, key='private-address'):
             if relation_get(key, rid=r_id, unit=unit):
                 return True
     return False
+
+
+CRON_JOB = ('{schedule} root /usr/bin/juju-run {unit} {command} '
+            '>/dev/null 2>&1\n')
+
+
+def cron_schedule(minutes):
+    '''
+    Cron schedule running every minutes minutes. Cron cannot count minutes
+    across hours, so intervals of an hour or more must be whole hours, up
+    to a day.
+    '''
+    if minutes < 1:
+        raise ValueError('{} is not a positive number of minutes'.format(
+            minutes))
+    if minutes < 60:
+        return '*/{} * * * *'.format(minutes)
+    if minutes % 60 or minutes > 24 * 60:
+        raise ValueError('{} minutes is not a whole number of hours up to '
+                         '24'.format(minutes))
+    return '0 */{} * * *'.format(minutes // 60)
+
+
+def configure_cron(path, unit, command, minutes):
+    '''
+    Run command every minutes minutes (see cron_schedule) in the hook
+    context of unit (through juju-run, which also serialises it with the
+    unit's hooks), or remove the job if minutes is 0.
+    '''
+    if not minutes:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    schedule = cron_schedule(minutes)
+    with open(path, 'w') as cron:
+        cron.write(CRON_JOB.format(schedule=schedule, unit=unit,
+                                   command=command))
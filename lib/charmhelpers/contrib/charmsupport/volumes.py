@@ -1,5 +1,6 @@
 '''
-Functions for managing volumes in juju units. One volume is supported per unit.
+Functions for managing volumes in juju units. One volume is supported per unit;
+it may be striped over several devices by the charm.
 Subordinates may have their own storage, provided it is on its own partition.
 
 Configuration stanzas:
@@ -16,6 +17,8 @@ Configuration stanzas:
     description: >
       YAML map of units to device names, e.g:
         "{ rsyslog/0: /dev/vdb, rsyslog/1: /dev/vdb }"
+      or to lists of devices to stripe the volume over, e.g:
+        "{ rsyslog/0: [/dev/vdb, /dev/vdc] }"
       Service units will raise a configure-error if volume-ephemeral
       is 'true' and no volume-map value is set. Use 'juju set' to set a
       value and 'juju resolved' to complete configuration.
@@ -31,13 +34,17 @@ Usage:
     if __name__ == '__main__':
         try:
             configure_volume(before_change=pre_mount_hook,
-                             after_change=post_mount_hook)
+                             after_change=post_mount_hook,
+                             assemble=prepare_device)
         except VolumeConfigurationError:
             log('Storage could not be configured', ERROR)
 '''
 
-# XXX: Known limitations
-# - fstab is neither consulted nor updated
+# Mounted volumes are persisted in /etc/fstab so that they come back after a
+# reboot. Volumes on network block devices (e.g. Ceph RBD) are marked _netdev
+# so they are only mounted once networking is up. The fstab entries are also
+# marked nofail (nobootwait with upstart), so that a missing or unmappable
+# volume does not stop the unit from booting.
 
 import os
 from charmhelpers.core import hookenv
@@ -46,6 +53,8 @@ import yaml
 
 
 MOUNT_BASE = '/srv/juju/volumes'
+MOUNT_OPTIONS = 'defaults,noatime'
+NETWORK_DEVICE_PREFIXES = ('/dev/rbd', '/dev/nbd')
 
 
 class VolumeConfigurationError(Exception):
@@ -79,13 +88,20 @@ def get_config():
             type(volume_map)))
         errors = True
 
-    volume_config['device'] = volume_map.get(os.environ['JUJU_UNIT_NAME'])
-    if volume_config['device'] and volume_config['ephemeral']:
+    devices = volume_map.get(os.environ['JUJU_UNIT_NAME'])
+    if not devices:
+        devices = []
+    elif not isinstance(devices, list):
+        devices = [devices]
+    volume_config['devices'] = devices
+    # Several devices are only usable once they are assembled into one
+    volume_config['device'] = devices[0] if len(devices) == 1 else None
+    if volume_config['devices'] and volume_config['ephemeral']:
         # asked for ephemeral storage but also defined a volume ID
         hookenv.log('A volume is defined for this unit, but ephemeral '
                     'storage was requested', hookenv.ERROR)
         errors = True
-    elif not volume_config['device'] and not volume_config['ephemeral']:
+    elif not volume_config['devices'] and not volume_config['ephemeral']:
         # asked for permanent storage but did not define volume ID
         hookenv.log('Ephemeral storage was requested, but there is no volume '
                     'defined for this unit.', hookenv.ERROR)
@@ -93,12 +109,32 @@ def get_config():
 
     unit_mount_name = hookenv.local_unit().replace('/', '-')
     volume_config['mountpoint'] = os.path.join(MOUNT_BASE, unit_mount_name)
+    volume_config['options'] = mount_options(
+        devices[0] if devices else None,
+        config.get('volume-mount-options') or MOUNT_OPTIONS)
 
     if errors:
         return None
     return volume_config
 
 
+def mount_options(device, options=MOUNT_OPTIONS):
+    '''Mount options for device'''
+    if device and device.startswith(NETWORK_DEVICE_PREFIXES):
+        options += ',_netdev'
+    return options
+
+
+def fstab_options(options=MOUNT_OPTIONS, systemd=None):
+    '''Options of the fstab entry for a volume mounted with options'''
+    if systemd is None:
+        systemd = os.path.isdir('/run/systemd/system')
+    boot_option = 'nofail' if systemd else 'nobootwait'
+    if boot_option in options.split(','):
+        return options
+    return '{},{}'.format(options, boot_option)
+
+
 def mount_volume(config):
     if os.path.exists(config['mountpoint']):
         if not os.path.isdir(config['mountpoint']):
@@ -108,7 +144,13 @@ def mount_volume(config):
         host.mkdir(config['mountpoint'])
     if os.path.ismount(config['mountpoint']):
         unmount_volume(config)
-    if not host.mount(config['device'], config['mountpoint'], persist=True):
+    # mount(8) does not know nobootwait, so it only goes in fstab
+    options = config.get('options') or MOUNT_OPTIONS
+    if not host.mount(config['device'], config['mountpoint'],
+                      options=options):
+        raise VolumeConfigurationError()
+    if not host.fstab_add(config['device'], config['mountpoint'], 'auto',
+                          options=fstab_options(options)):
         raise VolumeConfigurationError()
 
 
@@ -123,10 +165,14 @@ def managed_mounts():
     return filter(lambda mount: mount[0].startswith(MOUNT_BASE), host.mounts())
 
 
-def configure_volume(before_change=lambda: None, after_change=lambda: None):
+def configure_volume(before_change=lambda: None, after_change=lambda: None,
+                     assemble=None):
     '''Set up storage (or don't) according to the charm's volume configuration.
        Returns the mount point or "ephemeral". before_change and after_change
        are optional functions to be called if the volume configuration changes.
+       assemble is called with the list of devices mapped to the unit and
+       returns the single device to mount, e.g. a volume striped over them;
+       it is required when several devices are mapped.
     '''
 
     config = get_config()
@@ -134,6 +180,14 @@ def configure_volume(before_change=lambda: None, after_change=lambda: None):
         hookenv.log('Failed to read volume configuration', hookenv.CRITICAL)
         raise VolumeConfigurationError()
 
+    if not config['ephemeral']:
+        if assemble is not None:
+            config['device'] = assemble(config['devices'])
+        elif len(config['devices']) > 1:
+            hookenv.log('Several devices are mapped to this unit, but they '
+                        'cannot be assembled into one volume', hookenv.ERROR)
+            raise VolumeConfigurationError()
+
     if config['ephemeral']:
         if os.path.ismount(config['mountpoint']):
             before_change()
@@ -144,7 +198,10 @@ def configure_volume(before_change=lambda: None, after_change=lambda: None):
         # persistent storage
         if os.path.ismount(config['mountpoint']):
             mounts = dict(managed_mounts())
-            if mounts.get(config['mountpoint']) != config['device']:
+            mounted = mounts.get(config['mountpoint'])
+            # /dev/mapper and /dev/md names are symlinks to the real device
+            if mounted is None or os.path.realpath(mounted) != \
+                    os.path.realpath(config['device']):
                 before_change()
                 unmount_volume(config)
                 mount_volume(config)
@@ -40,20 +40,27 @@ def install(*pkgs):
 
 TEMPLATES_DIR = 'templates'
 
-try:
-    import jinja2
-except ImportError:
-    install('python-jinja2')
-    import jinja2
 
-try:
-    import dns.resolver
-except ImportError:
-    install('python-dnspython')
-    import dns.resolver
+def _jinja2():
+    try:
+        import jinja2
+    except ImportError:
+        install('python-jinja2')
+        import jinja2
+    return jinja2
+
+
+def _dns_resolver():
+    try:
+        import dns.resolver
+    except ImportError:
+        install('python-dnspython')
+        import dns.resolver
+    return dns.resolver
 
 
 def render_template(template_name, context, template_dir=TEMPLATES_DIR):
+    jinja2 = _jinja2()
     templates = jinja2.Environment(
                     loader=jinja2.FileSystemLoader(template_dir)
                     )
@@ -277,7 +284,7 @@ def get_host_ip(hostname=None):
         socket.inet_aton(hostname)
         return hostname
     except socket.error:
-        answers = dns.resolver.query(hostname, 'A')
+        answers = _dns_resolver().query(hostname, 'A')
         if answers:
             return answers[0].address
     return None
@@ -0,0 +1,124 @@
+"""Tools for persisting mounts in /etc/fstab"""
+# Copyright 2014 Canonical Ltd.
+
+import os
+import tempfile
+
+
+class Fstab(object):
+    """An /etc/fstab file which entries can be added to or removed from.
+    Comments and unrelated entries are preserved, and every change is
+    written atomically so that a failed hook can't leave a truncated
+    fstab behind."""
+
+    DEFAULT_PATH = os.path.join(os.path.sep, 'etc', 'fstab')
+
+    class Entry(object):
+        """A single fstab line"""
+
+        def __init__(self, device, mountpoint, filesystem,
+                     options, d=0, p=0):
+            self.device = device
+            self.mountpoint = mountpoint
+            self.filesystem = filesystem
+            self.options = options or 'defaults'
+            self.d = int(d)
+            self.p = int(p)
+
+        def __eq__(self, o):
+            return str(self) == str(o)
+
+        def __ne__(self, o):
+            return not self == o
+
+        def __str__(self):
+            return "{} {} {} {} {} {}".format(self.device,
+                                              self.mountpoint,
+                                              self.filesystem,
+                                              self.options,
+                                              self.d,
+                                              self.p)
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+
+    def _lines(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as fstab:
+            return fstab.readlines()
+
+    @staticmethod
+    def _hydrate_entry(line):
+        fields = line.split()
+        if not fields or fields[0].startswith('#') or len(fields) < 4:
+            return None
+        return Fstab.Entry(*fields[:6])
+
+    def _write(self, lines):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'w') as fstab:
+            fstab.writelines(lines)
+        if os.path.exists(self.path):
+            os.chmod(tmp, os.stat(self.path).st_mode & 0777)
+        else:
+            os.chmod(tmp, 0644)
+        os.rename(tmp, self.path)
+
+    @property
+    def entries(self):
+        for line in self._lines():
+            entry = self._hydrate_entry(line)
+            if entry is not None:
+                yield entry
+
+    def get_entry_by_attr(self, attr, value):
+        for entry in self.entries:
+            if getattr(entry, attr) == value:
+                return entry
+        return None
+
+    def add_entry(self, entry):
+        """Add entry, replacing any entry for the same mount point.
+        Returns False if an identical entry is already present."""
+        lines = []
+        for line in self._lines():
+            existing = self._hydrate_entry(line)
+            if existing is not None and \
+                    existing.mountpoint == entry.mountpoint:
+                if existing == entry:
+                    return False
+                continue
+            lines.append(line)
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        lines.append(str(entry) + '\n')
+        self._write(lines)
+        return entry
+
+    def remove_entry(self, entry):
+        lines = []
+        removed = False
+        for line in self._lines():
+            existing = self._hydrate_entry(line)
+            if existing is not None and \
+                    existing.mountpoint == entry.mountpoint:
+                removed = True
+                continue
+            lines.append(line)
+        if removed:
+            self._write(lines)
+        return removed
+
+    @classmethod
+    def remove_by_mountpoint(cls, mountpoint, path=None):
+        fstab = cls(path=path)
+        entry = fstab.get_entry_by_attr('mountpoint', mountpoint)
+        if entry:
+            return fstab.remove_entry(entry)
+        return False
+
+    @classmethod
+    def add(cls, device, mountpoint, filesystem, options=None, path=None):
+        return cls(path=path).add_entry(Fstab.Entry(device, mountpoint,
+                                                    filesystem, options))
@@ -5,7 +5,6 @@
 #  Nick Moffitt <nick.moffitt@canonical.com>
 #  Matthew Wedgwood <matthew.wedgwood@canonical.com>
 
-import apt_pkg
 import os
 import pwd
 import grp
@@ -15,6 +14,7 @@ import hashlib
 from collections import OrderedDict
 
 from hookenv import log, execution_environment
+from fstab import Fstab
 
 
 def service_start(service_name):
@@ -140,6 +140,7 @@ def render_template_file(source, destination, **kwargs):
 
 def filter_installed_packages(packages):
     """Returns a list of packages that require installation"""
+    import apt_pkg
     apt_pkg.init()
     cache = apt_pkg.Cache()
     _pkgs = []
@@ -181,8 +182,9 @@ def apt_update(fatal=False):
         subprocess.call(cmd)
 
 
-def mount(device, mountpoint, options=None, persist=False):
-    '''Mount a filesystem'''
+def mount(device, mountpoint, options=None, persist=False,
+          filesystem='auto'):
+    '''Mount a filesystem, optionally persisting it in /etc/fstab'''
     cmd_args = ['mount']
     if options is not None:
         cmd_args.extend(['-o', options])
@@ -193,13 +195,12 @@ def mount(device, mountpoint, options=None, persist=False):
         log('Error mounting {} at {}\n{}'.format(device, mountpoint, e.output))
         return False
     if persist:
-        # TODO: update fstab
-        pass
+        return fstab_add(device, mountpoint, filesystem, options=options)
     return True
 
 
 def umount(mountpoint, persist=False):
-    '''Unmount a filesystem'''
+    '''Unmount a filesystem, optionally removing it from /etc/fstab'''
     cmd_args = ['umount', mountpoint]
     try:
         subprocess.check_output(cmd_args)
@@ -207,8 +208,27 @@ def umount(mountpoint, persist=False):
         log('Error unmounting {}\n{}'.format(mountpoint, e.output))
         return False
     if persist:
-        # TODO: update fstab
-        pass
+        return fstab_remove(mountpoint)
+    return True
+
+
+def fstab_add(device, mountpoint, filesystem, options=None):
+    '''Add (or replace) the fstab entry for mountpoint'''
+    try:
+        Fstab.add(device, mountpoint, filesystem, options=options)
+    except (IOError, OSError), e:
+        log('Error adding {} to fstab\n{}'.format(mountpoint, e))
+        return False
+    return True
+
+
+def fstab_remove(mountpoint):
+    '''Remove the fstab entry for mountpoint'''
+    try:
+        Fstab.remove_by_mountpoint(mountpoint)
+    except (IOError, OSError), e:
+        log('Error removing {} from fstab\n{}'.format(mountpoint, e))
+        return False
     return True
 
 
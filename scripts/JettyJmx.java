@@ -0,0 +1,110 @@
+/*
+ * Reads and sets attributes of Jetty's MBeans in a running JVM, through
+ * the local JMX connector (started with the attach API if the JVM has none
+ * yet), so no JMX port has to be opened. Run as the user the JVM runs as:
+ *
+ *   JettyJmx <pid> get <object name pattern> <attribute>
+ *   JettyJmx <pid> set <object name pattern> <attribute> <value>
+ *
+ * prints "<object name> <attribute> <old value> [<new value>]" for every
+ * matching MBean (see hooks/lib/jmx.py).
+ */
+
+import java.io.File;
+import java.util.Set;
+
+import javax.management.Attribute;
+import javax.management.MBeanAttributeInfo;
+import javax.management.MBeanServerConnection;
+import javax.management.ObjectName;
+import javax.management.remote.JMXConnector;
+import javax.management.remote.JMXConnectorFactory;
+import javax.management.remote.JMXServiceURL;
+
+import com.sun.tools.attach.VirtualMachine;
+
+public class JettyJmx {
+
+    private static final String CONNECTOR_ADDRESS =
+        "com.sun.management.jmxremote.localConnectorAddress";
+
+    private static String connectorAddress(String pid) throws Exception {
+        VirtualMachine vm = VirtualMachine.attach(pid);
+        try {
+            String address = vm.getAgentProperties().getProperty(
+                CONNECTOR_ADDRESS);
+            if (address == null) {
+                String agent = vm.getSystemProperties().getProperty(
+                    "java.home") + File.separator + "lib" + File.separator +
+                    "management-agent.jar";
+                vm.loadAgent(agent);
+                address = vm.getAgentProperties().getProperty(
+                    CONNECTOR_ADDRESS);
+            }
+            return address;
+        } finally {
+            vm.detach();
+        }
+    }
+
+    private static Object convert(String type, String value) {
+        if (type.equals("int") || type.equals("java.lang.Integer")) {
+            return Integer.valueOf(value);
+        }
+        if (type.equals("long") || type.equals("java.lang.Long")) {
+            return Long.valueOf(value);
+        }
+        if (type.equals("boolean") || type.equals("java.lang.Boolean")) {
+            return Boolean.valueOf(value);
+        }
+        return value;
+    }
+
+    private static String type(MBeanServerConnection server, ObjectName name,
+                               String attribute) throws Exception {
+        for (MBeanAttributeInfo info :
+                 server.getMBeanInfo(name).getAttributes()) {
+            if (info.getName().equals(attribute)) {
+                return info.getType();
+            }
+        }
+        throw new IllegalArgumentException("No attribute " + attribute +
+                                           " in " + name);
+    }
+
+    public static void main(String[] args) throws Exception {
+        if (args.length < 4 || (args[1].equals("set") && args.length < 5)) {
+            System.err.println("Usage: JettyJmx <pid> get|set <pattern> " +
+                               "<attribute> [<value>]");
+            System.exit(2);
+        }
+        String address = connectorAddress(args[0]);
+        JMXConnector connector = JMXConnectorFactory.connect(
+            new JMXServiceURL(address));
+        try {
+            MBeanServerConnection server =
+                connector.getMBeanServerConnection();
+            Set<ObjectName> names = server.queryNames(
+                new ObjectName(args[2]), null);
+            if (names.isEmpty()) {
+                System.err.println("No MBean matches " + args[2]);
+                System.exit(1);
+            }
+            String attribute = args[3];
+            for (ObjectName name : names) {
+                Object old = server.getAttribute(name, attribute);
+                if (args[1].equals("set")) {
+                    server.setAttribute(name, new Attribute(attribute,
+                        convert(type(server, name, attribute), args[4])));
+                    System.out.println(name + " " + attribute + " " + old +
+                                       " " + server.getAttribute(name,
+                                                                 attribute));
+                } else {
+                    System.out.println(name + " " + attribute + " " + old);
+                }
+            }
+        } finally {
+            connector.close();
+        }
+    }
+}
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Report the read hit rate and occupancy of the local cache in front of the
+# persistent volume, either since it was attached or over an interval.
+#
+
+import json
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'hooks'))
+
+from lib import cache_tier
+
+
+def cache_names():
+    if not os.path.exists(cache_tier.STATE_FILE):
+        return []
+    with open(cache_tier.STATE_FILE) as state:
+        return sorted(json.load(state))
+
+
+def render(name, counters, interval=None):
+    reads = counters['read_hits'] + counters['read_misses']
+    writes = counters['write_hits'] + counters['write_misses']
+    if interval:
+        print '%s, last %ds:' % (name, interval)
+    else:
+        print '%s, since attached:' % name
+    print '  read hit rate  %6.1f%%  (%d of %d reads)' % (
+        100.0 * counters['read_hits'] / reads if reads else 0.0,
+        counters['read_hits'], reads)
+    print '  write hit rate %6.1f%%  (%d of %d writes)' % (
+        100.0 * counters['write_hits'] / writes if writes else 0.0,
+        counters['write_hits'], writes)
+    print '  promotions %d, demotions %d' % (counters['promotions'],
+                                            counters['demotions'])
+    print '  blocks used %d of %d, dirty %d' % (counters['used_blocks'],
+                                               counters['total_blocks'],
+                                               counters['dirty'])
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options] [CACHE]",
+        description="Show hit rates of the volume cache (default: every "
+                    "cache attached by the charm).")
+    parser.add_option(
+        '-i', '--interval', dest='interval', type='int', default=0,
+        help="Report the rates over this many seconds instead of since "
+             "the cache was attached.")
+    options, args = parser.parse_args()
+
+    names = args or cache_names()
+    if not names:
+        parser.error("No cache is attached.")
+    for name in names:
+        counters = cache_tier.stats(name)
+        if options.interval:
+            time.sleep(options.interval)
+            latest = cache_tier.stats(name)
+            for field in cache_tier.STATUS_FIELDS:
+                if field != 'dirty':
+                    latest[field] -= counters[field]
+            counters = latest
+        render(name, counters, options.interval)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+#
+# Grow the Ceph-backed Solr volume before merges run out of space. Run
+# through juju-run (see lib/capacity.py) so that the charm config and
+# juju-log are available:
+#
+#   juju-run solr-jetty/0 scripts/capacity-manager.py
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+import lib._pythonpath
+_ = lib._pythonpath
+
+from charmhelpers.core import hookenv
+
+from lib import capacity
+from lib import seeding
+
+
+if __name__ == '__main__':
+    config = hookenv.config()
+    service_name, unit_id = hookenv.local_unit().split('/')
+    capacity.check(service=service_name, pool=service_name,
+                   image=seeding.image_name(config['rbd-name'], unit_id,
+                                            config.get('rbd-clone-source')),
+                   mountpoint='/srv/juju/volumes/{}-{}'.format(service_name,
+                                                               unit_id),
+                   headroom=config['capacity-merge-headroom'],
+                   horizon_hours=config['capacity-horizon-hours'],
+                   max_gb=config['capacity-max-size'])
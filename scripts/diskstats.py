@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# I/O metrics of the block devices under the Solr data directory (see
+# lib/diskstats.py).
+#
+#   diskstats.py --collect              sample for a minute (run from cron)
+#   diskstats.py                        latest sample of each device
+#   diskstats.py --window 600           averages and peaks over 10 minutes
+#   diskstats.py --check --window 300 --await-ms 50,200 --util 90,100
+#                                       NRPE check
+#
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+from lib import diskstats
+
+OK, WARNING, CRITICAL, UNKNOWN = range(4)
+STATUS = ['OK', 'WARNING', 'CRITICAL', 'UNKNOWN']
+COLUMNS = '%-10s %8s %8s %9s %9s %6s %9s %6s'
+
+
+def thresholds(value):
+    warn, crit = value.split(',')
+    return float(warn), float(crit)
+
+
+def render_latest(records):
+    latest = {}
+    for record in records:
+        latest[record[1]] = record
+    print COLUMNS % ('device', 'r/s', 'w/s', 'rKB/s', 'wKB/s', 'queue',
+                     'await ms', 'util%')
+    for name in sorted(latest):
+        timestamp, _, m = latest[name]
+        print COLUMNS % (name, '%.1f' % m['r_iops'], '%.1f' % m['w_iops'],
+                         '%.0f' % m['r_kbps'], '%.0f' % m['w_kbps'],
+                         '%.2f' % m['queue'], '%.1f' % m['await_ms'],
+                         '%.0f' % m['util'])
+
+
+def render_summary(summary, window):
+    print 'Average (peak) over the last %ds:' % window
+    print COLUMNS % ('device', 'r/s', 'w/s', 'rKB/s', 'wKB/s', 'queue',
+                     'await ms', 'util%')
+    for name in sorted(summary):
+        s = summary[name]
+        print COLUMNS % (name, '%.0f(%.0f)' % s['r_iops'],
+                         '%.0f(%.0f)' % s['w_iops'],
+                         '%.0f(%.0f)' % s['r_kbps'],
+                         '%.0f(%.0f)' % s['w_kbps'],
+                         '%.1f(%.1f)' % s['queue'],
+                         '%.0f(%.0f)' % s['await_ms'],
+                         '%.0f(%.0f)' % s['util'])
+
+
+def check(summary, await_ms, util):
+    '''Nagios status and message from the average await and utilization
+    of the busiest device'''
+    if not summary:
+        return UNKNOWN, 'no recent disk samples'
+    status = OK
+    details = []
+    for name in sorted(summary):
+        avg_await = summary[name]['await_ms'][0]
+        avg_util = summary[name]['util'][0]
+        for value, (warn, crit) in ((avg_await, await_ms), (avg_util, util)):
+            if value >= crit:
+                status = max(status, CRITICAL)
+            elif value >= warn:
+                status = max(status, WARNING)
+        details.append('%s await %.1fms util %.0f%%' % (name, avg_await,
+                                                        avg_util))
+    return status, ', '.join(details)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Show I/O rates of the devices holding the Solr data.")
+    parser.add_option('-f', '--file', dest='path',
+                      default=diskstats.RING_FILE,
+                      help="Ring buffer file (default: %default).")
+    parser.add_option('--collect', action='store_true', default=False,
+                      help="Sample the devices and record the rates.")
+    parser.add_option('-i', '--interval', dest='interval', type='int',
+                      default=diskstats.DEFAULT_INTERVAL,
+                      help="Sampling interval when collecting (default: "
+                           "%default).")
+    parser.add_option('-d', '--duration', dest='duration', type='int',
+                      default=60,
+                      help="How long to collect for (default: %default).")
+    parser.add_option('-w', '--window', dest='window', type='int', default=0,
+                      help="Summarise this many seconds of samples.")
+    parser.add_option('--check', action='store_true', default=False,
+                      help="Run as an NRPE check over --window.")
+    parser.add_option('--await-ms', dest='await_ms', default='50,200',
+                      help="Warning,critical average await (default: "
+                           "%default).")
+    parser.add_option('--util', dest='util', default='90,100',
+                      help="Warning,critical average utilization "
+                           "(default: %default).")
+    options, args = parser.parse_args()
+
+    ring = diskstats.RingBuffer(options.path)
+    if options.collect:
+        diskstats.collect(ring, interval=options.interval,
+                          duration=options.duration)
+        sys.exit(0)
+
+    window = options.window or (300 if options.check else 0)
+    try:
+        records = ring.records(since=time.time() - window if window else 0)
+    except (IOError, ValueError) as e:
+        if options.check:
+            print 'UNKNOWN: %s' % e
+            sys.exit(UNKNOWN)
+        raise
+    if options.check:
+        status, message = check(diskstats.summary(records),
+                                thresholds(options.await_ms),
+                                thresholds(options.util))
+        print '%s: %s' % (STATUS[status], message)
+        sys.exit(status)
+    if window:
+        render_summary(diskstats.summary(records), window)
+    else:
+        render_latest(records)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# CPU against bandwidth of gzipping typical Solr responses.
+#
+# For each query, fetches the response with and without Accept-Encoding:
+# gzip (the second only differs once the gzip option is on), then
+# compresses the plain response at several levels to show what each costs
+# in CPU and saves on the wire at the given bandwidth. Jetty's GzipFilter
+# compresses at level 6.
+#
+#   gzip-bench.py --bandwidth 1000 'q=*:*&rows=100' 'q=memory&facet=true'
+#
+
+import optparse
+import time
+import urllib2
+import zlib
+
+LEVELS = [1, 6, 9]
+JETTY_LEVEL = 6
+
+
+def fetch(url, gzip, repeat):
+    '''(bytes on the wire, body, mean latency in ms, encoding)'''
+    headers = {'Accept-Encoding': 'gzip' if gzip else 'identity'}
+    elapsed = 0.0
+    for _ in range(repeat):
+        started = time.time()
+        response = urllib2.urlopen(urllib2.Request(url, headers=headers),
+                                   timeout=60)
+        body = response.read()
+        elapsed += time.time() - started
+    encoding = response.info().getheader('Content-Encoding') or 'identity'
+    return len(body), body, elapsed * 1000 / repeat, encoding
+
+
+def compress_cost(body, level, repeat):
+    '''(compressed bytes, CPU ms per response) at level'''
+    started = time.clock()
+    for _ in range(repeat):
+        # gzip framing, as sent over HTTP
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        compressed = compressor.compress(body) + compressor.flush()
+    return len(compressed), (time.clock() - started) * 1000 / repeat
+
+
+def wire_ms(size, bandwidth_mbit):
+    return size * 8 / (bandwidth_mbit * 1000.0)
+
+
+def run(base, queries, repeat, bandwidth):
+    for query in queries:
+        url = '{}?{}'.format(base, query)
+        size, body, latency, _ = fetch(url, False, repeat)
+        gz_size, _, gz_latency, encoding = fetch(url, True, repeat)
+        print query
+        print '  served plain: %9d bytes %8.1f ms' % (size, latency)
+        print '  served %-6s %9d bytes %8.1f ms' % (encoding + ':', gz_size,
+                                                    gz_latency)
+        print '  %-6s %10s %7s %9s %12s %11s' % (
+            'level', 'bytes', 'ratio', 'CPU ms', 'wire ms', 'saved ms')
+        plain_wire = wire_ms(size, bandwidth)
+        print '  %-6s %10d %7.2f %9.2f %12.2f %11s' % (
+            'none', size, 1.0, 0.0, plain_wire, '-')
+        for level in LEVELS:
+            compressed, cpu = compress_cost(body, level, repeat)
+            wire = wire_ms(compressed, bandwidth)
+            print '  %-6s %10d %7.2f %9.2f %12.2f %11.2f' % (
+                '%d%s' % (level, '*' if level == JETTY_LEVEL else ''),
+                compressed, float(size) / max(compressed, 1), cpu, wire,
+                plain_wire - wire - cpu)
+    print '* the level used by Jetty; saved ms is wire time saved at ' \
+          '%dMbit/s less the CPU time' % bandwidth
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options] QUERY...",
+        description="Measure what gzipping Solr responses costs and saves.")
+    parser.add_option('--url', dest='url',
+                      default='http://localhost:8080/solr/select',
+                      help="Solr request handler (default: %default).")
+    parser.add_option('-n', '--repeat', dest='repeat', type='int', default=20,
+                      help="Requests and compressions per query (default: "
+                           "%default).")
+    parser.add_option('-b', '--bandwidth', dest='bandwidth', type='int',
+                      default=1000,
+                      help="Bandwidth to the web tier in Mbit/s (default: "
+                           "%default).")
+    options, args = parser.parse_args()
+    run(options.url, args or ['q=*:*&rows=100'], options.repeat,
+        options.bandwidth)
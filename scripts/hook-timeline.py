@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# Render the unit lifecycle timeline recorded by the hook profiler: every
+# hook run from install until Solr answered its first query, followed by the
+# slowest commands and operations.
+#
+
+import optparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'hooks'))
+
+from lib import profiler
+
+
+def occurred_at(event):
+    # readiness is recorded from the moment jetty was asked to start, so it
+    # happened at the end of its interval
+    if event['k'] == profiler.READY:
+        return event['t'] + event['s']
+    return event['t']
+
+
+def lifecycle(events):
+    '''Hook runs and readiness events, ordered, from the first install on'''
+    milestones = sorted((e for e in events
+                         if e['k'] in (profiler.HOOK, profiler.READY)),
+                        key=occurred_at)
+    installs = [e for e in milestones
+                if e['k'] == profiler.HOOK and e['n'] == 'install']
+    if installs:
+        milestones = [e for e in milestones if e['t'] >= installs[0]['t']]
+    return milestones
+
+
+def render_timeline(events):
+    milestones = lifecycle(events)
+    if not milestones:
+        print 'No hooks recorded.'
+        return
+    origin = milestones[0]['t']
+    print '%10s %9s %4s  %s' % ('offset', 'duration', 'rc', 'hook')
+    first_query = None
+    for event in milestones:
+        if event['k'] == profiler.READY:
+            ready_at = occurred_at(event) - origin
+            if first_query is None:
+                first_query = ready_at
+            print '%9.1fs %9s %4s  %s (solr ready, waited %.1fs)' % (
+                ready_at, '', '', event['h'], event['s'])
+        else:
+            print '%9.1fs %8.1fs %4s  %s' % (
+                event['t'] - origin, event['s'], event['rc'], event['n'])
+    if first_query is not None:
+        print
+        print 'install to first query: %.1fs' % first_query
+
+
+def render_slowest(events, count):
+    operations = sorted((e for e in events
+                         if e['k'] in (profiler.CMD, profiler.OP)),
+                        key=lambda e: e['s'], reverse=True)[:count]
+    if not operations:
+        return
+    print
+    print 'Top %d slowest operations:' % count
+    print '%9s %4s  %-28s %s' % ('duration', 'rc', 'hook', 'operation')
+    for event in operations:
+        rc = '' if event['rc'] is None else event['rc']
+        print '%8.1fs %4s  %-28s %s' % (event['s'], rc, event['h'],
+                                        event['n'])
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Show where this unit's hooks spent their time.")
+    parser.add_option(
+        '-f', '--file', dest='path', default=profiler.TIMELINE_FILE,
+        help="The timeline file to read (default: %default).",
+        metavar="FILE")
+    parser.add_option(
+        '-n', '--top', dest='top', type='int', default=10,
+        help="Number of slowest operations to show (default: %default).")
+    options, args = parser.parse_args()
+
+    events = profiler.load(options.path)
+    render_timeline(events)
+    render_slowest(events, options.top)
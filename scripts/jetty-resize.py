@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#
+# Resize the thread pool and connectors of the running Jetty over JMX,
+# without restarting it (see lib/jmx.py). Without options, shows the
+# current values.
+#
+#   jetty-resize.py --max-threads 400 --low-resources-connections 8000
+#
+# The charm config still holds the values a restart comes back with: set
+# the same options there (config-changed resizes live too) to keep them.
+#
+
+import optparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+from lib import jmx
+from lib import overload
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Resize Jetty's thread pool and connectors live.")
+    for option in sorted(jmx.RUNTIME):
+        parser.add_option('--' + option, dest=option.replace('-', '_'),
+                          type='int',
+                          help="New {} of {}.".format(*reversed(
+                              jmx.RUNTIME[option])))
+    options, args = parser.parse_args()
+
+    pid = overload.jvm_pid()
+    if pid is None:
+        print 'Jetty is not running'
+        sys.exit(1)
+    settings = dict((option, getattr(options, option.replace('-', '_')))
+                    for option in jmx.RUNTIME
+                    if getattr(options, option.replace('-', '_')) is not None)
+    try:
+        if settings:
+            for name, attribute, old, new in jmx.resize(pid, settings):
+                print '%s %s: %s -> %s' % (name, attribute, old, new)
+        else:
+            for option in sorted(jmx.RUNTIME):
+                for name, attribute, value, _ in jmx.get(pid, option):
+                    print '%s %s: %s' % (name, attribute, value)
+    except jmx.JmxError as e:
+        print e
+        sys.exit(1)
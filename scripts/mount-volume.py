@@ -2,15 +2,25 @@
 
 import sys
 import os
+import subprocess
 from pwd import getpwnam
 
 import _pythonpath
 _ = _pythonpath
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
 from charmhelpers.contrib.charmsupport import volumes
 from charmhelpers.core import hookenv
 from charmhelpers.core import host
 
+from lib import cache_tier
+from lib import migrate
+from lib import ramdisk
+from lib import storage_profile
+from lib import striping
+
 def storage_is_persistent():
     if os.path.islink(SOLR_DIR):
         target = os.readlink(SOLR_DIR)
@@ -19,13 +29,58 @@ def storage_is_persistent():
     return False
 
 def volume_change_pre():
-    host.service_stop('jetty')
+    # Jetty only has to stop if it is serving from the volume being changed;
+    # data on the default directory is migrated while Jetty keeps running.
+    if storage_is_persistent():
+        host.service_stop('jetty')
 
 
 def volume_change_post():
     pass
 
 
+def prepare_device(devices):
+    config = hookenv.config()
+    name = hookenv.local_unit().replace('/', '-')
+    try:
+        if len(devices) > 1:
+            device = striping.assemble(
+                name, devices,
+                method=config.get('volume-stripe-method') or
+                striping.DEFAULT_METHOD,
+                stripe_kb=config.get('volume-stripe-size-kb') or
+                striping.DEFAULT_STRIPE_KB)
+            if not striping.signature(device):
+                fstype = storage_profile.profile()['filesystem']
+                storage_profile.ensure_tools(fstype)
+                subprocess.check_call(storage_profile.mkfs_command(device,
+                                                                   fstype))
+        else:
+            device = devices[0]
+        # The origin cannot be mounted while a cache is added or removed
+        cache_name = '{}-cache'.format(name)
+        mountpoint = os.path.join(volumes.MOUNT_BASE, name)
+        if bool(config.get('cache-device')) != \
+                cache_tier.attached(cache_name) and \
+                os.path.ismount(mountpoint):
+            volume_change_pre()
+            volumes.unmount_volume({'mountpoint': mountpoint})
+        if config.get('cache-device'):
+            device = cache_tier.attach(
+                cache_name, device, config['cache-device'],
+                mode=config.get('cache-mode') or cache_tier.DEFAULT_MODE,
+                block_kb=config.get('cache-block-kb') or
+                cache_tier.DEFAULT_BLOCK_KB)
+        elif cache_tier.configured(cache_name):
+            cache_tier.detach(cache_name)
+    except (striping.StripingError, cache_tier.CacheTierError,
+            subprocess.CalledProcessError) as e:
+        hookenv.log('Could not prepare {}: {}'.format(', '.join(devices), e),
+                    hookenv.ERROR)
+        raise volumes.VolumeConfigurationError()
+    return device
+
+
 def set_permissions():
     if storage_is_persistent():
         # make sure data on external storage are owned
@@ -41,11 +96,15 @@ def set_permissions():
 
 def mount():
     try:
-        mountpoint = volumes.configure_volume(before_change=volume_change_pre, after_change=volume_change_post)
+        mountpoint = volumes.configure_volume(before_change=volume_change_pre, after_change=volume_change_post,
+                                              assemble=prepare_device)
     except volumes.VolumeConfigurationError:
         hookenv.log('Storage could not be configured', hookenv.ERROR)
         sys.exit(1)
 
+    if ramdisk.in_use(SOLR_DIR):
+        # The volume only holds the ramdisk's checkpoints
+        return
     if mountpoint == 'ephemeral':
         if os.path.islink(SOLR_DIR):
             os.remove(SOLR_DIR)
@@ -55,14 +114,25 @@ def mount():
                 os.path.mkdir(SOLR_DIR)
     else:
         if not storage_is_persistent():
-            try:
-                os.rename(SOLR_DIR, SAVED_DIR)
-            except OSError as e:
-                hookenv.log('ERROR: could not preserve existing log directory', hookenv.ERROR)
-                hookenv.log(e.strerror, hookenv.ERROR)
-                sys.exit(1)
-            os.symlink(mountpoint, SOLR_DIR)
-            set_permissions()
+            def swap():
+                try:
+                    migrate.swap_in(SOLR_DIR, SAVED_DIR, mountpoint)
+                except OSError as e:
+                    hookenv.log('ERROR: could not preserve existing log directory', hookenv.ERROR)
+                    hookenv.log(e.strerror, hookenv.ERROR)
+                    sys.exit(1)
+                set_permissions()
+
+            if migrate.has_data(mountpoint):
+                # Never overwrite an index already on the volume
+                hookenv.log('{} already holds data, not migrating {}'.format(
+                    mountpoint, SOLR_DIR))
+                host.service_stop('jetty')
+                swap()
+            else:
+                migrate.migrate(SOLR_DIR, mountpoint,
+                                stop=lambda: host.service_stop('jetty'),
+                                swap=swap, start=lambda: None)
             host.service_start('jetty')
 
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# Heap breaker and overload metrics (see lib/overload.py).
+#
+#   overload.py --watch --trip 90 --reset 75    sample for a minute (cron)
+#   overload.py                                 breaker state and rejections
+#
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+from lib import overload
+from lib import request_log
+
+
+def watch(port, trip, reset, logs, interval, duration):
+    state = overload.load_state()
+    deadline = time.time() + duration
+    while True:
+        log = os.path.join(logs, '{}.request.log'.format(request_log.today()))
+        overload.save_state(overload.check(state, port, trip, reset, log))
+        if time.time() + interval >= deadline:
+            break
+        time.sleep(interval)
+
+
+def status(state):
+    if 'updated' not in state:
+        print 'No samples yet'
+        return
+    print 'Heap breaker:        %s' % ('OPEN since %s' % time.ctime(
+        state['tripped_at']) if state['tripped'] else 'closed')
+    if state.get('old_pct') is not None:
+        print 'Old generation:      %.1f%% (%d full GCs)' % (
+            state['old_pct'], state['full_gcs'])
+    print 'Breaker trips:       %d' % state['trips']
+    rejected = state['breaker_rejections']
+    if state['tripped']:
+        rejected += overload.rule_rejections()
+    print 'Breaker rejections:  %d' % rejected
+    print 'QoS rejections:      %d (503s in the request log)' % \
+        state['qos_rejections']
+    print 'Updated:             %s' % time.ctime(state['updated'])
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Open the heap breaker when Jetty's heap stays full, "
+                    "and count rejected requests.")
+    parser.add_option('--watch', action='store_true', default=False,
+                      help="Sample the heap and request log.")
+    parser.add_option('--port', dest='port', type='int', default=8080,
+                      help="Port the breaker closes (default: %default).")
+    parser.add_option('--trip', dest='trip', type='int', default=0,
+                      help="Open the breaker when the old generation is "
+                           "this full after a full GC; 0 disables it.")
+    parser.add_option('--reset', dest='reset', type='int', default=75,
+                      help="Close it below this (default: %default).")
+    parser.add_option('--logs', dest='logs', default='/var/log/jetty',
+                      help="Directory Jetty logs requests to "
+                           "(default: %default).")
+    parser.add_option('-i', '--interval', dest='interval', type='int',
+                      default=overload.DEFAULT_INTERVAL,
+                      help="Sampling interval (default: %default).")
+    parser.add_option('-d', '--duration', dest='duration', type='int',
+                      default=55,
+                      help="How long to watch for (default: %default).")
+    options, args = parser.parse_args()
+
+    if options.watch:
+        watch(options.port, options.trip, options.reset, options.logs,
+              options.interval, options.duration)
+    else:
+        status(overload.load_state())
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+#
+# Checkpoint the Solr ramdisk to its persistent store (see lib/ramdisk.py).
+# Run through juju-run, every minute when checkpointing on commit:
+#
+#   juju-run solr-jetty/0 scripts/ramdisk-checkpoint.py [--force]
+#
+# --force checkpoints whether or not one is due.
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+import lib._pythonpath
+_ = lib._pythonpath
+
+from charmhelpers.core import hookenv
+
+from lib import ramdisk
+
+
+if __name__ == '__main__':
+    config = hookenv.config()
+    service_name, unit_id = hookenv.local_unit().split('/')
+    path = ramdisk.mountpoint(hookenv.local_unit())
+    store = ramdisk.store('/srv/juju/volumes/{}-{}'.format(service_name,
+                                                          unit_id),
+                          config.get('volume-ephemeral') in
+                          (True, 'True', 'true'))
+    if '--force' in sys.argv[1:] or ramdisk.due(
+            path, config['ramdisk-checkpoint-interval'],
+            config['ramdisk-checkpoint-on-commit']):
+        ramdisk.checkpoint(path, store)
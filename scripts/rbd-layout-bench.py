@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# Compare RBD image layouts for the Solr index. Each layout is created as a
+# scratch image in the given pool, exercised with large sequential writes
+# (segment merges) and small random writes, then removed.
+#
+# Layouts are given as comma separated create_rbd_image options, e.g.
+#
+#   rbd-layout-bench.py --id solr-jetty --pool solr-jetty \
+#       order=22 order=23,stripe_unit=65536,stripe_count=16
+#
+
+import optparse
+import os
+import re
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'hooks'))
+
+import lib.ceph_utils as ceph
+
+# (pattern, io size) pairs approximating merges and query-time reads
+WORKLOADS = [('seq', 4 * 1024 * 1024), ('rand', 16 * 1024)]
+
+RESULT_RE = re.compile(r'ops/sec:\s*([\d.]+)\s+bytes/sec:\s*([\d.]+)')
+
+
+def parse_layout(spec):
+    layout = {}
+    for option in spec.split(','):
+        key, value = option.split('=', 1)
+        if key == 'features':
+            layout[key] = value.split('+')
+        else:
+            layout[key] = int(value)
+    return layout
+
+
+def bench(service, pool, image, pattern, io_size, total_mb):
+    cmd = ['rbd', 'bench-write', image, '--id', service, '--pool', pool,
+           '--io-pattern', pattern, '--io-size', str(io_size),
+           '--io-total', str(total_mb * 1024 * 1024)]
+    output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+    match = RESULT_RE.search(output)
+    if not match:
+        return None, None
+    return float(match.group(1)), float(match.group(2))
+
+
+def run(service, pool, specs, size_mb, total_mb):
+    print '%-40s %-5s %10s %10s' % ('layout', 'io', 'ops/sec', 'MB/sec')
+    for index, spec in enumerate(specs):
+        image = 'layout-bench-%d' % index
+        ceph.create_rbd_image(service, pool, image, size_mb,
+                              **parse_layout(spec))
+        try:
+            for pattern, io_size in WORKLOADS:
+                ops, bps = bench(service, pool, image, pattern, io_size,
+                                 total_mb)
+                if ops is None:
+                    print '%-40s %-5s %10s %10s' % (spec, pattern, '?', '?')
+                else:
+                    print '%-40s %-5s %10.0f %10.1f' % (spec, pattern, ops,
+                                                        bps / 1024 / 1024)
+        finally:
+            subprocess.call(['rbd', 'rm', image, '--id', service,
+                             '--pool', pool])
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options] LAYOUT [LAYOUT...]",
+        description="Benchmark RBD image layouts for the Solr index.")
+    parser.add_option('--id', dest='service', default='solr-jetty',
+                      help="Ceph client id (default: %default).")
+    parser.add_option('--pool', dest='pool', default='solr-jetty',
+                      help="Pool to create scratch images in "
+                           "(default: %default).")
+    parser.add_option('--size', dest='size', type='int', default=2048,
+                      help="Scratch image size in MB (default: %default).")
+    parser.add_option('--total', dest='total', type='int', default=512,
+                      help="MB written per workload (default: %default).")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error("At least one layout is required.")
+    run(options.service, options.pool, args, options.size, options.total)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+#
+# Take a consistent, protected snapshot of this unit's RBD image for new
+# replica units to clone (see lib/seeding.py). Run through juju-run:
+#
+#   juju-run solr-jetty/0 scripts/rbd-seed-snapshot.py
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+import lib._pythonpath
+_ = lib._pythonpath
+
+from charmhelpers.core import hookenv
+
+from lib import ramdisk
+from lib import seeding
+
+
+if __name__ == '__main__':
+    config = hookenv.config()
+    service_name, unit_id = hookenv.local_unit().split('/')
+    mountpoint = '/srv/juju/volumes/{}-{}'.format(service_name, unit_id)
+    if config.get('cache-device') and config.get('cache-mode') == 'writeback':
+        # dirty blocks in the cache never reach the snapshot
+        hookenv.log('Not taking seed snapshots of a volume behind a '
+                    'writeback cache', hookenv.ERROR)
+        sys.exit(1)
+    if not os.path.ismount(mountpoint):
+        hookenv.log('{} is not mounted, no seed snapshot taken'.format(
+            mountpoint), hookenv.WARNING)
+        sys.exit(0)
+    path = ramdisk.mountpoint(hookenv.local_unit())
+    if ramdisk.restored(path):
+        # the volume only holds the ramdisk's last checkpoint
+        seeding.solr_commit()
+        ramdisk.checkpoint(path, mountpoint)
+    seeding.take_snapshot(service_name, service_name, config['rbd-name'],
+                          mountpoint, keep=config['rbd-snapshot-keep'])
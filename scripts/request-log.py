@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+#
+# Sample, convert, compress and expire the Jetty request logs (see
+# lib/request_log.py). Run from cron every minute:
+#
+#   request-log.py --logs /var/log/jetty --format json --sample-rate 0.1 \
+#       --retention-days 90
+#
+
+import optparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+from lib import request_log
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Process the Jetty request logs off the request path.")
+    parser.add_option('--logs', dest='logs', default='/var/log/jetty',
+                      help="Directory Jetty logs requests to "
+                           "(default: %default).")
+    parser.add_option('--format', dest='format', default='ncsa',
+                      choices=request_log.FORMATS,
+                      help="ncsa or json (default: %default).")
+    parser.add_option('--sample-rate', dest='sample_rate', type='float',
+                      default=1.0,
+                      help="Share of the requests kept; server errors are "
+                           "always kept (default: %default).")
+    parser.add_option('--solr-log', dest='solr_log',
+                      help="Log Solr writes QTime and hits to "
+                           "(default: out.log in --logs).")
+    parser.add_option('--retention-days', dest='retention_days', type='int',
+                      default=request_log.DEFAULT_RETENTION_DAYS,
+                      help="Days of logs kept, 0 for all (default: "
+                           "%default).")
+    parser.add_option('--no-compress', dest='compress',
+                      action='store_false', default=True,
+                      help="Do not gzip the logs of past days.")
+    options, args = parser.parse_args()
+
+    state = request_log.load_state()
+    if request_log.converting(options.format, options.sample_rate):
+        request_log.convert(options.logs, options.format,
+                            options.sample_rate,
+                            options.solr_log or os.path.join(options.logs,
+                                                             'out.log'),
+                            state=state)
+    else:
+        state['offsets'] = {}
+    request_log.save_state(state)
+    request_log.rotate(options.logs, options.retention_days,
+                       compressed=options.compress,
+                       converting=set(state['offsets']))
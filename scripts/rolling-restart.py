@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+#
+# Take this unit's turn in a queued rolling restart, if it has come (see
+# lib/rolling_restart.py). Run through juju-run every minute while a
+# restart is queued, as peers' relation changes are not enough to wake a
+# unit whose request has just settled:
+#
+#   juju-run solr-jetty/0 scripts/rolling-restart.py
+#
+
+import os
+import sys
+
+hooks_dir = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks')
+sys.path.insert(0, hooks_dir)
+
+import hooks
+
+
+if __name__ == '__main__':
+    hooks.main([os.path.join(hooks_dir, 'rolling-restart')])
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Micro-benchmark of the Solr storage profile against plain defaults.
+#
+# Each candidate formats DEVICE, mounts it, writes segment sized files,
+# then measures sequential (merge) and random (query) reads with cold
+# caches. DEVICE is destroyed. A loop device is enough:
+#
+#   truncate -s 4G /tmp/bench.img
+#   storage-bench.py $(losetup -f --show /tmp/bench.img)
+#
+
+import optparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'hooks'))
+
+import lib._pythonpath
+_ = lib._pythonpath
+
+import lib.storage_profile as storage_profile
+
+MB = 1024 * 1024
+SEGMENT_MB = 128
+READ_SIZE = 16 * 1024
+
+# name: (filesystem, mkfs options, mount options)
+CANDIDATES = {
+    'ext4-default': ('ext4', [], 'defaults'),
+    'ext4-solr': ('ext4', storage_profile.MKFS_OPTIONS['ext4'], 'noatime'),
+    'xfs-default': ('xfs', [], 'defaults'),
+    'xfs-solr': ('xfs', storage_profile.MKFS_OPTIONS['xfs'], 'noatime'),
+}
+
+
+def drop_caches():
+    subprocess.check_call(['sync'])
+    with open('/proc/sys/vm/drop_caches', 'w') as caches:
+        caches.write('3\n')
+
+
+def write_segments(root, count):
+    block = os.urandom(MB)
+    started = time.time()
+    for n in range(count):
+        with open(os.path.join(root, '_%d.cfs' % n), 'wb') as segment:
+            for _ in range(SEGMENT_MB):
+                segment.write(block)
+            segment.flush()
+            os.fsync(segment.fileno())
+    return count * SEGMENT_MB / (time.time() - started)
+
+
+def sequential_read(root, count):
+    drop_caches()
+    started = time.time()
+    for n in range(count):
+        with open(os.path.join(root, '_%d.cfs' % n), 'rb') as segment:
+            while segment.read(MB):
+                pass
+    return count * SEGMENT_MB / (time.time() - started)
+
+
+def random_read(root, count, reads):
+    drop_caches()
+    files = [open(os.path.join(root, '_%d.cfs' % n), 'rb')
+             for n in range(count)]
+    started = time.time()
+    for _ in range(reads):
+        segment = random.choice(files)
+        segment.seek(random.randrange(0, SEGMENT_MB * MB - READ_SIZE))
+        segment.read(READ_SIZE)
+    elapsed = time.time() - started
+    for segment in files:
+        segment.close()
+    return reads / elapsed
+
+
+def run(device, names, count, reads, readahead_kb):
+    mountpoint = tempfile.mkdtemp()
+    if readahead_kb:
+        storage_profile.tune_device(device, readahead_kb=readahead_kb)
+    print '%-14s %8s %10s %10s %10s' % ('profile', 'mkfs s', 'write MB/s',
+                                        'seq MB/s', 'rand IOPS')
+    try:
+        for name in names:
+            fstype, mkfs_options, mount_options = CANDIDATES[name]
+            started = time.time()
+            subprocess.check_call(storage_profile.mkfs_command(device, fstype)
+                                  if mkfs_options else
+                                  ['mkfs', '-t', fstype, device])
+            mkfs_time = time.time() - started
+            subprocess.check_call(['mount', '-o', mount_options, device,
+                                   mountpoint])
+            try:
+                write = write_segments(mountpoint, count)
+                seq = sequential_read(mountpoint, count)
+                rand = random_read(mountpoint, count, reads)
+            finally:
+                subprocess.check_call(['umount', mountpoint])
+            print '%-14s %8.1f %10.1f %10.1f %10.0f' % (name, mkfs_time,
+                                                        write, seq, rand)
+    finally:
+        os.rmdir(mountpoint)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog [options] DEVICE",
+        description="Compare storage profiles for the Solr index. "
+                    "DEVICE is reformatted.")
+    parser.add_option('-p', '--profile', dest='profiles', action='append',
+                      choices=sorted(CANDIDATES),
+                      help="Profile to run (default: all).")
+    parser.add_option('--segments', dest='segments', type='int', default=8,
+                      help="Number of %dMB segment files (default: "
+                           "%%default)." % SEGMENT_MB)
+    parser.add_option('--reads', dest='reads', type='int', default=2000,
+                      help="Random reads (default: %default).")
+    parser.add_option('--readahead-kb', dest='readahead', type='int',
+                      default=0, help="Readahead to set on DEVICE first.")
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("A device is required.")
+    run(args[0], options.profiles or sorted(CANDIDATES), options.segments,
+        options.reads, options.readahead)
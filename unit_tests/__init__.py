@@ -0,0 +1,6 @@
+import os
+import sys
+
+HOOKS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'hooks')
+sys.path.insert(0, HOOKS_DIR)
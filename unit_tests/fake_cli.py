@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+STUB = """#!{python}
+import json
+import os
+import sys
+
+name = os.path.basename(sys.argv[0])
+with open({calls!r}, 'a') as calls:
+    calls.write(json.dumps([name] + sys.argv[1:]) + '\\n')
+with open({responses!r}) as responses:
+    responses = json.load(responses)
+args = ' '.join(sys.argv[1:])
+for pattern, rc, output in responses.get(name, []):
+    if pattern in args:
+        sys.stdout.write(output)
+        sys.exit(rc)
+"""
+
+
+class FakeCLI(object):
+    '''
+    Local stand-ins for command line tools such as ceph, rados and rbd.
+
+    Each stub records its arguments and answers with the output and exit
+    code of the most recently added response whose pattern is contained in
+    its arguments; commands without a matching response succeed silently.
+    '''
+
+    def __init__(self, *commands):
+        self.bin_dir = tempfile.mkdtemp()
+        self.calls_file = os.path.join(self.bin_dir, 'calls')
+        self.responses_file = os.path.join(self.bin_dir, 'responses')
+        self.responses = {}
+        self._save()
+        for command in commands:
+            path = os.path.join(self.bin_dir, command)
+            with open(path, 'w') as stub:
+                stub.write(STUB.format(python=sys.executable,
+                                       calls=self.calls_file,
+                                       responses=self.responses_file))
+            os.chmod(path, 0755)
+        self._path = None
+
+    def _save(self):
+        with open(self.responses_file, 'w') as responses:
+            json.dump(self.responses, responses)
+
+    def respond(self, command, pattern='', output='', rc=0):
+        self.responses.setdefault(command, []).insert(0, [pattern, rc, output])
+        self._save()
+
+    def calls(self, command=None):
+        if not os.path.exists(self.calls_file):
+            return []
+        with open(self.calls_file) as calls:
+            calls = [json.loads(line) for line in calls]
+        return [call for call in calls if command in (None, call[0])]
+
+    def start(self):
+        self._path = os.environ.get('PATH', '')
+        os.environ['PATH'] = '{}:{}'.format(self.bin_dir, self._path)
+
+    def stop(self):
+        os.environ['PATH'] = self._path
+        shutil.rmtree(self.bin_dir)
@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import lib.advertise as advertise
+
+
+class AdvertiseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = advertise.STATE_FILE
+        advertise.STATE_FILE = os.path.join(self.dir, 'lib', 'advertised')
+
+    def tearDown(self):
+        advertise.STATE_FILE = self.saved
+        shutil.rmtree(self.dir)
+
+    def test_only_ready_units_give_their_address(self):
+        self.assertEqual(advertise.settings(advertise.READY, '10.0.0.7',
+                                            8080),
+                         {'hostname': '10.0.0.7', 'port': 8080,
+                          'services': None, 'state': 'ready'})
+        for state in (advertise.STARTING, advertise.DRAINING,
+                      advertise.STOPPED):
+            self.assertEqual(advertise.settings(state, '10.0.0.7', 8080,
+                                                '[]'),
+                             {'hostname': None, 'port': None,
+                              'services': None, 'state': state})
+
+    def test_state(self):
+        self.assertEqual(advertise.load_state(), advertise.STARTING)
+        advertise.save_state(advertise.DRAINING)
+        self.assertEqual(advertise.load_state(), advertise.DRAINING)
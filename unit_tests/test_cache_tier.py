@@ -0,0 +1,156 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.cache_tier as cache_tier
+
+ORIGIN = '/dev/rbd/solr-jetty/solr'
+FAST = '/dev/nvme0n1'
+# 10GB cache device, 100GB origin
+FAST_SECTORS = 20971520
+ORIGIN_SECTORS = 209715200
+
+STATUS = ('0 209715200 cache 8 1234/4096 128 {used}/{total} {read_hits} '
+          '{read_misses} 50 10 0 {used} {dirty} 1 writethrough 2 '
+          'migration_threshold 2048 smq 0 rw -\n')
+
+
+def status(read_hits=300, read_misses=100, used=500, total=163808,
+           dirty=0):
+    return STATUS.format(**locals())
+
+
+class GeometryTest(unittest.TestCase):
+
+    def test_metadata_area(self):
+        meta, data, block = cache_tier.geometry(FAST_SECTORS, 64)
+        self.assertEqual(block, 128)
+        # 4MB + 16 bytes for each of the 163840 blocks
+        self.assertEqual(meta, (4 * 1024 * 1024 + 16 * 163840) / 512)
+        self.assertEqual(data % block, 0)
+        self.assertTrue(meta + data <= FAST_SECTORS)
+
+    def test_too_small(self):
+        self.assertRaises(cache_tier.CacheTierError, cache_tier.geometry,
+                          8192, 64)
+
+
+class CacheTierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('dmsetup', 'blockdev', 'blkid', 'dd', 'juju-log')
+        self.cli.start()
+        self.cli.respond('dmsetup', 'info', '', rc=1)
+        self.cli.respond('blockdev', FAST, str(FAST_SECTORS))
+        self.cli.respond('blockdev', ORIGIN, str(ORIGIN_SECTORS))
+        self.state_dir = tempfile.mkdtemp()
+        self._state_file = cache_tier.STATE_FILE
+        cache_tier.STATE_FILE = os.path.join(self.state_dir, 'cache-tier')
+
+    def tearDown(self):
+        cache_tier.STATE_FILE = self._state_file
+        shutil.rmtree(self.state_dir)
+        self.cli.stop()
+
+    def created(self):
+        return dict((call[2], call[4]) for call in self.cli.calls('dmsetup')
+                    if call[1] == 'create')
+
+    def test_attach(self):
+        path = cache_tier.attach('solr-jetty-0-cache', ORIGIN, FAST)
+        self.assertEqual(path, '/dev/mapper/solr-jetty-0-cache')
+        tables = self.created()
+        meta, data, block = cache_tier.geometry(FAST_SECTORS, 64)
+        self.assertEqual(tables['solr-jetty-0-cache-cmeta'],
+                         '0 {} linear {} 0'.format(meta, FAST))
+        self.assertEqual(tables['solr-jetty-0-cache-cdata'],
+                         '0 {} linear {} {}'.format(data, FAST, meta))
+        self.assertEqual(
+            tables['solr-jetty-0-cache'],
+            '0 {} cache /dev/mapper/solr-jetty-0-cache-cmeta '
+            '/dev/mapper/solr-jetty-0-cache-cdata {} 128 1 writethrough '
+            'default 0'.format(ORIGIN_SECTORS, ORIGIN))
+        # fresh metadata
+        self.assertEqual(len(self.cli.calls('dd')), 1)
+        with open(cache_tier.STATE_FILE) as state:
+            self.assertEqual(json.load(state)['solr-jetty-0-cache']['origin'],
+                             ORIGIN)
+
+    def test_attached_without_dmsetup(self):
+        path = os.environ['PATH']
+        os.environ['PATH'] = self.state_dir
+        try:
+            self.assertFalse(cache_tier.attached('solr-jetty-0-cache'))
+        finally:
+            os.environ['PATH'] = path
+
+    def test_configured(self):
+        self.assertFalse(cache_tier.configured('solr-jetty-0-cache'))
+        cache_tier.attach('solr-jetty-0-cache', ORIGIN, FAST)
+        self.assertTrue(cache_tier.configured('solr-jetty-0-cache'))
+        # the tables are gone after a reboot
+        cache_tier.detach('solr-jetty-0-cache')
+        self.assertFalse(cache_tier.configured('solr-jetty-0-cache'))
+
+    def test_refuses_fast_device_in_use(self):
+        self.cli.respond('blkid', FAST, 'ext4\n')
+        self.assertRaises(cache_tier.CacheTierError, cache_tier.attach,
+                          'solr-jetty-0-cache', ORIGIN, FAST)
+        self.assertEqual(self.created(), {})
+
+    def test_writeback_metadata_is_kept(self):
+        cache_tier.attach('solr-jetty-0-cache', ORIGIN, FAST,
+                          mode='writeback')
+        # after a reboot the tables are gone but the metadata is not
+        os.remove(self.cli.calls_file)
+        self.cli.respond('blkid', FAST, 'unknown\n')
+        cache_tier.attach('solr-jetty-0-cache', ORIGIN, FAST)
+        self.assertEqual(self.cli.calls('dd'), [])
+        self.assertIn(' writeback ', self.created()['solr-jetty-0-cache'])
+
+    def test_writethrough_metadata_is_reset(self):
+        cache_tier.attach('solr-jetty-0-cache', ORIGIN, FAST)
+        os.remove(self.cli.calls_file)
+        cache_tier.attach('solr-jetty-0-cache', ORIGIN, FAST)
+        self.assertEqual(len(self.cli.calls('dd')), 1)
+
+    def test_stats(self):
+        self.cli.respond('dmsetup', 'status', status())
+        counters = cache_tier.stats('solr-jetty-0-cache')
+        self.assertEqual(counters['read_hits'], 300)
+        self.assertEqual(counters['read_misses'], 100)
+        self.assertEqual(counters['read_hit_rate'], 0.75)
+        self.assertEqual(counters['used_blocks'], 500)
+        self.assertEqual(counters['total_blocks'], 163808)
+        self.assertEqual(counters['dirty'], 0)
+
+    def test_detach_clean(self):
+        self.cli.respond('dmsetup', 'info', '')
+        self.cli.respond('dmsetup', 'status', status())
+        cache_tier.detach('solr-jetty-0-cache')
+        removed = [call[2] for call in self.cli.calls('dmsetup')
+                   if call[1] == 'remove']
+        self.assertEqual(removed, ['solr-jetty-0-cache',
+                                   'solr-jetty-0-cache-cdata',
+                                   'solr-jetty-0-cache-cmeta'])
+        self.assertEqual([call for call in self.cli.calls('dmsetup')
+                          if call[1] == 'reload'], [])
+
+    def test_detach_dirty_times_out(self):
+        self.cli.respond('dmsetup', 'info', '')
+        self.cli.respond('dmsetup', 'status', status(dirty=42))
+        self.cli.respond('dmsetup', 'table',
+                         '0 209715200 cache 252:1 252:2 251:0 128 1 '
+                         'writeback default 0\n')
+        self.assertRaises(cache_tier.CacheTierError, cache_tier.detach,
+                          'solr-jetty-0-cache', timeout=-1)
+        reload = [call for call in self.cli.calls('dmsetup')
+                  if call[1] == 'reload'][0]
+        self.assertIn('writeback cleaner 0', reload[-1])
+        # never removed while blocks are dirty
+        self.assertEqual([call for call in self.cli.calls('dmsetup')
+                          if call[1] == 'remove'], [])
@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.capacity as capacity
+
+GB = capacity.GB
+HOUR = 3600
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_growth_rate(self):
+        samples = [[0, 10 * GB], [HOUR, 11 * GB], [2 * HOUR, 12 * GB]]
+        self.assertAlmostEqual(capacity.growth_rate(samples), GB / 3600.0)
+
+    def test_shrinking_is_no_growth(self):
+        samples = [[0, 12 * GB], [HOUR, 10 * GB]]
+        self.assertEqual(capacity.growth_rate(samples), 0.0)
+        self.assertEqual(capacity.growth_rate(samples[:1]), 0.0)
+
+    def test_enough_headroom(self):
+        # 10GB used, 12GB free: a full merge fits
+        self.assertEqual(capacity.plan(22 * GB, 10 * GB, 12 * GB, []), None)
+
+    def test_short_of_merge_headroom(self):
+        # 10GB used needs 10GB free; grow to 20GB plus the margin
+        self.assertEqual(capacity.plan(18 * GB, 10 * GB, 8 * GB, []),
+                         24 * GB)
+
+    def test_projected_growth(self):
+        # 1GB per hour over 24 hours: 34GB projected needs 34GB free too
+        samples = [[0, 9 * GB], [HOUR, 10 * GB]]
+        target = capacity.plan(40 * GB, 10 * GB, 30 * GB, samples)
+        self.assertEqual(target, int(-(-(68 * GB * 1.2) // GB) * GB))
+        self.assertEqual(capacity.plan(40 * GB, 10 * GB, 30 * GB, samples,
+                                       horizon_hours=1), None)
+
+    def test_samples_are_bounded(self):
+        state_dir = tempfile.mkdtemp()
+        path = os.path.join(state_dir, 'capacity')
+        try:
+            for n in range(capacity.SAMPLES_KEPT + 10):
+                samples = capacity.record_sample(n, now=n, path=path)
+            self.assertEqual(len(samples), capacity.SAMPLES_KEPT)
+            self.assertEqual(samples[-1], [capacity.SAMPLES_KEPT + 9] * 2)
+        finally:
+            shutil.rmtree(state_dir)
+
+
+class CheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('rbd', 'blockdev', 'resize2fs', 'xfs_growfs',
+                           'juju-log')
+        self.cli.start()
+        self.state_dir = tempfile.mkdtemp()
+        self._state_file = capacity.STATE_FILE
+        capacity.STATE_FILE = os.path.join(self.state_dir, 'capacity')
+        self._mount_info = capacity.mount_info
+        self._usage = capacity.usage
+        self.device = '/dev/rbd/solr-jetty/solr'
+        capacity.mount_info = lambda mountpoint: (self.device, 'ext4')
+        self.usages = []
+        capacity.usage = lambda mountpoint: self.usages.pop(0)
+
+    def tearDown(self):
+        capacity.STATE_FILE = self._state_file
+        capacity.mount_info = self._mount_info
+        capacity.usage = self._usage
+        shutil.rmtree(self.state_dir)
+        self.cli.stop()
+
+    def check(self, **kwargs):
+        return capacity.check('solr-jetty', 'solr-jetty', 'solr',
+                              '/srv/juju/volumes/solr-jetty-0', **kwargs)
+
+    def test_grows_image_and_filesystem(self):
+        self.usages = [(5 * GB, 4 * GB, 1 * GB), (11 * GB, 4 * GB, 7 * GB)]
+        self.cli.respond('rbd', 'info', json.dumps({'size': 5 * GB + 2 ** 26}))
+        self.cli.respond('blockdev', '--getsize64', str(100 * GB))
+        self.assertEqual(self.check(), 5 * 1024 + 64 + 5 * 1024)
+        self.assertIn(['rbd', 'resize', '--id', 'solr-jetty', '--pool',
+                       'solr-jetty', '--size', str(10 * 1024 + 64), 'solr'],
+                      self.cli.calls('rbd'))
+        self.assertEqual(self.cli.calls('resize2fs'),
+                         [['resize2fs', self.device]])
+
+    def test_limited_by_max_size(self):
+        self.usages = [(5 * GB, 4 * GB, 1 * GB)]
+        self.assertEqual(self.check(max_gb=5), None)
+        self.assertEqual([call for call in self.cli.calls('rbd')
+                          if 'resize' in call], [])
+
+    def test_filesystem_not_grown_before_device(self):
+        self.usages = [(5 * GB, 4 * GB, 1 * GB)]
+        self.cli.respond('rbd', 'info', json.dumps({'size': 5 * GB}))
+        self.cli.respond('blockdev', '--getsize64', str(5 * GB))
+        self._wait = capacity.DEVICE_WAIT
+        try:
+            capacity.DEVICE_WAIT = 0
+            self.assertEqual(self.check(), None)
+        finally:
+            capacity.DEVICE_WAIT = self._wait
+        self.assertEqual(self.cli.calls('resize2fs'), [])
+
+    def test_not_on_the_image(self):
+        self.device = '/dev/mapper/solr-jetty-0-cache'
+        self.assertEqual(self.check(), None)
+        self.assertEqual(self.cli.calls('rbd'), [])
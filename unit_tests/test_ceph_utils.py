@@ -0,0 +1,319 @@
+import json
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.ceph_utils as ceph_utils
+
+
+class PGCountTest(unittest.TestCase):
+
+    def test_power_of_two(self):
+        for osds in range(1, 200):
+            pgnum = ceph_utils.pg_count(osds, 3)
+            self.assertEqual(pgnum & (pgnum - 1), 0)
+
+    def test_rounds_to_nearest_power_of_two(self):
+        # 10 OSDs * 100 / 3 replicas = 333: 256 is within 25%
+        self.assertEqual(ceph_utils.pg_count(10, 3), 256)
+        # 12 OSDs * 100 / 3 replicas = 400: 256 undershoots by more
+        self.assertEqual(ceph_utils.pg_count(12, 3), 512)
+        # 6 OSDs * 100 / 3 replicas = 200: 128 undershoots by more
+        self.assertEqual(ceph_utils.pg_count(6, 3), 256)
+        # 40 OSDs * 100 / 3 replicas = 1333: 1024 is within 25%
+        self.assertEqual(ceph_utils.pg_count(40, 3), 1024)
+
+    def test_data_share(self):
+        self.assertEqual(ceph_utils.pg_count(40, 3, data_share=0.2), 256)
+        self.assertEqual(ceph_utils.pg_count(40, 3, data_share=0.05), 64)
+
+    def test_minimum(self):
+        self.assertEqual(ceph_utils.pg_count(1, 3, data_share=0.01),
+                         ceph_utils.MIN_PG_NUM)
+
+    def test_check_over_provisioned(self):
+        self.assertIn('over-provisioned',
+                      ceph_utils.check_pg_count(1024, 3, 3))
+
+    def test_check_under_provisioned(self):
+        self.assertIn('under-provisioned',
+                      ceph_utils.check_pg_count(8, 100, 3))
+
+    def test_check_ok(self):
+        self.assertEqual(ceph_utils.check_pg_count(512, 10, 3), None)
+
+
+class KrbdLayoutTest(unittest.TestCase):
+
+    def test_default_striping(self):
+        self.assertTrue(ceph_utils.krbd_mappable(22, 0, 0))
+        self.assertTrue(ceph_utils.krbd_mappable(None, None, None))
+        self.assertTrue(ceph_utils.krbd_mappable(23, 2 ** 23, 1))
+        self.assertTrue(ceph_utils.krbd_mappable(22, 0, 1))
+
+    def test_fancy_striping(self):
+        self.assertFalse(ceph_utils.krbd_mappable(22, 65536, 16))
+        self.assertFalse(ceph_utils.krbd_mappable(22, 0, 4))
+        self.assertFalse(ceph_utils.krbd_mappable(23, 2 ** 22, 1))
+
+
+class CreatePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('ceph', 'rados', 'juju-log')
+        self.cli.start()
+        self.cli.respond('rados', 'lspools', 'rbd\n')
+
+    def tearDown(self):
+        self.cli.stop()
+
+    def created_pool(self):
+        for call in self.cli.calls('ceph'):
+            if call[3:6] == ['osd', 'pool', 'create']:
+                return call[6], int(call[7]), int(call[8])
+
+    def warnings(self):
+        return [call[-1] for call in self.cli.calls('juju-log')
+                if 'WARNING' in call]
+
+    def test_sized_from_osd_count(self):
+        self.cli.respond('ceph', '-v', 'ceph version 0.80.9 (abcdef)\n')
+        self.cli.respond('ceph', 'osd ls', json.dumps(range(10)))
+        ceph_utils.create_pool('solr-jetty', 'solr-jetty', replicas=3,
+                               data_share=0.5)
+        self.assertEqual(self.created_pool(), ('solr-jetty', 128, 128))
+        self.assertIn(['ceph', '--id', 'solr-jetty', 'osd', 'pool', 'set',
+                       'solr-jetty', 'size', '3'], self.cli.calls('ceph'))
+        self.assertEqual(self.warnings(), [])
+
+    def test_old_ceph_uses_osd_stat(self):
+        self.cli.respond('ceph', '-v', 'ceph version 0.48.3 (abcdef)\n')
+        self.cli.respond('ceph', 'osd stat', 'e12: 6 osds: 6 up, 6 in\n')
+        ceph_utils.create_pool('solr-jetty', 'solr-jetty', replicas=3)
+        self.assertEqual(self.created_pool(), ('solr-jetty', 256, 256))
+
+    def test_unknown_osd_count(self):
+        self.cli.respond('ceph', '-v', 'ceph version 0.48.3 (abcdef)\n')
+        self.cli.respond('ceph', 'osd stat', '', rc=1)
+        ceph_utils.create_pool('solr-jetty', 'solr-jetty', replicas=3)
+        self.assertEqual(self.created_pool(),
+                         ('solr-jetty', ceph_utils.DEFAULT_PG_NUM,
+                          ceph_utils.DEFAULT_PG_NUM))
+        self.assertEqual(len(self.warnings()), 1)
+
+    def test_warns_when_under_provisioned(self):
+        self.cli.respond('ceph', '-v', 'ceph version 0.80.9 (abcdef)\n')
+        self.cli.respond('ceph', 'osd ls', json.dumps(range(100)))
+        ceph_utils.create_pool('solr-jetty', 'solr-jetty', replicas=3,
+                               data_share=0.01)
+        self.assertEqual(self.created_pool(), ('solr-jetty', 32, 32))
+        self.assertIn('under-provisioned', self.warnings()[0])
+
+    def test_existing_pool_is_skipped(self):
+        self.cli.respond('rados', 'lspools', 'rbd\nsolr-jetty\n')
+        ceph_utils.create_pool('solr-jetty', 'solr-jetty')
+        self.assertEqual(self.created_pool(), None)
+
+
+class CephStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('ceph', 'rbd')
+        self.cli.start()
+
+    def tearDown(self):
+        self.cli.stop()
+
+    def test_json_snapshot(self):
+        self.cli.respond('ceph', 'lspools', json.dumps(
+            [{'poolnum': 0, 'poolname': 'rbd'},
+             {'poolnum': 1, 'poolname': 'solr2'}]))
+        self.cli.respond('rbd', 'ls', json.dumps(['solr2']))
+        self.cli.respond('rbd', 'showmapped', json.dumps(
+            {'0': {'pool': 'solr2', 'name': 'solr2', 'snap': '-',
+                   'device': '/dev/rbd0'}}))
+        state = ceph_utils.CephState('solr-jetty', 'solr')
+        self.assertFalse(state.pool_exists('solr'))
+        self.assertTrue(state.pool_exists('solr2'))
+        self.assertFalse(state.image_exists('solr', 'solr'))
+        self.assertTrue(state.image_exists('solr', 'solr2'))
+        self.assertFalse(state.image_mapped('solr', 'solr'))
+        self.assertEqual(state.mapped_device('solr2', 'solr2'), '/dev/rbd0')
+        self.assertEqual(len(self.cli.calls()), 3)
+
+    def test_plain_text_fallback(self):
+        self.cli.respond('rbd', 'ls', 'solr2\n')
+        self.cli.respond('rbd', 'ls --id solr-jetty --pool solr --format',
+                         'unrecognized option', rc=1)
+        self.cli.respond('rbd', 'showmapped',
+                         'id pool image snap device\n'
+                         '0  solr solr  -    /dev/rbd0\n')
+        self.cli.respond('rbd', 'showmapped --format', 'bad option', rc=1)
+        state = ceph_utils.CephState('solr-jetty', 'solr')
+        self.assertFalse(state.image_exists('solr', 'solr'))
+        self.assertTrue(state.image_exists('solr', 'solr2'))
+        self.assertEqual(state.mapped_device('solr', 'solr'), '/dev/rbd0')
+
+    def test_mounted_is_exact(self):
+        state = ceph_utils.CephState('solr-jetty', 'solr')
+        state.mounts = set(['/srv/juju/volumes/solr-jetty-10'])
+        self.assertFalse(state.mounted('/srv/juju/volumes/solr-jetty-1'))
+        self.assertTrue(state.mounted('/srv/juju/volumes/solr-jetty-10/'))
+
+
+RULES = [{'rule_id': 0, 'rule_name': 'replicated_rule', 'ruleset': 0},
+         {'rule_id': 1, 'rule_name': 'replicated_ssd', 'ruleset': 1}]
+
+
+def osd_dump(crush_rule=0, read_tier=-1, cache_mode='none'):
+    pools = [{'pool': 1, 'pool_name': 'solr-jetty', 'crush_rule': crush_rule,
+              'read_tier': read_tier, 'write_tier': read_tier,
+              'cache_mode': 'none'}]
+    if read_tier >= 0:
+        pools.append({'pool': read_tier, 'pool_name': 'solr-jetty-cache',
+                      'crush_rule': 1, 'read_tier': -1, 'write_tier': -1,
+                      'cache_mode': cache_mode, 'tier_of': 1})
+    return json.dumps({'epoch': 42, 'pools': pools})
+
+
+class PoolReady(Exception):
+    pass
+
+
+class PlacementTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('ceph', 'rados', 'juju-log')
+        self.cli.start()
+        self.cli.respond('ceph', '-v', 'ceph version 12.2.13 (abcdef)\n')
+        self.cli.respond('ceph', 'osd ls', json.dumps(range(10)))
+        self.cli.respond('ceph', 'rule dump', json.dumps(RULES[:1]))
+        self.state = ceph_utils.CephState.__new__(ceph_utils.CephState)
+        self.state.pools = set()
+        self.state.osd_dump = None
+        self.state.crush_rules = {}
+
+    def tearDown(self):
+        self.cli.stop()
+
+    def ceph(self, *args):
+        return [call[3:] for call in self.cli.calls('ceph')
+                if call[3:3 + len(args)] == list(args)]
+
+    def warnings(self):
+        return [call[-1] for call in self.cli.calls('juju-log')
+                if 'WARNING' in call]
+
+    def ensure_pool(self, **placement):
+        def pool_ready(pool, image):
+            # stop once the pool is in place
+            raise PoolReady()
+        self.state.image_exists = pool_ready
+        try:
+            ceph_utils.ensure_ceph_storage(
+                'solr-jetty', 'solr-jetty', 'solr', 5120, '/srv/x',
+                '/dev/rbd/solr-jetty/solr', 'ext4', state=self.state,
+                rbd_pool_replicas=3, rbd_placement=placement)
+        except PoolReady:
+            pass
+
+    def test_device_class(self):
+        self.ensure_pool(device_class='ssd')
+        self.assertEqual(self.ceph('osd', 'crush', 'rule',
+                                   'create-replicated'),
+                         [['osd', 'crush', 'rule', 'create-replicated',
+                           'replicated_ssd', 'default', 'host', 'ssd']])
+        create = self.ceph('osd', 'pool', 'create')[0]
+        self.assertEqual(create[3], 'solr-jetty')
+        self.assertEqual(create[-2:], ['replicated', 'replicated_ssd'])
+
+    def test_existing_rule_is_used(self):
+        self.cli.respond('ceph', 'rule dump', json.dumps(RULES))
+        self.ensure_pool(device_class='ssd')
+        self.assertEqual(self.ceph('osd', 'crush', 'rule',
+                                   'create-replicated'), [])
+
+    def test_device_class_needs_luminous(self):
+        self.cli.respond('ceph', '-v', 'ceph version 10.2.11 (abcdef)\n')
+        self.assertRaises(ceph_utils.PlacementError, self.ensure_pool,
+                          device_class='ssd')
+        self.assertEqual(self.ceph('osd', 'pool', 'create'), [])
+
+    def test_crush_rule(self):
+        self.ensure_pool(crush_rule='fast', device_class='ssd')
+        self.assertEqual(self.ceph('osd', 'crush', 'rule',
+                                   'create-replicated'), [])
+        self.assertEqual(self.ceph('osd', 'pool', 'create')[0][-2:],
+                         ['replicated', 'fast'])
+
+    def test_cache_tier(self):
+        self.ensure_pool(cache_device_class='nvme', cache_mode='writeback',
+                         cache_target_max_bytes=10 * 1024 ** 3)
+        created = [call[3] for call in self.ceph('osd', 'pool', 'create')]
+        self.assertEqual(created, ['solr-jetty', 'solr-jetty-cache'])
+        self.assertEqual(self.ceph('osd', 'pool', 'create')[1][-1],
+                         'replicated_nvme')
+        self.assertEqual(self.ceph('osd', 'tier'), [
+            ['osd', 'tier', 'add', 'solr-jetty', 'solr-jetty-cache'],
+            ['osd', 'tier', 'cache-mode', 'solr-jetty-cache', 'writeback'],
+            ['osd', 'tier', 'set-overlay', 'solr-jetty', 'solr-jetty-cache']])
+        self.assertIn(['osd', 'pool', 'set', 'solr-jetty-cache',
+                       'target_max_bytes', str(10 * 1024 ** 3)],
+                      self.ceph('osd', 'pool', 'set'))
+
+    def test_existing_pool_is_checked(self):
+        self.state.pools = set(['solr-jetty'])
+        self.state.osd_dump = json.loads(osd_dump(crush_rule=0))
+        self.state.crush_rules = {0: 'replicated_rule', 1: 'replicated_ssd'}
+        self.ensure_pool(device_class='ssd', cache_device_class='nvme')
+        self.assertEqual(self.ceph('osd', 'pool', 'create'), [])
+        # from the snapshot
+        self.assertEqual(self.ceph('osd', 'dump'), [])
+        self.assertEqual(len(self.warnings()), 2)
+        self.assertIn('uses CRUSH rule replicated_rule, not replicated_ssd',
+                      self.warnings()[0])
+        self.assertIn('has cache tier None, not solr-jetty-cache',
+                      self.warnings()[1])
+
+    def test_default_placement_is_not_checked(self):
+        self.state.pools = set(['solr-jetty'])
+        self.ensure_pool(cache_mode='writeback',
+                         cache_target_max_bytes=10 * 1024 ** 3)
+        self.assertEqual(self.warnings(), [])
+        self.assertEqual(self.cli.calls('ceph'), [])
+
+    def test_snapshot_with_placement(self):
+        self.cli.respond('ceph', 'lspools', '[]')
+        self.cli.respond('ceph', 'rule dump', json.dumps(RULES))
+        self.cli.respond('ceph', 'osd dump', osd_dump(crush_rule=1))
+        state = ceph_utils.CephState('solr-jetty', 'solr-jetty',
+                                     placement=True)
+        self.assertEqual(state.placement('solr-jetty')['crush_rule'],
+                         'replicated_ssd')
+        self.assertEqual(state.placement('solr'), None)
+        self.assertEqual(ceph_utils.CephState(
+            'solr-jetty', 'solr-jetty').placement('solr-jetty'), None)
+
+    def test_matching_pool(self):
+        self.cli.respond('ceph', 'rule dump', json.dumps(RULES))
+        self.cli.respond('ceph', 'osd dump', osd_dump(
+            crush_rule=1, read_tier=2, cache_mode='writeback'))
+        placement = ceph_utils.pool_placement('solr-jetty', 'solr-jetty')
+        self.assertEqual(ceph_utils.check_placement(
+            placement, 'solr-jetty', 'replicated_ssd', 'solr-jetty-cache'),
+            [])
+        self.assertEqual(ceph_utils.check_placement(
+            placement, 'solr-jetty', cache_pool='solr-jetty-cache',
+            cache_mode='readproxy'),
+            ['cache tier solr-jetty-cache is in writeback mode, not '
+             'readproxy'])
+
+    def test_pre_luminous_ruleset(self):
+        dump = json.loads(osd_dump())
+        del dump['pools'][0]['crush_rule']
+        dump['pools'][0]['crush_ruleset'] = 1
+        self.cli.respond('ceph', 'rule dump', json.dumps(RULES))
+        self.cli.respond('ceph', 'osd dump', json.dumps(dump))
+        self.assertEqual(ceph_utils.pool_placement('solr-jetty',
+                                                   'solr-jetty')['crush_rule'],
+                         'replicated_ssd')
@@ -0,0 +1,46 @@
+import unittest
+
+import lib.compression as compression
+
+WEBDEFAULT = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<web-app xmlns="http://java.sun.com/xml/ns/j2ee" version="2.4">
+  <servlet>
+    <servlet-name>default</servlet-name>
+  </servlet>
+</web-app>
+"""
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_filter_added_before_end(self):
+        rendered = compression.with_filter(WEBDEFAULT, 1024, 'text/xml')
+        self.assertTrue(rendered.rstrip().endswith('</web-app>'))
+        self.assertIn('<filter-class>org.mortbay.servlet.GzipFilter'
+                      '</filter-class>', rendered)
+        self.assertIn('<param-value>1024</param-value>', rendered)
+        self.assertIn('<param-value>text/xml</param-value>', rendered)
+        self.assertTrue(rendered.startswith(WEBDEFAULT[:WEBDEFAULT.index(
+            '</web-app>')]))
+
+    def test_rerendering_replaces_settings(self):
+        rendered = compression.with_filter(WEBDEFAULT, 1024, 'text/xml')
+        again = compression.with_filter(rendered, 4096, '')
+        self.assertEqual(again.count('<filter>'), 1)
+        self.assertIn('<param-value>4096</param-value>', again)
+        self.assertIn(compression.DEFAULT_MIME_TYPES, again)
+        self.assertEqual(compression.with_filter(again, 1024, 'text/xml'),
+                         rendered)
+
+    def test_mime_types(self):
+        self.assertEqual(compression.mime_types(' text/XML, text/plain,,'
+                                                'text/xml '),
+                         'text/xml,text/plain')
+
+    def test_not_a_web_descriptor(self):
+        self.assertRaises(ValueError, compression.with_filter, '<x/>')
+
+    def test_descriptor(self):
+        self.assertEqual(compression.descriptor(True),
+                         'webdefault-solr-jetty.xml')
+        self.assertEqual(compression.descriptor(False), 'webdefault.xml')
@@ -0,0 +1,72 @@
+import unittest
+
+import lib.data_layout as data_layout
+
+SOLR_4 = """<config>
+  <updateHandler class="solr.DirectUpdateHandler2">
+    <updateLog>
+      <str name="dir">${solr.ulog.dir:}</str>
+    </updateLog>
+  </updateHandler>
+</config>
+"""
+
+HARD_CODED = """<config>
+  <updateHandler class="solr.DirectUpdateHandler2">
+    <updateLog class="solr.UpdateLog">
+      <str name="dir">/var/lib/solr/tlog</str>
+      <int name="numRecordsToKeep">100</int>
+    </updateLog>
+  </updateHandler>
+</config>
+"""
+
+SOLR_3 = """<config>
+  <dataDir>/var/lib/solr/data</dataDir>
+  <updateHandler class="solr.DirectUpdateHandler2"/>
+</config>
+"""
+
+
+class DataLayoutTest(unittest.TestCase):
+
+    def test_directories(self):
+        self.assertEqual(data_layout.directory('solr-jetty/0', 'logs', ''),
+                         '/var/log/jetty')
+        self.assertEqual(data_layout.directory('solr-jetty/0', 'tlog', ''),
+                         None)
+        self.assertEqual(data_layout.directory('solr-jetty/0', 'tlog',
+                                               '/dev/vdc'),
+                         '/srv/juju/volumes/solr-jetty-0-tlog')
+        self.assertEqual(data_layout.directory('solr-jetty/0', 'logs',
+                                               '/mnt/logs'), '/mnt/logs')
+
+    def test_stock_update_log_is_unchanged(self):
+        self.assertEqual(data_layout.wire_update_log(SOLR_4), (SOLR_4, True))
+
+    def test_hard_coded_update_log(self):
+        wired, found = data_layout.wire_update_log(HARD_CODED)
+        self.assertTrue(found)
+        self.assertIn('<updateLog class="solr.UpdateLog">', wired)
+        self.assertIn('<str name="dir">${solr.ulog.dir:}</str>', wired)
+        self.assertIn('<int name="numRecordsToKeep">100</int>', wired)
+        self.assertNotIn('/var/lib/solr/tlog', wired)
+
+    def test_empty_update_log(self):
+        wired, found = data_layout.wire_update_log(
+            SOLR_4.replace(SOLR_4[SOLR_4.index('<updateLog>'):
+                                  SOLR_4.index('</updateLog>') + 12],
+                           '<updateLog/>'))
+        self.assertTrue(found)
+        self.assertEqual(data_layout.wire_update_log(wired), (wired, True))
+        self.assertIn('<str name="dir">${solr.ulog.dir:}</str>', wired)
+
+    def test_no_update_log(self):
+        self.assertEqual(data_layout.wire_update_log(SOLR_3), (SOLR_3, False))
+
+    def test_java_options(self):
+        self.assertEqual(data_layout.java_options('/var/log/jetty'),
+                         ['-Djetty.logs=/var/log/jetty',
+                          '-Xloggc:/var/log/jetty/gc.log'])
+        self.assertEqual(data_layout.java_options('/logs', '/tlog')[-1],
+                         '-Dsolr.ulog.dir=/tlog')
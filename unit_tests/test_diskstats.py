@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import lib.diskstats as diskstats
+
+DISKSTATS = """ 252       0 rbd0 1000 10 64000 5000 2000 20 128000 15000 0 9000 20000
+ 253       0 dm-0 1000 0 64000 5100 2000 0 128000 15100 1 9100 20200
+   8      16 sdb 50 0 400 30 10 0 80 10 0 35 40
+"""
+
+COUNTERS = [1000, 10, 64000, 5000, 2000, 20, 128000, 15000, 0, 9000, 20000]
+
+
+class FakeClock(object):
+    '''time.time and time.sleep, without the waiting'''
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class DiskstatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_mount_source(self):
+        mounts = self.write('mounts', '/dev/vda1 / ext4 rw 0 0\n'
+                            '/dev/mapper/x /srv/juju/volumes/solr-jetty-0 '
+                            'ext4 rw 0 0\n'
+                            '/dev/sdc /srv/juju/volumes/solr-jetty-00 '
+                            'ext4 rw 0 0\n')
+        self.assertEqual(diskstats.mount_source(
+            '/srv/juju/volumes/solr-jetty-0/index', mounts), '/dev/mapper/x')
+        self.assertEqual(diskstats.mount_source('/var/lib', mounts),
+                         '/dev/vda1')
+
+    def test_block_devices_through_layers(self):
+        # dm-2 caches dm-1 (an LVM stripe over two disks) on nvme0n1
+        for name, slaves in [('dm-2', ['dm-1', 'nvme0n1']),
+                             ('dm-1', ['sdb', 'sdc']),
+                             ('nvme0n1', []), ('sdb', []), ('sdc', [])]:
+            os.makedirs(os.path.join(self.tmp, name, 'slaves'))
+            for slave in slaves:
+                os.mkdir(os.path.join(self.tmp, name, 'slaves', slave))
+        self.assertEqual(diskstats.block_devices('/dev/dm-2', self.tmp),
+                         ['dm-2', 'dm-1', 'nvme0n1', 'sdb', 'sdc'])
+        self.assertEqual(diskstats.block_devices('tmpfs', self.tmp), [])
+
+    def test_read_diskstats(self):
+        path = self.write('diskstats', DISKSTATS)
+        stats = diskstats.read_diskstats(['rbd0', 'sdb'], path)
+        self.assertEqual(sorted(stats), ['rbd0', 'sdb'])
+        self.assertEqual(stats['rbd0'], COUNTERS)
+
+    def test_derive(self):
+        after = list(COUNTERS)
+        after[diskstats.READS] += 100
+        after[diskstats.WRITES] += 300
+        after[diskstats.SECTORS_READ] += 2000
+        after[diskstats.SECTORS_WRITTEN] += 8000
+        after[diskstats.MS_READING] += 400
+        after[diskstats.MS_WRITING] += 1200
+        after[diskstats.MS_IO] += 5000
+        after[diskstats.MS_WEIGHTED] += 20000
+        rates = diskstats.derive(COUNTERS, after, 10.0)
+        self.assertEqual(rates['r_iops'], 10)
+        self.assertEqual(rates['w_iops'], 30)
+        self.assertEqual(rates['r_kbps'], 100)
+        self.assertEqual(rates['w_kbps'], 400)
+        self.assertEqual(rates['await_ms'], 4)
+        self.assertEqual(rates['util'], 50)
+        self.assertEqual(rates['queue'], 2)
+
+    def test_idle(self):
+        rates = diskstats.derive(COUNTERS, COUNTERS, 10.0)
+        self.assertEqual(rates['await_ms'], 0)
+        self.assertEqual(rates['util'], 0)
+
+    def test_ring_buffer_wraps(self):
+        ring = diskstats.RingBuffer(os.path.join(self.tmp, 'ring'), slots=4)
+        metrics = dict((m, 1.0) for m in diskstats.METRICS)
+        for t in range(1, 7):
+            ring.append([(float(t), 'rbd0', metrics)])
+        records = ring.records()
+        self.assertEqual([r[0] for r in records], [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(records[0][1], 'rbd0')
+        self.assertEqual([r[0] for r in ring.records(since=4.0)], [5.0, 6.0])
+        self.assertEqual(os.path.getsize(ring.path),
+                         diskstats.HEADER.size + 4 * diskstats.RECORD.size)
+
+    def test_summary(self):
+        ring = diskstats.RingBuffer(os.path.join(self.tmp, 'ring'))
+        for t, util in [(1, 20.0), (2, 60.0)]:
+            metrics = dict((m, 0.0) for m in diskstats.METRICS)
+            metrics['util'] = util
+            ring.append([(float(t), 'rbd0', metrics)])
+        self.assertEqual(diskstats.summary(ring.records())['rbd0']['util'],
+                         (40.0, 60.0))
+
+    def test_collector_cron(self):
+        saved = diskstats.CRON_FILE
+        diskstats.CRON_FILE = os.path.join(self.tmp, 'cron')
+        try:
+            diskstats.configure_collector('/charm/scripts/diskstats.py', 55)
+            with open(diskstats.CRON_FILE) as cron:
+                self.assertIn('--interval 55 --duration 55 ', cron.read())
+            # never a single sample within the run
+            self.assertRaises(ValueError, diskstats.configure_collector,
+                              '/charm/scripts/diskstats.py', 60)
+            diskstats.configure_collector('/charm/scripts/diskstats.py', 0)
+            self.assertFalse(os.path.exists(diskstats.CRON_FILE))
+        finally:
+            diskstats.CRON_FILE = saved
+
+    def test_collect_covers_the_time_between_runs(self):
+        clock = FakeClock(1000.0)
+        saved = (diskstats.time, diskstats.data_devices,
+                 diskstats.read_diskstats)
+
+        def read_diskstats(names):
+            # 10 reads a second, and a burst between two runs
+            counters = [0] * 11
+            counters[diskstats.READS] = int(clock.now * 10)
+            if clock.now >= 1055:
+                counters[diskstats.READS] += 600
+            return {'rbd0': counters}
+        diskstats.time = clock
+        diskstats.data_devices = lambda path: ['rbd0']
+        diskstats.read_diskstats = read_diskstats
+        ring = diskstats.RingBuffer(os.path.join(self.tmp, 'ring'))
+        try:
+            for start in (1000.0, 1060.0, 1120.0):
+                clock.now = start
+                diskstats.collect(ring, interval=10,
+                                  duration=diskstats.RUN_SECONDS)
+            records = ring.records()
+            times = [1000.0] + [t for t, _, _ in records]
+            windows = [b - a for a, b in zip(times, times[1:])]
+            self.assertEqual(set(windows), set([10.0]))
+            self.assertEqual(sum(windows), 170.0)
+            # every read is counted, the burst between runs too
+            self.assertEqual(sum(metrics['r_iops'] * window for
+                                 (_, _, metrics), window in zip(records,
+                                                                windows)),
+                             read_diskstats(None)['rbd0'][diskstats.READS] -
+                             10000)
+            # a collector restarted later does not measure from old counters
+            clock.now = 2000.0
+            diskstats.collect(ring, interval=10, duration=20)
+            self.assertEqual([t for t, _, _ in ring.records(since=1170.0)],
+                             [2010.0, 2020.0])
+        finally:
+            (diskstats.time, diskstats.data_devices,
+             diskstats.read_diskstats) = saved
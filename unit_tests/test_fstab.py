@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib.charmhelpers.core.fstab import Fstab
+
+FSTAB = """# /etc/fstab: static file system information.
+LABEL=cloudimg-rootfs / ext4 defaults 0 0
+/dev/vdb /mnt auto defaults,nobootwait 0 2
+"""
+
+
+class FstabTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'fstab')
+        with open(self.path, 'w') as fstab:
+            fstab.write(FSTAB)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def contents(self):
+        with open(self.path) as fstab:
+            return fstab.read()
+
+    def test_add(self):
+        Fstab.add('/dev/rbd/solr-jetty/solr', '/srv/juju/volumes/solr-0',
+                  'ext4', 'defaults,noatime,_netdev', path=self.path)
+        self.assertEqual(self.contents(), FSTAB +
+                         '/dev/rbd/solr-jetty/solr /srv/juju/volumes/solr-0 '
+                         'ext4 defaults,noatime,_netdev 0 0\n')
+
+    def test_add_is_idempotent(self):
+        for _ in range(2):
+            Fstab.add('/dev/vdc', '/srv/juju/volumes/solr-0', 'auto',
+                      path=self.path)
+        self.assertEqual(self.contents().count('/srv/juju/volumes/solr-0'),
+                         1)
+
+    def test_add_replaces_mountpoint(self):
+        Fstab.add('/dev/vdc', '/srv/juju/volumes/solr-0', 'auto',
+                  path=self.path)
+        Fstab.add('/dev/vdd', '/srv/juju/volumes/solr-0', 'auto',
+                  path=self.path)
+        entry = Fstab(self.path).get_entry_by_attr(
+            'mountpoint', '/srv/juju/volumes/solr-0')
+        self.assertEqual(entry.device, '/dev/vdd')
+        self.assertEqual(len(list(Fstab(self.path).entries)), 3)
+
+    def test_remove_by_mountpoint(self):
+        Fstab.add('/dev/vdc', '/srv/juju/volumes/solr-0', 'auto',
+                  path=self.path)
+        self.assertTrue(Fstab.remove_by_mountpoint('/srv/juju/volumes/solr-0',
+                                                   path=self.path))
+        self.assertEqual(self.contents(), FSTAB)
+        self.assertFalse(Fstab.remove_by_mountpoint('/srv/juju/volumes/solr-0',
+                                                    path=self.path))
@@ -0,0 +1,68 @@
+import imp
+import os
+import sys
+import unittest
+from StringIO import StringIO
+
+from unit_tests import HOOKS_DIR
+
+hook_timeline = imp.load_source('hook_timeline', os.path.join(
+    os.path.dirname(HOOKS_DIR), 'scripts', 'hook-timeline.py'))
+
+
+def event(kind, name, started, elapsed, hook=None, rc=None):
+    return {'t': started, 'h': hook or name, 'k': kind, 'n': name,
+            's': elapsed, 'rc': rc}
+
+
+# An earlier deployment's leftovers, then install to the first query
+EVENTS = [
+    event('hook', 'stop', 10.0, 1.0, rc=0),
+    event('hook', 'install', 100.0, 60.0, rc=0),
+    event('cmd', 'apt-get install -y solr-jetty', 101.0, 45.0, 'install',
+          0),
+    event('hook', 'config-changed', 160.0, 20.0, rc=0),
+    event('op', 'render jetty.xml', 161.0, 0.5, 'config-changed'),
+    # asked to start at 175, answered 10s later
+    event('ready', 'jetty', 175.0, 10.0, 'config-changed'),
+    event('hook', 'start', 180.0, 2.0, rc=0),
+    event('ready', 'jetty', 181.0, 1.0, 'start'),
+]
+
+
+class HookTimelineTest(unittest.TestCase):
+
+    def render(self, func, *args):
+        saved, sys.stdout = sys.stdout, StringIO()
+        try:
+            func(*args)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = saved
+
+    def test_lifecycle(self):
+        self.assertEqual([(e['k'], e['n'], e['h'])
+                          for e in hook_timeline.lifecycle(EVENTS)],
+                         [('hook', 'install', 'install'),
+                          ('hook', 'config-changed', 'config-changed'),
+                          ('hook', 'start', 'start'),
+                          ('ready', 'jetty', 'start'),
+                          ('ready', 'jetty', 'config-changed')])
+
+    def test_lifecycle_without_install(self):
+        self.assertEqual(len(hook_timeline.lifecycle(EVENTS[4:])), 3)
+
+    def test_first_query(self):
+        output = self.render(hook_timeline.render_timeline, EVENTS)
+        self.assertIn('install to first query: 82.0s', output)
+        self.assertNotIn('stop', output)
+
+    def test_no_hooks(self):
+        self.assertEqual(self.render(hook_timeline.render_timeline, []),
+                         'No hooks recorded.\n')
+
+    def test_slowest(self):
+        lines = self.render(hook_timeline.render_slowest, EVENTS,
+                            1).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn('apt-get install', lines[-1])
@@ -0,0 +1,62 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from unit_tests import HOOKS_DIR
+
+# Importing a hook library must not cost more than this (in seconds)
+IMPORT_BUDGET = 0.5
+
+# Juju and system tools which must never be run at import time
+FORBIDDEN_TOOLS = ['apt-get', 'unit-get', 'config-get', 'relation-get',
+                   'relation-ids', 'relation-list', 'juju-log', 'ceph',
+                   'rados', 'rbd']
+
+IMPORT_SCRIPT = """
+import time
+started = time.time()
+import {module}
+print(time.time() - started)
+"""
+
+
+class HookLibraryImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bin_dir = tempfile.mkdtemp()
+        self.calls = os.path.join(self.bin_dir, 'calls')
+        for tool in FORBIDDEN_TOOLS:
+            path = os.path.join(self.bin_dir, tool)
+            with open(path, 'w') as stub:
+                stub.write('#!/bin/sh\necho {} >> {}\n'.format(tool,
+                                                               self.calls))
+            os.chmod(path, 0755)
+
+    def tearDown(self):
+        shutil.rmtree(self.bin_dir)
+
+    def import_module(self, module):
+        env = dict(os.environ)
+        env['PATH'] = '{}:{}'.format(self.bin_dir, env.get('PATH', ''))
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT.format(module=module)],
+            cwd=HOOKS_DIR, env=env)
+        return float(output.strip().splitlines()[-1])
+
+    def assert_cheap_import(self, module):
+        elapsed = self.import_module(module)
+        self.assertFalse(os.path.exists(self.calls),
+                         '{} ran commands at import time'.format(module))
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_utils(self):
+        self.assert_cheap_import('lib.utils')
+
+    def test_ceph_utils(self):
+        self.assert_cheap_import('lib.ceph_utils')
+
+    def test_hahelpers_utils(self):
+        self.assert_cheap_import('lib.charmhelpers.contrib.hahelpers.utils')
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.jetty as jetty
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'templates', 'jetty.xml.template')
+
+
+class IndexingConnectorTest(unittest.TestCase):
+
+    def test_disabled(self):
+        values = jetty.indexing_connector(0)
+        self.assertEqual((values['INDEXING-BEGIN'], values['INDEXING-END']),
+                         ('<!--', '-->'))
+        # still a valid port, inside the comment
+        self.assertEqual(values['INDEXING-PORT'], jetty.JETTY_PORT)
+
+    def test_enabled(self):
+        self.assertEqual(jetty.indexing_connector(8983, 40), {
+            'INDEXING-BEGIN': '', 'INDEXING-END': '',
+            'INDEXING-PORT': 8983, 'INDEXING-MAX-THREADS': 40})
+        self.assertEqual(jetty.indexing_connector(
+            8983, 0)['INDEXING-MAX-THREADS'],
+            jetty.DEFAULT_INDEXING_MAX_THREADS)
+
+    def test_template_placeholders(self):
+        with open(TEMPLATE) as template:
+            content = template.read()
+        for key in jetty.indexing_connector(8983):
+            self.assertIn('!{}!'.format(key), content)
+
+    def test_valid_port(self):
+        for port in (0, 1, 8983, 65535):
+            self.assertTrue(jetty.valid_indexing_port(port), port)
+        for port in (-1, jetty.JETTY_PORT, 65536):
+            self.assertFalse(jetty.valid_indexing_port(port), port)
+
+
+class IndexingPortTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('open-port', 'close-port')
+        self.cli.start()
+        self.tmp = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.tmp, 'lib', 'indexing-port')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        self.cli.stop()
+
+    def ports(self):
+        calls = [call[:2] for call in self.cli.calls()]
+        os.remove(self.cli.calls_file)
+        return calls
+
+    def test_open_and_move(self):
+        self.assertTrue(jetty.open_indexing_port(8983, self.state_file))
+        self.assertEqual(self.ports(), [['open-port', '8983/TCP']])
+        # every config-changed opens it again, but it did not change
+        self.assertFalse(jetty.open_indexing_port(8983, self.state_file))
+        self.assertEqual(self.ports(), [['open-port', '8983/TCP']])
+        self.assertTrue(jetty.open_indexing_port(8984, self.state_file))
+        self.assertEqual(self.ports(), [['close-port', '8983/TCP'],
+                                        ['open-port', '8984/TCP']])
+
+    def test_disable(self):
+        jetty.open_indexing_port(8983, self.state_file)
+        self.ports()
+        self.assertTrue(jetty.open_indexing_port(0, self.state_file))
+        self.assertEqual(self.ports(), [['close-port', '8983/TCP']])
+        self.assertFalse(jetty.open_indexing_port(0, self.state_file))
+        self.assertEqual(self.cli.calls(), [])
+
+    def test_first_run_without_connector(self):
+        # the feeders still have to be given the query port
+        self.assertTrue(jetty.open_indexing_port(0, self.state_file))
+        self.assertEqual(self.cli.calls(), [])
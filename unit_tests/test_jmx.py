@@ -0,0 +1,63 @@
+import unittest
+
+import lib.jmx as jmx
+
+POOL = 'org.mortbay.thread:type=queuedthreadpool,id=0'
+
+
+class JmxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = jmx.call
+        self.calls = []
+        self.current = {'minThreads': '10', 'maxThreads': '200'}
+
+        def call(pid, args, **kwargs):
+            self.calls.append(args)
+            old = self.current.get(args[2], '0')
+            if args[0] == 'set':
+                self.current[args[2]] = args[3]
+                return [(POOL, args[2], old, args[3])]
+            return [(POOL, args[2], old, None)]
+        jmx.call = call
+
+    def tearDown(self):
+        jmx.call = self.saved
+
+    def test_changes(self):
+        previous = {'max-threads': 200, 'acceptors': 4}
+        self.assertEqual(jmx.changed(previous, {'max-threads': 300,
+                                                'acceptors': 4}),
+                         ['max-threads'])
+        self.assertTrue(jmx.runtime_only(['max-threads', 'min-threads']))
+        self.assertFalse(jmx.runtime_only(['max-threads', 'acceptors']))
+        self.assertFalse(jmx.runtime_only([]))
+
+    def test_parse(self):
+        self.assertEqual(jmx.parse('%s maxThreads 200 300\nnoise\n' % POOL),
+                         [(POOL, 'maxThreads', '200', '300')])
+        self.assertEqual(jmx.parse('%s maxThreads 200\n' % POOL),
+                         [(POOL, 'maxThreads', '200', None)])
+
+    def test_lowering_sets_minimum_first(self):
+        changes = jmx.resize(1, {'max-threads': 8, 'min-threads': 5})
+        self.assertEqual([attribute for _, attribute, _, _ in changes],
+                         ['minThreads', 'maxThreads'])
+        self.assertEqual(changes[1][2:], ('200', '8'))
+
+    def test_raising_past_maximum_sets_maximum_first(self):
+        changes = jmx.resize(1, {'max-threads': 400, 'min-threads': 250,
+                                 'max-idle-time-ms': 20000})
+        self.assertEqual([attribute for _, attribute, _, _ in changes],
+                         ['maxThreads', 'minThreads', 'maxIdleTime'])
+
+    def test_minimum_above_maximum(self):
+        self.assertRaises(jmx.JmxError, jmx.resize, 1,
+                          {'max-threads': 8, 'min-threads': 10})
+        self.assertEqual(self.calls, [])
+
+    def test_maximum_below_current_minimum(self):
+        self.assertRaises(jmx.JmxError, jmx.resize, 1, {'max-threads': 8})
+        self.assertEqual([args[0] for args in self.calls], ['get'])
+        changes = jmx.resize(1, {'max-threads': 10})
+        self.assertEqual(changes, [(POOL, 'maxThreads', '200', '10')])
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.migrate as migrate
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('juju-log')
+        self.cli.start()
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'solr')
+        self.target = os.path.join(self.tmp, 'volume')
+        os.makedirs(os.path.join(self.source, 'data', 'index'))
+        os.makedirs(os.path.join(self.target, 'lost+found'))
+        self.migration = migrate.Migration(self.source, self.target,
+                                           workers=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        self.cli.stop()
+
+    def write(self, root, rel, content, mtime=None):
+        path = os.path.join(root, 'data', 'index', rel)
+        with open(path, 'w') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def read(self, rel):
+        with open(os.path.join(self.target, 'data', 'index', rel)) as f:
+            return f.read()
+
+    def test_precopy_stops_once_nothing_changed(self):
+        self.write(self.source, '_0.cfs', 'segment 0')
+        self.write(self.source, 'segments_1', 'commit 1')
+        self.migration.precopy(passes=3)
+        self.assertEqual(self.read('_0.cfs'), 'segment 0')
+        self.assertEqual(self.read('segments_1'), 'commit 1')
+        # the second pass found nothing to copy
+        self.assertEqual(len(self.cli.calls('juju-log')), 2)
+        self.assertIn('pass 2: 0 files', self.cli.calls('juju-log')[1][-1])
+
+    def test_precopy_picks_up_changes(self):
+        self.write(self.source, '_0.cfs', 'segment 0')
+        sync = self.migration.sync
+        passes = []
+
+        def indexing(*args, **kwargs):
+            passes.append(sync(*args, **kwargs))
+            if len(passes) == 1:
+                self.write(self.source, '_1.cfs', 'segment 1')
+            return passes[-1]
+        self.migration.sync = indexing
+        self.migration.precopy()
+        self.assertEqual(passes, [(1, 9), (1, 9)])
+        self.assertEqual(self.read('_1.cfs'), 'segment 1')
+
+    def test_since_copies_files_which_look_unchanged(self):
+        # same size and mtime second, so only since tells them apart
+        self.write(self.source, 'segments.gen', 'gen 1', mtime=1000)
+        self.migration.sync()
+        self.write(self.source, 'segments.gen', 'gen 2', mtime=1000)
+        self.assertEqual(self.migration.sync(), (0, 0))
+        self.assertEqual(self.migration.sync(since=1001), (0, 0))
+        self.assertEqual(self.read('segments.gen'), 'gen 1')
+        self.assertEqual(self.migration.sync(since=1000), (1, 5))
+        self.assertEqual(self.read('segments.gen'), 'gen 2')
+
+    def test_cutover_deletes_merged_away_files(self):
+        self.write(self.source, '_0.cfs', 'segment 0')
+        self.write(self.source, '_1.cfs', 'segment 1')
+        os.makedirs(os.path.join(self.source, 'data', 'old'))
+        self.migration.sync()
+        # a merge replaced both segments while the pre-copy ran
+        os.remove(os.path.join(self.source, 'data', 'index', '_0.cfs'))
+        os.remove(os.path.join(self.source, 'data', 'index', '_1.cfs'))
+        os.rmdir(os.path.join(self.source, 'data', 'old'))
+        self.write(self.source, '_2.cfs', 'segment 2')
+        self.assertEqual(self.migration.sync(delete=True, since=0), (1, 9))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.target,
+                                                        'data', 'index'))),
+                         ['_2.cfs'])
+        self.assertEqual(sorted(os.listdir(self.target)),
+                         ['data', 'lost+found'])
+        self.assertEqual(os.listdir(os.path.join(self.target, 'data')),
+                         ['index'])
+
+    def test_migrate(self):
+        self.write(self.source, '_0.cfs', 'segment 0')
+        steps = []
+        migrate.migrate(
+            self.source, self.target, stop=lambda: steps.append('stop'),
+            swap=lambda: steps.append(sorted(os.listdir(os.path.join(
+                self.target, 'data', 'index')))),
+            start=lambda: steps.append('start'))
+        self.assertEqual(steps, ['stop', ['_0.cfs'], 'start'])
+
+    def test_has_data(self):
+        self.assertFalse(migrate.has_data(self.target))
+        self.assertTrue(migrate.has_data(self.source))
+
+
+class SwapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'solr')
+        self.saved = os.path.join(self.tmp, 'solr.charm_saved')
+        self.target = os.path.join(self.tmp, 'volume')
+        os.makedirs(self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_swap(self):
+        os.makedirs(os.path.join(self.source, 'data'))
+        self.assertTrue(migrate.swap_in(self.source, self.saved,
+                                        self.target))
+        self.assertEqual(os.readlink(self.source), self.target)
+        self.assertEqual(os.listdir(self.saved), ['data'])
+
+    def test_empty_source(self):
+        os.makedirs(self.source)
+        self.assertTrue(migrate.swap_in(self.source, self.saved,
+                                        self.target))
+        self.assertEqual(os.readlink(self.source), self.target)
+        self.assertEqual(os.listdir(self.saved), [])
+
+    def test_missing_source(self):
+        self.assertTrue(migrate.swap_in(self.source, self.saved,
+                                        self.target))
+        self.assertEqual(os.readlink(self.source), self.target)
+        self.assertFalse(os.path.exists(self.saved))
+
+    def test_already_migrated(self):
+        os.makedirs(os.path.join(self.saved, 'data'))
+        os.symlink(self.target, self.source)
+        self.assertFalse(migrate.swap_in(self.source, self.saved,
+                                         self.target))
+        self.assertEqual(os.readlink(self.source), self.target)
+        self.assertEqual(os.listdir(self.saved), ['data'])
+
+    def test_saved_copy_is_kept(self):
+        os.makedirs(os.path.join(self.saved, 'data'))
+        os.makedirs(self.source)
+        self.assertRaises(OSError, migrate.swap_in, self.source, self.saved,
+                          self.target)
+        self.assertTrue(os.path.isdir(self.source))
+        self.assertEqual(os.listdir(self.saved), ['data'])
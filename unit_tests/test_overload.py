@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import lib.overload as overload
+
+WEBDEFAULT = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<web-app xmlns="http://java.sun.com/xml/ns/j2ee" version="2.4">
+</web-app>
+"""
+SOLRCONFIG = """<config>
+  <requestHandler name="standard" class="solr.SearchHandler" default="true">
+    <lst name="defaults">
+       <str name="echoParams">explicit</str>
+    </lst>
+  </requestHandler>
+  <requestHandler name="dismax" class="solr.SearchHandler" >
+  </requestHandler>
+  <requestHandler name="/update" class="solr.XmlUpdateRequestHandler" />
+  <requestHandler name="/mlt" class="solr.SearchHandler"/>
+</config>
+"""
+GCUTIL = """  S0     S1     E      O      P     YGC   YGCT  FGC  FGCT    GCT
+  0.00  99.31  38.10  91.52  59.87    41  0.512    3 1.204  1.716
+"""
+
+
+class DescriptorTest(unittest.TestCase):
+
+    def test_qos_filters(self):
+        rendered = overload.with_qos(WEBDEFAULT, 150, 10, 50, 10000)
+        self.assertEqual(rendered.count('org.mortbay.servlet.QoSFilter'), 2)
+        self.assertIn('<url-pattern>/update/*</url-pattern>', rendered)
+        self.assertIn('<param-value>10</param-value>', rendered)
+        self.assertTrue(rendered.rstrip().endswith('</web-app>'))
+        again = overload.with_qos(rendered, 0, 5, 50, 10000)
+        self.assertNotIn('SearchQoS', again)
+        self.assertEqual(again.count('<filter>'), 1)
+        self.assertEqual(overload.with_qos(again, 0, 0, 50, 10000),
+                         WEBDEFAULT)
+
+    def test_time_allowed(self):
+        limited = overload.with_time_allowed(SOLRCONFIG, 2000)
+        self.assertEqual(limited.count('<int name="timeAllowed">2000</int>'),
+                         3)
+        self.assertIn('class="solr.XmlUpdateRequestHandler" />', limited)
+        changed = overload.with_time_allowed(limited, 500)
+        self.assertEqual(changed.count('timeAllowed'), 3)
+        self.assertIn('<str name="echoParams">explicit</str>',
+                      overload.with_time_allowed(changed, 0))
+        self.assertNotIn('timeAllowed',
+                         overload.with_time_allowed(changed, 0))
+        self.assertEqual(overload.with_time_allowed(SOLRCONFIG, 0),
+                         SOLRCONFIG)
+
+
+class BreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = (overload.jvm_pid, overload.old_generation,
+                      overload.open_breaker, overload.close_breaker)
+        self.calls = []
+        self.samples = []
+        overload.jvm_pid = lambda: 1234
+        overload.old_generation = lambda pid: self.samples.pop(0)
+        overload.open_breaker = lambda port: self.calls.append('open')
+        overload.close_breaker = lambda port: self.calls.append('close') or 7
+
+    def tearDown(self):
+        (overload.jvm_pid, overload.old_generation, overload.open_breaker,
+         overload.close_breaker) = self.saved
+        shutil.rmtree(self.dir)
+
+    def test_parse_gcutil(self):
+        self.assertEqual(overload.parse_gcutil(GCUTIL), (91.52, 3))
+
+    def test_trips_after_full_gc_and_resets(self):
+        state = {'tripped': False, 'trips': 0, 'breaker_rejections': 0}
+        # Full before a full GC is normal
+        self.samples = [(95.0, 3), (96.0, 3), (92.0, 4), (80.0, 4),
+                        (40.0, 5)]
+        for _ in range(2):
+            overload.check(state, 8080, 90, 75)
+        self.assertEqual(self.calls, [])
+        overload.check(state, 8080, 90, 75, now=100)
+        self.assertEqual((self.calls, state['tripped'], state['trips'],
+                          state['tripped_at']), (['open'], True, 1, 100))
+        overload.check(state, 8080, 90, 75)
+        self.assertTrue(state['tripped'])
+        overload.check(state, 8080, 90, 75)
+        self.assertEqual((self.calls, state['tripped'],
+                          state['breaker_rejections']),
+                         (['open', 'close'], False, 7))
+
+    def test_disabled_breaker_closes(self):
+        state = {'tripped': True, 'trips': 1, 'breaker_rejections': 1}
+        overload.check(state, 8080, 0, 75)
+        self.assertEqual((self.calls, state['tripped'],
+                          state['breaker_rejections']), (['close'], False, 8))
+
+    def test_counts_qos_rejections(self):
+        log = os.path.join(self.dir, '2026_10_19.request.log')
+        with open(log, 'w') as f:
+            f.write('10.0.0.7 - - [19/Oct/2026:10:15:01 +0000] '
+                    '"GET /solr/select?q=a HTTP/1.1" 503 1400 \n'
+                    '10.0.0.7 - - [19/Oct/2026:10:15:01 +0000] '
+                    '"GET /solr/select?q=b HTTP/1.1" 200 1400 \n'
+                    '10.0.0.7 - - [19/Oct/2026:10:15:01 +0000] "GET')
+        state = {'tripped': False}
+        overload.check(state, 8080, 0, 75, request_log=log)
+        overload.check(state, 8080, 0, 75, request_log=log)
+        self.assertEqual(state['qos_rejections'], 1)
+        with open(log, 'a') as f:
+            f.write(' /solr/select?q=c HTTP/1.1" 503 1400 \n')
+        overload.check(state, 8080, 0, 75, request_log=log)
+        self.assertEqual(state['qos_rejections'], 2)
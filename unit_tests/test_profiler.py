@@ -0,0 +1,95 @@
+import commands
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.profiler as profiler
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('ceph', 'juju-log')
+        self.cli.start()
+        self.cli.respond('ceph', 'health', 'HEALTH_OK\n')
+        self.cli.respond('ceph', 'broken', rc=2)
+        self.tmp = tempfile.mkdtemp()
+        self.devnull = open(os.devnull, 'w')
+        del profiler._events[:]
+        self.call = subprocess.call
+        profiler.install('config-changed')
+
+    def tearDown(self):
+        profiler.uninstall()
+        del profiler._events[:]
+        self.devnull.close()
+        shutil.rmtree(self.tmp)
+        self.cli.stop()
+
+    def test_records_exit_codes(self):
+        subprocess.call(['ceph', 'health'], stdout=self.devnull)
+        self.assertRaises(subprocess.CalledProcessError,
+                          subprocess.check_call, ['ceph', 'broken'])
+        self.assertEqual(subprocess.check_output(['ceph', 'health']),
+                         'HEALTH_OK\n')
+        commands.getstatusoutput('ceph broken')
+        self.assertEqual([(e['h'], e['k'], e['n'], e['rc'])
+                          for e in profiler._events],
+                         [('config-changed', 'cmd', 'ceph health', 0),
+                          ('config-changed', 'cmd', 'ceph broken', 2),
+                          ('config-changed', 'cmd', 'ceph health', 0),
+                          ('config-changed', 'cmd', 'ceph broken', 2)])
+
+    def test_missing_command(self):
+        self.assertRaises(OSError, subprocess.call, ['no-such-command'])
+        self.assertEqual(profiler._events[0]['rc'], 127)
+
+    def test_records_outermost_call_only(self):
+        # check_call runs call, which is wrapped too
+        subprocess.check_call(['ceph', 'health'], stdout=self.devnull)
+        self.assertEqual([e['n'] for e in profiler._events], ['ceph health'])
+        self.assertFalse(profiler._local.active)
+
+    def test_ignored_commands(self):
+        subprocess.call(['juju-log', 'hello'])
+        self.assertEqual(profiler._events, [])
+
+    def test_durations(self):
+        subprocess.call(['sleep', '0.2'])
+        with profiler.timed('render'):
+            pass
+        sleep, render = profiler._events
+        self.assertTrue(0.2 <= sleep['s'] < 2, sleep)
+        self.assertEqual((render['k'], render['n'], render['rc']),
+                         ('op', 'render', None))
+        self.assertTrue(render['s'] < sleep['s'])
+
+    def test_uninstall(self):
+        profiler.uninstall()
+        subprocess.call(['ceph', 'health'], stdout=self.devnull)
+        self.assertEqual(profiler._events, [])
+        self.assertIs(subprocess.call, self.call)
+
+    def test_flush_and_load(self):
+        path = os.path.join(self.tmp, 'lib', 'timeline')
+        profiler.record(profiler.HOOK, 'install', 100.0, 12.5, 0)
+        profiler.flush(path)
+        self.assertEqual(profiler._events, [])
+        profiler.record(profiler.READY, 'jetty', 112.0, 3.25)
+        profiler.flush(path)
+        with open(path, 'a') as timeline:
+            # interrupted while writing
+            timeline.write('{"t": 120.0, "h"')
+        self.assertEqual(profiler.load(path), [
+            {'t': 100.0, 'h': 'config-changed', 'k': 'hook', 'n': 'install',
+             's': 12.5, 'rc': 0},
+            {'t': 112.0, 'h': 'config-changed', 'k': 'ready', 'n': 'jetty',
+             's': 3.25, 'rc': None}])
+
+    def test_load_missing(self):
+        self.assertEqual(profiler.load(os.path.join(self.tmp, 'missing')),
+                         [])
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.ramdisk as ramdisk
+
+
+class RamdiskTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('juju-log')
+        self.cli.start()
+        self.tmp = tempfile.mkdtemp()
+        self.tmpfs = os.path.join(self.tmp, 'tmpfs')
+        self.store = os.path.join(self.tmp, 'store')
+        os.makedirs(os.path.join(self.tmpfs, 'data', 'index'))
+        os.makedirs(self.store)
+        self._saved = (ramdisk.STATE_FILE, ramdisk.RESTORED_FILE,
+                       ramdisk.LOCAL_STORE, ramdisk.restored)
+        ramdisk.STATE_FILE = os.path.join(self.tmp, 'state')
+        ramdisk.RESTORED_FILE = os.path.join(self.tmp, 'restored')
+        ramdisk.LOCAL_STORE = self.store
+        ramdisk.restored = lambda path: path == self.tmpfs
+
+    def tearDown(self):
+        (ramdisk.STATE_FILE, ramdisk.RESTORED_FILE, ramdisk.LOCAL_STORE,
+         ramdisk.restored) = self._saved
+        shutil.rmtree(self.tmp)
+        self.cli.stop()
+
+    def write(self, rel, content='x', root=None):
+        with open(os.path.join(root or self.tmpfs, 'data', 'index', rel),
+                  'w') as f:
+            f.write(content)
+
+    def index(self, root):
+        return sorted(os.listdir(os.path.join(root, 'data', 'index')))
+
+    def commit(self, segments, generation):
+        for name in segments:
+            self.write(name, name)
+        self.write('segments_{}'.format(generation), ' '.join(segments))
+        self.write('segments.gen', str(generation))
+
+    def copies(self):
+        copied = []
+        copy = ramdisk._copy
+
+        def recording(src, dst, st):
+            copied.append(os.path.relpath(dst, self.store))
+            return copy(src, dst, st)
+        ramdisk._copy = recording
+        self.addCleanup(setattr, ramdisk, '_copy', copy)
+        return copied
+
+    def test_commit_point_copied_last(self):
+        self.commit(['_0.cfs', '_1.cfs'], 2)
+        self.write('write.lock')
+        copied = self.copies()
+        self.assertEqual(ramdisk.checkpoint(self.tmpfs, self.store)[0], 4)
+        self.assertEqual([os.path.basename(rel) for rel in copied],
+                         ['_0.cfs', '_1.cfs', 'segments_2', 'segments.gen'])
+        self.assertEqual(self.index(self.store), ['_0.cfs', '_1.cfs',
+                                                  'segments.gen',
+                                                  'segments_2'])
+
+    def test_incremental(self):
+        self.commit(['_0.cfs'], 1)
+        ramdisk.checkpoint(self.tmpfs, self.store)
+        self.assertEqual(ramdisk.checkpoint(self.tmpfs, self.store), (0, 0))
+        # a merge replaces _0 with _1; segments.gen keeps its size
+        os.remove(os.path.join(self.tmpfs, 'data', 'index', '_0.cfs'))
+        os.remove(os.path.join(self.tmpfs, 'data', 'index', 'segments_1'))
+        self.commit(['_1.cfs'], 2)
+        copied = self.copies()
+        ramdisk.checkpoint(self.tmpfs, self.store)
+        self.assertEqual([os.path.basename(rel) for rel in copied],
+                         ['_1.cfs', 'segments_2', 'segments.gen'])
+        self.assertEqual(self.index(self.store), ['_1.cfs', 'segments.gen',
+                                                  'segments_2'])
+
+    def test_aborted_checkpoint_keeps_last_commit(self):
+        self.commit(['_0.cfs'], 1)
+        ramdisk.checkpoint(self.tmpfs, self.store)
+        self.commit(['_1.cfs'], 2)
+        copy = ramdisk._copy
+
+        def merged_away(src, dst, st):
+            if src.endswith('_1.cfs'):
+                os.remove(src)
+            return copy(src, dst, st)
+        ramdisk._copy = merged_away
+        try:
+            self.assertEqual(ramdisk.checkpoint(self.tmpfs, self.store),
+                             None)
+        finally:
+            ramdisk._copy = copy
+        self.assertEqual(self.index(self.store), ['_0.cfs', 'segments.gen',
+                                                  'segments_1'])
+        with open(os.path.join(self.store, 'data', 'index',
+                               'segments.gen')) as gen:
+            self.assertEqual(gen.read(), '1')
+
+    def test_not_restored(self):
+        ramdisk.restored = lambda path: False
+        self.commit(['_0.cfs'], 1)
+        self.assertEqual(ramdisk.checkpoint(self.tmpfs, self.store), None)
+        self.assertEqual(os.listdir(self.store), [])
+
+    def test_due(self):
+        self.commit(['_0.cfs'], 1)
+        self.assertTrue(ramdisk.due(self.tmpfs))
+        ramdisk.checkpoint(self.tmpfs, self.store)
+        started = ramdisk.load_state()['time']
+        self.assertFalse(ramdisk.due(self.tmpfs, now=started + 60))
+        self.assertTrue(ramdisk.due(self.tmpfs, now=started + 300))
+        self.assertFalse(ramdisk.due(self.tmpfs, interval=0,
+                                     now=started + 3600))
+        self.commit(['_1.cfs'], 2)
+        self.assertTrue(ramdisk.due(self.tmpfs, now=started + 60))
+        self.assertFalse(ramdisk.due(self.tmpfs, on_commit=False,
+                                     now=started + 60))
@@ -0,0 +1,142 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import lib.request_log as request_log
+
+NOW = 1792368000  # 2026-10-19 00:00:00 GMT
+DAY = 86400
+
+NCSA = ('10.0.0.7 -  -  [19/Oct/2026:10:15:01 +0000] '
+        '"GET /solr/select?q=memory&rows=10 HTTP/1.1" 200 1234 ')
+EXTENDED = ('10.0.0.7 - - [19/Oct/2026:10:15:01 +0000] '
+            '"GET /solr/select/?rows=10&q=mem%20ory HTTP/1.1" 200 1234 '
+            '"-" "curl/7.22.0" 17')
+SOLR = ('INFO: [] webapp=/solr path=/select params={q=mem+ory&rows=10} '
+        'hits=3 status=0 QTime=4 ')
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_ncsa(self):
+        record = request_log.parse_request(NCSA)
+        self.assertEqual(record['path'], '/solr/select')
+        self.assertEqual(record['query'], 'q=memory&rows=10')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['bytes'], 1234)
+        self.assertEqual(record['latency_ms'], None)
+        self.assertNotIn('agent', record)
+
+    def test_extended_with_latency(self):
+        record = request_log.parse_request(EXTENDED)
+        self.assertEqual(record['latency_ms'], 17)
+        self.assertEqual(record['agent'], 'curl/7.22.0')
+        self.assertEqual(request_log.parse_request('garbage'), None)
+
+    def test_join_with_solr(self):
+        records = [request_log.parse_request(NCSA),
+                   request_log.parse_request(EXTENDED)]
+        entry = request_log.parse_solr(SOLR)
+        self.assertEqual(entry[1:], (4, 3))
+        left = request_log.join(records, [entry])
+        self.assertEqual(left, [])
+        self.assertEqual(records[0]['qtime_ms'], None)
+        self.assertEqual((records[1]['qtime_ms'], records[1]['hits']), (4, 3))
+
+    def test_sampling_keeps_errors(self):
+        ok = {'status': 200}
+        self.assertFalse(request_log.sampled(ok, 0.1, rand=lambda: 0.5))
+        self.assertTrue(request_log.sampled(ok, 0.1, rand=lambda: 0.05))
+        self.assertTrue(request_log.sampled({'status': 503}, 0.1,
+                                            rand=lambda: 0.5))
+
+    def test_jetty_settings(self):
+        settings = request_log.jetty_settings(False, 'json', 30)
+        self.assertEqual(settings['REQUEST-LOG-BEGIN'], '<!--')
+        self.assertEqual(settings['REQUEST-LOG-LATENCY'], 'true')
+        self.assertEqual(request_log.jetty_settings()['REQUEST-LOG-EXTENDED'],
+                         'false')
+
+
+class ProcessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logs = tempfile.mkdtemp()
+        self.state = request_log.load_state(os.path.join(self.logs, 'none'))
+
+    def tearDown(self):
+        shutil.rmtree(self.logs)
+
+    def path(self, name):
+        return os.path.join(self.logs, name)
+
+    def append(self, name, *lines):
+        with open(self.path(name), 'a') as f:
+            for line in lines:
+                f.write(line + '\n')
+
+    def convert(self, now=NOW + 3600, **kwargs):
+        return request_log.convert(self.logs, solr_log=self.path('out.log'),
+                                   state=self.state, now=now, **kwargs)
+
+    def test_converts_new_lines_once(self):
+        self.append('out.log', 'old')
+        self.convert()
+        self.append('out.log', SOLR)
+        self.append('2026_10_19.request.log', EXTENDED, '10.0.0.7 - - [19/')
+        self.assertEqual(self.convert(), 1)
+        self.assertEqual(self.convert(), 0)
+        with open(self.path('2026_10_19.request.json')) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        self.assertEqual((records[0]['latency_ms'], records[0]['qtime_ms'],
+                          records[0]['hits']), (17, 4, 3))
+
+    def test_solr_entries_wait_for_their_request(self):
+        self.append('out.log', '')
+        self.convert()
+        self.append('out.log', SOLR)
+        self.convert()
+        self.state = json.loads(json.dumps(self.state))
+        self.append('2026_10_19.request.log', EXTENDED)
+        self.convert()
+        with open(self.path('2026_10_19.request.json')) as f:
+            self.assertEqual(json.loads(f.read())['qtime_ms'], 4)
+
+    def test_finished_day_is_removed(self):
+        self.append('2026_10_19.request.log', NCSA)
+        self.convert(format='ncsa', sample_rate=0.5, rand=lambda: 0.1)
+        self.append('2026_10_19.request.log', NCSA)
+        self.convert(now=NOW + DAY, format='ncsa', sample_rate=0.5,
+                     rand=lambda: 0.9)
+        self.assertFalse(os.path.exists(self.path('2026_10_19.request.log')))
+        self.assertEqual(self.state['offsets'], {})
+        with open(self.path('2026_10_19.request.sampled.log')) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_untracked_past_days_are_left_alone(self):
+        self.append('2026_10_18.request.log', NCSA)
+        self.convert()
+        self.assertTrue(os.path.exists(self.path('2026_10_18.request.log')))
+        self.assertFalse(os.path.exists(self.path('2026_10_18.request.json')))
+
+    def test_rotate(self):
+        for name in ['2026_07_01.request.log.gz', '2026_10_17.request.log',
+                     '2026_10_18.request.log', '2026_10_19.request.log',
+                     'out.log']:
+            self.append(name, NCSA)
+        request_log.rotate(self.logs, retention_days=90,
+                           converting=set(['2026_10_18.request.log']),
+                           now=NOW + 3600)
+        self.assertEqual(sorted(os.listdir(self.logs)),
+                         ['2026_10_17.request.log.gz',
+                          '2026_10_18.request.log',
+                          '2026_10_19.request.log', 'out.log'])
+        with gzip.open(self.path('2026_10_17.request.log.gz')) as f:
+            self.assertEqual(f.read(), NCSA + '\n')
+        self.assertEqual(request_log.day_of('2026_10_19.request.json'), NOW)
+        self.assertEqual(time.gmtime(NOW)[:3], (2026, 10, 19))
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import lib.overload as overload
+import lib.rolling_restart as rolling_restart
+
+NOW = 1792368000.0
+TCP = """  sl  local_address rem_address   st tx_queue rx_queue tr tm->when
+   0: 00000000:1F90 00000000:0000 0A 00000000:00000000 00:00000000
+   1: 0700000A:1F90 0500000A:D431 01 00000000:00000000 00:00000000
+   2: 0100007F:1F90 0100007F:D432 01 00000000:00000000 00:00000000
+   3: 0700000A:1F91 0600000A:D433 01 00000000:00000000 00:00000000
+   4: 0700000A:1F90 0600000A:D434 06 00000000:00000000 00:00000000
+"""
+V6_ANY = '0' * 32
+V6_LOOPBACK = '0' * 24 + '01000000'
+V4_MAPPED = '0000000000000000FFFF0000'
+TCP6 = ''.join(['  sl  local_address remote_address st\n',
+                '   0: {}:1F90 {}:D435 01\n'.format(V6_ANY, V6_LOOPBACK),
+                '   1: {}0700000A:1F90 {}0500000A:D436 01\n'.format(
+                    V4_MAPPED, V4_MAPPED)])
+
+
+class QueueTest(unittest.TestCase):
+
+    def units(self, **requests):
+        return dict(('solr/{}'.format(name[1:]),
+                     {'restart-request': rolling_restart.token(request),
+                      'restart-done': None}) for name, request in
+                    requests.items())
+
+    def test_queue_order(self):
+        units = self.units(u2=NOW, u10=NOW, u1=NOW + 5)
+        units['solr/3'] = {'restart-request': '1.000',
+                           'restart-done': '1.000'}
+        self.assertEqual(rolling_restart.queue(units),
+                         ['solr/2', 'solr/10', 'solr/1'])
+
+    def test_takes_turns(self):
+        units = self.units(u0=NOW, u1=NOW, u2=NOW)
+        self.assertFalse(rolling_restart.may_restart('solr/0', units, 1,
+                                                     now=NOW + 10))
+        now = NOW + 60
+        self.assertEqual([rolling_restart.may_restart(unit, units, 1,
+                                                      now=now)
+                          for unit in ('solr/0', 'solr/1', 'solr/2')],
+                         [True, False, False])
+        self.assertTrue(rolling_restart.may_restart('solr/1', units, 2,
+                                                    now=now))
+        units['solr/0']['restart-done'] = units['solr/0']['restart-request']
+        self.assertFalse(rolling_restart.may_restart('solr/0', units, 1,
+                                                     now=now))
+        self.assertTrue(rolling_restart.may_restart('solr/1', units, 1,
+                                                    now=now))
+
+
+class DrainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = (overload.open_breaker, overload.close_breaker)
+        self.rules = []
+        overload.open_breaker = lambda port, comment: self.rules.append(
+            (port, comment))
+        overload.close_breaker = lambda port, comment: self.rules.remove(
+            (port, comment))
+
+    def tearDown(self):
+        overload.open_breaker, overload.close_breaker = self.saved
+        shutil.rmtree(self.dir)
+
+    def test_established_from_other_hosts(self):
+        tables = []
+        for name, content in (('tcp', TCP), ('tcp6', TCP6)):
+            tables.append(os.path.join(self.dir, name))
+            with open(tables[-1], 'w') as f:
+                f.write(content)
+        self.assertEqual(rolling_restart.established([8080], tables), 2)
+        self.assertEqual(rolling_restart.established([8080, 8081], tables),
+                         3)
+
+    def test_drain_waits_for_connections(self):
+        counts = [3, 1, 0]
+        clock = [NOW]
+        left = rolling_restart.drain(
+            [8080, 8081], 60, count=lambda ports: counts.pop(0),
+            sleep=lambda seconds: clock.append(clock.pop() + seconds),
+            clock=lambda: clock[0])
+        self.assertEqual((left, clock[0]), (0, NOW + 2))
+        self.assertEqual(self.rules, [(8080, 'solr-jetty-drain'),
+                                      (8081, 'solr-jetty-drain')])
+        rolling_restart.undrain([8080, 8081])
+        self.assertEqual(self.rules, [])
+
+    def test_drain_gives_up(self):
+        clock = [NOW]
+        left = rolling_restart.drain(
+            [8080], 5, count=lambda ports: 2,
+            sleep=lambda seconds: clock.append(clock.pop() + seconds),
+            clock=lambda: clock[0])
+        self.assertEqual((left, clock[0]), (2, NOW + 5))
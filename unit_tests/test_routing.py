@@ -0,0 +1,42 @@
+import json
+import unittest
+
+import lib.routing as routing
+
+
+class RoutingTest(unittest.TestCase):
+
+    def test_service_definition(self):
+        services = json.loads(routing.services('solr-jetty', 'solr-jetty/3',
+                                               '10.0.0.7', 8080))
+        self.assertEqual(len(services), 1)
+        service = services[0]
+        self.assertEqual(service['service_name'], 'solr-jetty')
+        self.assertEqual(service['servers'],
+                         [['solr-jetty-3', '10.0.0.7', 8080,
+                           routing.SERVER_OPTIONS]])
+        self.assertEqual(service['service_options'][:3],
+                         ['balance url_param q check_post',
+                          'hash-type consistent',
+                          'option httpchk GET /solr/select?q=test'])
+
+    def test_default_options_suit_haproxy_1_4(self):
+        # hash-balance-factor needs 1.7 and "balance uri whole" 1.6
+        self.assertEqual(routing.service_options(), [
+            'balance url_param q check_post', 'hash-type consistent',
+            'option httpchk GET /solr/select?q=test', 'option redispatch',
+            'retries 3'])
+
+    def test_bounded_load(self):
+        options = routing.service_options(balance_factor=150)
+        self.assertEqual(options[2], 'hash-balance-factor 150')
+
+    def test_unbounded_whole_uri(self):
+        options = routing.service_options(hash_key='uri', balance_factor=0)
+        self.assertEqual(options[:2], ['balance uri whole',
+                                       'hash-type consistent'])
+        self.assertFalse([option for option in options
+                          if option.startswith('hash-balance-factor')])
+
+    def test_unknown_hash_key(self):
+        self.assertRaises(ValueError, routing.service_options, 'fq')
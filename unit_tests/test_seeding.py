@@ -0,0 +1,113 @@
+import json
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.ceph_utils as ceph_utils
+import lib.seeding as seeding
+
+SNAPSHOTS = [
+    {'id': 4, 'name': 'seed-20261019120000', 'size': 5368709120},
+    {'id': 2, 'name': 'seed-20261019100000', 'size': 5368709120},
+    {'id': 3, 'name': 'manual', 'size': 5368709120},
+    {'id': 5, 'name': 'seed-20261019130000', 'size': 5368709120},
+]
+
+
+class SeedingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('rbd', 'fsfreeze', 'juju-log')
+        self.cli.start()
+        self.cli.respond('rbd', 'snap ls', json.dumps(SNAPSHOTS))
+        self._commit = seeding.solr_commit
+        seeding.solr_commit = lambda: None
+
+    def tearDown(self):
+        seeding.solr_commit = self._commit
+        self.cli.stop()
+
+    def rbd(self, *args):
+        return [call for call in self.cli.calls('rbd')
+                if call[1:1 + len(args)] == list(args)]
+
+    def test_latest_seed(self):
+        self.assertEqual(seeding.latest_seed('solr-jetty', 'solr-jetty',
+                                             'solr'), 'seed-20261019130000')
+
+    def test_no_seed(self):
+        self.cli.respond('rbd', 'snap ls', '[]')
+        self.assertEqual(seeding.latest_seed('solr-jetty', 'solr-jetty',
+                                             'solr'), None)
+
+    def test_snapshot_taken_while_frozen(self):
+        snap = seeding.take_snapshot('solr-jetty', 'solr-jetty', 'solr',
+                                     '/srv/juju/volumes/solr-jetty-0',
+                                     keep=3, now=86400)
+        self.assertEqual(snap, 'seed-19700102000000')
+        calls = self.cli.calls()
+        order = [call[:3] for call in calls
+                 if call[0] == 'fsfreeze' or call[1:3] == ['snap', 'create']]
+        self.assertEqual(order, [['fsfreeze', '--freeze',
+                                  '/srv/juju/volumes/solr-jetty-0'],
+                                 ['rbd', 'snap', 'create'],
+                                 ['fsfreeze', '--unfreeze',
+                                  '/srv/juju/volumes/solr-jetty-0']])
+        self.assertEqual(self.rbd('snap', 'protect')[0][-1],
+                         'solr-jetty/solr@seed-19700102000000')
+
+    def test_unfrozen_when_snapshot_fails(self):
+        self.cli.respond('rbd', 'snap create', '', rc=1)
+        self.assertRaises(Exception, seeding.take_snapshot, 'solr-jetty',
+                          'solr-jetty', 'solr', '/srv/juju/volumes/x')
+        self.assertEqual(self.cli.calls('fsfreeze')[-1][1], '--unfreeze')
+
+    def test_prune_keeps_cloned_snapshots(self):
+        self.cli.respond('rbd', 'children', 'solr-replica/solr-0\n')
+        self.cli.respond('rbd', 'children --id solr-jetty '
+                         'solr-jetty/solr@seed-20261019120000', '')
+        seeding.prune('solr-jetty', 'solr-jetty', 'solr', keep=1)
+        removed = [call[-1] for call in self.rbd('snap', 'rm')]
+        self.assertEqual(removed, ['solr-jetty/solr@seed-20261019120000'])
+
+    def test_image_name(self):
+        self.assertEqual(seeding.image_name('solr', '3'), 'solr')
+        self.assertEqual(seeding.image_name('solr', '3', 'indexer/solr'),
+                         'solr-3')
+        self.assertRaises(ValueError, seeding.parse_source, 'solr')
+
+
+class CloneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('ceph', 'rados', 'rbd', 'blkid', 'udevadm',
+                           'modprobe', 'mkfs', 'juju-log')
+        self.cli.start()
+
+    def tearDown(self):
+        self.cli.stop()
+
+    def test_missing_image_is_cloned(self):
+        state = ceph_utils.CephState('solr-replica', 'solr-replica')
+        state.pools = set(['solr-replica'])
+        state.images = set()
+        state.mapped = {('solr-replica', 'solr-0'): '/dev/rbd0'}
+        state.mounts = set()
+        self.cli.respond('blkid', '', 'ext4\n')
+        self._persist = ceph_utils.persist_rbd_mapping
+        ceph_utils.persist_rbd_mapping = lambda *args: None
+        try:
+            ceph_utils.ensure_ceph_storage(
+                'solr-replica', 'solr-replica', 'solr-0', 5120,
+                '/srv/juju/volumes/solr-replica-0',
+                '/dev/rbd/solr-replica/solr-0', 'ext4', state=state,
+                clone_from=('solr-indexer', 'solr', 'seed-20261019130000'))
+        finally:
+            ceph_utils.persist_rbd_mapping = self._persist
+        rbd = self.cli.calls('rbd')
+        self.assertIn(['rbd', 'clone', '--id', 'solr-replica',
+                       'solr-indexer/solr@seed-20261019130000',
+                       'solr-replica/solr-0'], rbd)
+        self.assertEqual([call for call in rbd if call[1] == 'create'], [])
+        # the clone already holds the index
+        self.assertEqual(self.cli.calls('mkfs'), [])
@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib._pythonpath
+_ = lib._pythonpath
+
+import lib.storage_profile as storage_profile
+
+# the copies of charmhelpers the hook library uses
+hookenv = storage_profile.hookenv
+volumes = storage_profile.volumes
+
+CONFIG = {'volume-filesystem': 'ext4', 'volume-mount-options': 'noatime',
+          'volume-fstrim': True, 'volume-readahead-kb': 4096,
+          'volume-io-scheduler': 'deadline'}
+
+
+class StorageProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('config-get', 'juju-log', 'blkid', 'mkfs')
+        self.cli.start()
+        self.configure()
+        self.tmp = tempfile.mkdtemp()
+        self.dev = os.path.join(self.tmp, 'dev')
+        self.sys_block = os.path.join(self.tmp, 'block')
+        self.sys_class = os.path.join(self.tmp, 'class')
+        os.makedirs(os.path.join(self.dev, 'rbd', 'solr-jetty'))
+        os.makedirs(self.sys_class)
+        for name, parent in (('vdb', None), ('vdb1', 'vdb'),
+                             ('rbd0', None)):
+            device = os.path.join(self.tmp, 'devices', parent or '', name)
+            os.makedirs(device)
+            if parent:
+                open(os.path.join(device, 'partition'), 'w').close()
+            else:
+                os.makedirs(os.path.join(self.sys_block, name, 'queue'))
+                for setting in ('read_ahead_kb', 'scheduler'):
+                    open(os.path.join(self.sys_block, name, 'queue',
+                                      setting), 'w').close()
+            os.symlink(device, os.path.join(self.sys_class, name))
+            open(os.path.join(self.dev, name), 'w').close()
+        # a udev link, as rbd map makes them
+        self.rbd = os.path.join(self.dev, 'rbd', 'solr-jetty', 'solr-0')
+        os.symlink('../../rbd0', self.rbd)
+        self.mountpoint = os.path.join(self.tmp, 'volume')
+        os.makedirs(self.mountpoint)
+        self._saved = (storage_profile.SYS_BLOCK,
+                       storage_profile.SYS_CLASS_BLOCK,
+                       storage_profile.FSTRIM_CRON,
+                       storage_profile.device_for_mount,
+                       volumes.mount_volume, os.environ.get('JUJU_UNIT_NAME'))
+        storage_profile.SYS_BLOCK = self.sys_block
+        storage_profile.SYS_CLASS_BLOCK = self.sys_class
+        storage_profile.FSTRIM_CRON = os.path.join(self.tmp, 'fstrim')
+        self.mounted = {}
+        storage_profile.device_for_mount = self.mounted.get
+        self.mounts = []
+        volumes.mount_volume = self.mounts.append
+        os.environ['JUJU_UNIT_NAME'] = 'solr-jetty/0'
+
+    def tearDown(self):
+        (storage_profile.SYS_BLOCK, storage_profile.SYS_CLASS_BLOCK,
+         storage_profile.FSTRIM_CRON, storage_profile.device_for_mount,
+         volumes.mount_volume, unit) = self._saved
+        if unit is None:
+            del os.environ['JUJU_UNIT_NAME']
+        else:
+            os.environ['JUJU_UNIT_NAME'] = unit
+        hookenv.cache.clear()
+        shutil.rmtree(self.tmp)
+        self.cli.stop()
+
+    def configure(self, **options):
+        config = dict(CONFIG)
+        config.update((key.replace('_', '-'), value)
+                      for key, value in options.items())
+        hookenv.cache.clear()
+        self.cli.respond('config-get', '', json.dumps(config))
+
+    def queue(self, name, setting):
+        with open(os.path.join(self.sys_block, name, 'queue', setting)) as f:
+            return f.read()
+
+    def test_block_device_name(self):
+        self.assertEqual(storage_profile.block_device_name(self.rbd), 'rbd0')
+        self.assertEqual(storage_profile.block_device_name(
+            os.path.join(self.dev, 'vdb1')), 'vdb')
+        self.assertEqual(storage_profile.block_device_name(
+            os.path.join(self.dev, 'vdb')), 'vdb')
+
+    def test_profile(self):
+        self.configure(volume_filesystem='btrfs', volume_mount_options='')
+        settings = storage_profile.profile()
+        self.assertEqual((settings['filesystem'], settings['mount_options']),
+                         ('ext4', 'noatime'))
+        self.assertEqual(self.cli.calls('juju-log')[0][-1],
+                         'Unsupported volume-filesystem btrfs, using ext4')
+
+    def test_tune_device(self):
+        storage_profile.tune_device(os.path.join(self.dev, 'vdb1'),
+                                    readahead_kb=1024, io_scheduler='noop')
+        self.assertEqual(self.queue('vdb', 'read_ahead_kb'), '1024')
+        self.assertEqual(self.queue('vdb', 'scheduler'), 'noop')
+
+    def test_tune_device_without_setting(self):
+        os.remove(os.path.join(self.sys_block, 'rbd0', 'queue',
+                               'scheduler'))
+        storage_profile.tune_device(self.rbd, readahead_kb=1024,
+                                    io_scheduler='noop')
+        self.assertEqual(self.queue('rbd0', 'read_ahead_kb'), '1024')
+        self.assertIn('rbd0 does not support scheduler',
+                      self.cli.calls('juju-log')[-1][-1])
+
+    def test_fstrim_cron(self):
+        storage_profile.configure_fstrim(self.mountpoint, True)
+        with open(storage_profile.FSTRIM_CRON) as cron:
+            minute, entry = cron.read().split(' ', 1)
+        self.assertTrue(0 <= int(minute) < 60)
+        self.assertEqual(entry, '3 * * * root /sbin/fstrim {}\n'.format(
+            self.mountpoint))
+        storage_profile.configure_fstrim(self.mountpoint, False)
+        self.assertFalse(os.path.exists(storage_profile.FSTRIM_CRON))
+        # nothing to remove
+        storage_profile.configure_fstrim(self.mountpoint, False)
+
+    def test_mount_formats_blank_device(self):
+        self.configure(volume_mount_options='noatime,discard')
+        storage_profile.mount_device(self.rbd, self.mountpoint)
+        self.assertEqual(self.cli.calls('mkfs'),
+                         [['mkfs', '-t', 'ext4'] +
+                          storage_profile.MKFS_OPTIONS['ext4'] + [self.rbd]])
+        self.assertEqual(self.mounts, [{
+            'device': self.rbd, 'mountpoint': self.mountpoint,
+            'options': 'noatime,discard'}])
+        self.assertEqual(self.queue('rbd0', 'read_ahead_kb'), '4096')
+        self.assertEqual(self.queue('rbd0', 'scheduler'), 'deadline')
+
+    def test_network_device_options(self):
+        rbd = '/dev/rbd/solr-jetty/solr-0'
+        storage_profile.SYS_CLASS_BLOCK = os.path.join(self.tmp, 'missing')
+        storage_profile.mount_device(rbd, self.mountpoint)
+        self.assertEqual(self.mounts[0]['options'], 'noatime,_netdev')
+
+    def test_mount_skips_mounted_device(self):
+        self.cli.respond('blkid', '', 'ext4\n')
+        # the mountpoint has to be a mount point; / always is
+        self.mounted['/'] = os.path.join(self.dev, 'rbd0')
+        storage_profile.mount_device(self.rbd, '/')
+        self.assertEqual(self.cli.calls('mkfs'), [])
+        self.assertEqual(self.mounts, [])
+        self.assertEqual(self.queue('rbd0', 'read_ahead_kb'), '')
+
+    def test_mount_replaces_other_device(self):
+        self.cli.respond('blkid', '', 'ext4\n')
+        self.mounted['/'] = os.path.join(self.dev, 'vdb')
+        storage_profile.mount_device(self.rbd, '/')
+        self.assertEqual(self.cli.calls('mkfs'), [])
+        self.assertEqual([m['device'] for m in self.mounts], [self.rbd])
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+from unit_tests.fake_cli import FakeCLI
+
+import lib.striping as striping
+
+DEVICES = ['/dev/loop0', '/dev/loop1']
+
+MDADM_DETAIL = """/dev/md/solr-jetty-0:
+        Version : 1.2
+     Raid Level : raid0
+     Array Size : 2093056 (2044.00 MiB 2143.29 MB)
+   Raid Devices : 2
+     Chunk Size : 512K
+
+    Number   Major   Minor   RaidDevice State
+       0       7        0        0      active sync   /dev/loop0
+       1       7        1        1      active sync   /dev/loop1
+"""
+
+
+class LayoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('lvs', 'mdadm')
+        self.cli.start()
+
+    def tearDown(self):
+        self.cli.stop()
+
+    def test_lvm(self):
+        self.cli.respond('lvs', 'solr-jetty-0/data',
+                         '  256.00 /dev/loop0(0),/dev/loop1(0)\n')
+        self.assertEqual(striping.layout('solr-jetty-0', 'lvm'),
+                         (DEVICES, 256))
+
+    def test_md(self):
+        self.cli.respond('mdadm', '--detail', MDADM_DETAIL)
+        self.assertEqual(striping.layout('solr-jetty-0', 'md'),
+                         (DEVICES, 512))
+
+    def test_missing(self):
+        self.cli.respond('lvs', '', '', rc=5)
+        self.cli.respond('mdadm', '', '', rc=1)
+        self.assertEqual(striping.layout('solr-jetty-0', 'lvm'), None)
+        self.assertEqual(striping.layout('solr-jetty-0', 'md'), None)
+
+
+class AssembleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = FakeCLI('blkid', 'which', 'juju-log', 'pvcreate',
+                           'vgcreate', 'lvcreate', 'mdadm',
+                           'update-initramfs')
+        self.cli.start()
+        self.layouts = []
+        self._layout = striping.layout
+        self._mdadm_conf = striping.MDADM_CONF
+        striping.layout = lambda name, method: self.layouts.pop(0)
+        fd, striping.MDADM_CONF = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        striping.layout = self._layout
+        os.remove(striping.MDADM_CONF)
+        striping.MDADM_CONF = self._mdadm_conf
+        self.cli.stop()
+
+    def reported(self):
+        return [call[-1] for call in self.cli.calls('juju-log')
+                if 'stripe' in call[-1]]
+
+    def test_creates_lvm_volume(self):
+        self.layouts = [None, (DEVICES, 128)]
+        path = striping.assemble('solr-jetty-0', DEVICES, 'lvm', 128)
+        self.assertEqual(path, '/dev/solr-jetty-0/data')
+        self.assertEqual(len(self.cli.calls('pvcreate')), 2)
+        self.assertIn(['vgcreate', '--yes', 'solr-jetty-0'] + DEVICES,
+                      self.cli.calls('vgcreate'))
+        lvcreate = self.cli.calls('lvcreate')[0]
+        self.assertIn('--stripes', lvcreate)
+        self.assertEqual(lvcreate[lvcreate.index('--stripes') + 1], '2')
+        self.assertEqual(lvcreate[lvcreate.index('--stripesize') + 1], '128k')
+        self.assertIn('2 devices, 128KB stripe', self.reported()[-1])
+
+    def test_creates_md_volume(self):
+        self.layouts = [None, (DEVICES, 256)]
+        self.cli.respond('mdadm', '--brief',
+                         'ARRAY /dev/md/solr-jetty-0 metadata=1.2\n')
+        path = striping.assemble('solr-jetty-0', DEVICES, 'md')
+        self.assertEqual(path, '/dev/md/solr-jetty-0')
+        create = self.cli.calls('mdadm')[0]
+        self.assertEqual(create[:3], ['mdadm', '--create', path])
+        self.assertIn('--level=0', create)
+        self.assertIn('--chunk=256', create)
+        with open(striping.MDADM_CONF) as conf:
+            self.assertIn('ARRAY /dev/md/solr-jetty-0', conf.read())
+        self.assertEqual(len(self.cli.calls('update-initramfs')), 1)
+
+    def test_refuses_devices_in_use(self):
+        self.layouts = [None]
+        self.cli.respond('blkid', '/dev/loop1', 'ext4\n')
+        self.assertRaises(striping.StripingError, striping.assemble,
+                          'solr-jetty-0', DEVICES)
+        self.assertEqual(self.cli.calls('pvcreate'), [])
+
+    def test_reuses_existing_volume(self):
+        self.layouts = [(DEVICES, 256)]
+        path = striping.assemble('solr-jetty-0', DEVICES)
+        self.assertEqual(path, '/dev/solr-jetty-0/data')
+        self.assertEqual(self.cli.calls('blkid'), [])
+        self.assertEqual(self.cli.calls('lvcreate'), [])
+
+    def test_warns_about_changed_devices(self):
+        self.layouts = [(DEVICES, 256)]
+        striping.assemble('solr-jetty-0', DEVICES + ['/dev/loop2'])
+        warnings = [call for call in self.cli.calls('juju-log')
+                    if 'WARNING' in call]
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(self.cli.calls('lvcreate'), [])
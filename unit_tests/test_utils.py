@@ -0,0 +1,21 @@
+import unittest
+
+import lib.utils as utils
+
+
+class CronScheduleTest(unittest.TestCase):
+
+    def test_minutes(self):
+        self.assertEqual(utils.cron_schedule(1), '*/1 * * * *')
+        self.assertEqual(utils.cron_schedule(15), '*/15 * * * *')
+
+    def test_hours(self):
+        self.assertEqual(utils.cron_schedule(60), '0 */1 * * *')
+        self.assertEqual(utils.cron_schedule(360), '0 */6 * * *')
+        self.assertEqual(utils.cron_schedule(1440), '0 */24 * * *')
+
+    def test_partial_hours(self):
+        # would have run every hour
+        self.assertRaises(ValueError, utils.cron_schedule, 90)
+        self.assertRaises(ValueError, utils.cron_schedule, 2880)
+        self.assertRaises(ValueError, utils.cron_schedule, -5)